@@ -1,39 +1,388 @@
-from fastapi import APIRouter, Depends, HTTPException
+import base64
+import json
+import logging
+import sys
+from datetime import datetime
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response
+from pydantic import BaseModel, ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List
+from sqlalchemy import String, select, insert, update, delete, and_, tuple_, type_coerce
+from sqlalchemy.exc import IntegrityError
+from typing import Any, Dict, List, Optional, Tuple, Type
 
-from app.db.db import get_session
+from app.cache.cache import cache, ITEMS
+from app.config import settings
+from app.db.db import get_session, get_read_session
 from app.models.models import WeatherItem
 from app.models.schemas import (
     WeatherBase, 
     WeatherUpdate, 
-    WeatherResponse
+    WeatherResponse,
+    BulkItemUpdate,
+    BulkDelete,
+    BulkError,
+    BulkResult
 )
 from app.nats.client import NATSService
+from app.utils import chunked
 from app.ws.websocket import manager
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/items", tags=["items"])
 
-@router.get("/", response_model=List[WeatherResponse])
+ITEM_COLUMNS = [
+    WeatherItem.id,
+    WeatherItem.location,
+    WeatherItem.temperature,
+    WeatherItem.humidity,
+    WeatherItem.wind_speed,
+    WeatherItem.timestamp,
+]
+ITEM_FIELDS = {column.key: column for column in ITEM_COLUMNS}
+DEFAULT_FIELDS = ("id", "location", "temperature", "humidity", "wind_speed")
+
+
+def _row_to_dict(row) -> Dict[str, Any]:
+    data = dict(row._mapping)
+    if data.get("timestamp") is not None:
+        data["timestamp"] = data["timestamp"].isoformat()
+    return data
+
+
+def _check_bulk_size(count: int):
+    if count > settings.BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many rows: {count} > {settings.BULK_MAX_ROWS}"
+        )
+
+
+def _validate_rows(
+    rows: List[Dict[str, Any]],
+    model: Type[BaseModel],
+) -> Tuple[List[Tuple[int, BaseModel]], List[BulkError]]:
+    valid, errors = [], []
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, model(**row)))
+        except ValidationError as e:
+            detail = "; ".join(
+                f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()
+            )
+            # id берём только корректный: иначе упадёт и сама ошибка
+            row_id = row.get("id")
+            errors.append(BulkError(
+                index=index, id=row_id if isinstance(row_id, int) else None, detail=detail
+            ))
+    return valid, errors
+
+
+async def _announce_batch(action: str, items: List[Dict[str, Any]]):
+    await cache.invalidate(namespaces=[ITEMS])
+    await NATSService.publish_items_batch(action, items)
+    await manager.broadcast_items_batch(action, items)
+
+
+def _encode_cursor(order_by: str, row: Dict[str, Any], sort_key: Any) -> str:
+    payload = {"o": order_by, "id": row["id"]}
+    if order_by == "timestamp":
+        payload["ts"] = sort_key.isoformat() if isinstance(sort_key, datetime) else sort_key
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, order_by: str) -> Dict[str, Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        if payload["o"] != order_by:
+            raise ValueError("cursor was issued for another order_by")
+        return payload
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _parse_fields(fields: Optional[str], order_by: str) -> List[str]:
+    if not fields:
+        names = list(DEFAULT_FIELDS)
+    else:
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in names if name not in ITEM_FIELDS]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(unknown)}"
+            )
+    # Ключ курсора нужен всегда
+    for key in ("id", order_by):
+        if key not in names:
+            names.append(key)
+    return names
+
+
+def _prefix_range(prefix: str):
+    # location >= prefix AND location < prefix_next использует B-tree индекс
+    # в любой СУБД, в отличие от LIKE 'prefix%'
+    # prefix_next — префикс с увеличенным последним символом. U+10FFFF
+    # увеличить нельзя: отбрасываем его и увеличиваем предыдущий. Если
+    # префикс целиком из U+10FFFF, всё, что не меньше него, с него и начинается.
+    # Суррогаты U+D800–U+DFFF в UTF-8 не кодируются: после U+D7FF идёт U+E000
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return WeatherItem.location >= prefix
+    code = ord(stem[-1]) + 1
+    if 0xD800 <= code <= 0xDFFF:
+        code = 0xE000
+    upper = stem[:-1] + chr(code)
+    return and_(WeatherItem.location >= prefix, WeatherItem.location < upper)
+
+
+@router.get("/")
 async def get_items(
+    response: Response,
+    cursor: Optional[str] = None,
     offset: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=1000),
+    order_by: str = Query("id", pattern="^(id|timestamp)$"),
+    fields: Optional[str] = None,
+    location_prefix: Optional[str] = Query(None, min_length=1),
+    min_temperature: Optional[float] = None,
+    max_temperature: Optional[float] = None,
+    min_humidity: Optional[float] = None,
+    max_humidity: Optional[float] = None,
+    min_wind_speed: Optional[float] = None,
+    max_wind_speed: Optional[float] = None,
+    session: AsyncSession = Depends(get_read_session)
+):
+    # Пагинация по ключу: WHERE (timestamp, id) > (:ts, :id) ORDER BY ... LIMIT,
+    # страница стоит одинаково независимо от глубины. offset оставлен для
+    # совместимости и игнорируется, если передан cursor
+    names = _parse_fields(fields, order_by)
+    after = _decode_cursor(cursor, order_by) if cursor else None
+    ranges = {
+        WeatherItem.temperature: (min_temperature, max_temperature),
+        WeatherItem.humidity: (min_humidity, max_humidity),
+        WeatherItem.wind_speed: (min_wind_speed, max_wind_speed),
+    }
+
+    # Значение timestamp в курсоре — как оно лежит в БД, без преобразования
+    # в datetime: иначе SQLite сравнивает строки разного формата.
+    # В PostgreSQL тип настоящий, сравниваем datetime
+    if session.bind.dialect.name == "postgresql":
+        sort_key = WeatherItem.timestamp.label("sort_key")
+        if after and order_by == "timestamp":
+            try:
+                after["ts"] = datetime.fromisoformat(after["ts"])
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+    else:
+        sort_key = type_coerce(WeatherItem.timestamp, String).label("sort_key")
+
+    async def load():
+        stmt = select(*(ITEM_FIELDS[name] for name in names))
+        if order_by == "timestamp":
+            stmt = stmt.add_columns(sort_key)
+
+        if location_prefix:
+            stmt = stmt.where(_prefix_range(location_prefix))
+        for column, (low, high) in ranges.items():
+            if low is not None:
+                stmt = stmt.where(column >= low)
+            if high is not None:
+                stmt = stmt.where(column <= high)
+
+        if order_by == "timestamp":
+            if after:
+                stmt = stmt.where(
+                    tuple_(sort_key.element, WeatherItem.id) > (after["ts"], after["id"])
+                )
+            stmt = stmt.order_by(WeatherItem.timestamp, WeatherItem.id)
+        else:
+            if after:
+                stmt = stmt.where(WeatherItem.id > after["id"])
+            stmt = stmt.order_by(WeatherItem.id)
+
+        if not after and offset:
+            stmt = stmt.offset(offset)
+        # Берём на одну строку больше, чтобы понять, есть ли следующая страница
+        result = await session.execute(stmt.limit(limit + 1))
+        rows = [_row_to_dict(row) for row in result]
+        sort_keys = [row.pop("sort_key", None) for row in rows]
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(order_by, rows[-1], sort_keys[limit - 1])
+        return {"items": rows, "next_cursor": next_cursor}
+
+    page = await cache.get_or_load(
+        ITEMS,
+        {
+            "cursor": cursor, "offset": offset, "limit": limit,
+            "order_by": order_by, "fields": ",".join(names),
+            "location_prefix": location_prefix,
+            **{
+                f"{column.key}_range": f"{low}:{high}"
+                for column, (low, high) in ranges.items()
+            },
+        },
+        load,
+    )
+
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    return page["items"]
+
+
+@router.post("/bulk", response_model=BulkResult)
+async def create_items_bulk(
+    rows: List[Dict[str, Any]] = Body(...),
     session: AsyncSession = Depends(get_session)
 ):
-    stmt = select(WeatherItem).offset(offset).limit(limit)
-    result = await session.execute(stmt)
-    return result.scalars().all()
+    _check_bulk_size(len(rows))
+    valid, errors = _validate_rows(rows, WeatherBase)
+    created = []
+
+    for chunk in chunked(valid, settings.BULK_CHUNK_SIZE):
+        stmt = insert(WeatherItem).returning(*ITEM_COLUMNS, sort_by_parameter_order=True)
+        try:
+            result = await session.execute(stmt, [payload.dict() for _, payload in chunk])
+            items = [_row_to_dict(row) for row in result]
+            await session.commit()
+        except Exception as e:
+            # Текст ошибки БД (SQL, параметры) клиенту не отдаём
+            await session.rollback()
+            logger.error(f"Bulk insert of {len(chunk)} items failed: {e}")
+            errors.extend(BulkError(index=index, detail="Insert failed") for index, _ in chunk)
+            continue
+
+        created.extend(items)
+        await _announce_batch("created", items)
+
+    return BulkResult(items=created, errors=sorted(errors, key=lambda e: e.index))
+
+
+async def _update_rows(session: AsyncSession, payloads: List[BulkItemUpdate]) -> List[Dict[str, Any]]:
+    # Изменения одной транзакцией; возвращает записи после изменения
+    params = [values for values in (payload.dict(exclude_unset=True) for payload in payloads) if len(values) > 1]
+    if params:
+        await session.execute(update(WeatherItem), params)
+    result = await session.execute(
+        select(*ITEM_COLUMNS).where(WeatherItem.id.in_([payload.id for payload in payloads]))
+    )
+    items = [_row_to_dict(row) for row in result]
+    await session.commit()
+    return items
+
+
+@router.patch("/bulk", response_model=BulkResult)
+async def update_items_bulk(
+    rows: List[Dict[str, Any]] = Body(...),
+    session: AsyncSession = Depends(get_session)
+):
+    _check_bulk_size(len(rows))
+    valid, errors = _validate_rows(rows, BulkItemUpdate)
+    updated = []
+
+    for chunk in chunked(valid, settings.BULK_CHUNK_SIZE):
+        ids = [payload.id for _, payload in chunk]
+        try:
+            result = await session.execute(
+                select(WeatherItem.id).where(WeatherItem.id.in_(ids))
+            )
+            existing = set(result.scalars())
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Bulk update of {len(chunk)} items failed: {e}")
+            errors.extend(BulkError(index=index, id=payload.id, detail="Update failed") for index, payload in chunk)
+            continue
+
+        found = []
+        for index, payload in chunk:
+            if payload.id in existing:
+                found.append((index, payload))
+            else:
+                errors.append(BulkError(index=index, id=payload.id, detail="Item not found"))
+
+        try:
+            items = await _update_rows(session, [payload for _, payload in found])
+        except Exception as e:
+            # Пачка откатилась целиком: повторяем по строкам, чтобы ошибку
+            # получили только те, что её вызвали
+            await session.rollback()
+            logger.warning(f"Bulk update of {len(found)} items failed, retrying row by row: {e}")
+            items = []
+            for index, payload in found:
+                try:
+                    items.extend(await _update_rows(session, [payload]))
+                except Exception as e:
+                    await session.rollback()
+                    conflict = isinstance(e, IntegrityError)
+                    if not conflict:
+                        logger.error(f"Update of item {payload.id} failed: {e}")
+                    errors.append(BulkError(
+                        index=index, id=payload.id,
+                        detail="Conflict with existing data" if conflict else "Update failed",
+                    ))
+
+        if items:
+            updated.extend(items)
+            await _announce_batch("updated", items)
+
+    return BulkResult(items=updated, errors=sorted(errors, key=lambda e: e.index))
+
+
+@router.delete("/bulk", response_model=BulkResult)
+async def delete_items_bulk(
+    payload: BulkDelete,
+    session: AsyncSession = Depends(get_session)
+):
+    _check_bulk_size(len(payload.ids))
+    deleted, errors = [], []
+
+    for chunk in chunked(list(enumerate(payload.ids)), settings.BULK_CHUNK_SIZE):
+        ids = [item_id for _, item_id in chunk]
+        try:
+            result = await session.execute(
+                delete(WeatherItem)
+                .where(WeatherItem.id.in_(ids))
+                .returning(WeatherItem.id, WeatherItem.location)
+            )
+            # location — для подписчиков /ws/items на локацию
+            removed = dict(result.tuples().all())
+            await session.commit()
+        except Exception as e:
+            # Текст ошибки БД (SQL, параметры) клиенту не отдаём
+            await session.rollback()
+            logger.error(f"Bulk delete of {len(chunk)} items failed: {e}")
+            errors.extend(BulkError(index=index, id=item_id, detail="Delete failed") for index, item_id in chunk)
+            continue
+
+        errors.extend(
+            BulkError(index=index, id=item_id, detail="Item not found")
+            for index, item_id in chunk if item_id not in removed
+        )
+        if removed:
+            deleted.extend(sorted(removed))
+            await _announce_batch("deleted", [
+                {"id": item_id, "location": removed[item_id]} for item_id in sorted(removed)
+            ])
+
+    return BulkResult(deleted=deleted, errors=errors)
 
 
 @router.get("/{item_id}", response_model=WeatherResponse)
 async def get_item(
     item_id: int,
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_read_session)
 ):
-    stmt = select(WeatherItem).where(WeatherItem.id == item_id)
-    result = await session.execute(stmt)
-    item = result.scalar_one_or_none()
+    async def load():
+        stmt = select(WeatherItem).where(WeatherItem.id == item_id)
+        result = await session.execute(stmt)
+        item = result.scalar_one_or_none()
+        return item.to_dict() if item is not None else None
+
+    item = await cache.get_or_load(ITEMS, {"id": item_id}, load)
     if item is None:
         raise HTTPException(status_code=404, detail="Item not found")
     
@@ -49,9 +398,11 @@ async def create_item(
     session.add(db_item)
     await session.commit()
     await session.refresh(db_item)
+    await cache.invalidate(namespaces=[ITEMS])
     
-    await NATSService.publish_item_created(db_item.id, db_item.to_dict())
-    await manager.broadcast_item_update("created", db_item.to_dict())
+    item = db_item.to_dict()
+    await NATSService.publish_item_created(db_item.id, item)
+    await manager.broadcast_item_update("created", item)
     
     return db_item
 
@@ -74,9 +425,11 @@ async def update_item(
     
     await session.commit()
     await session.refresh(db_item)
+    await cache.invalidate(namespaces=[ITEMS])
     
-    await NATSService.publish_item_updated(db_item.id, db_item.to_dict())
-    await manager.broadcast_item_update("updated", db_item.to_dict())
+    item = db_item.to_dict()
+    await NATSService.publish_item_updated(db_item.id, item)
+    await manager.broadcast_item_update("updated", item)
     
     return db_item
 
@@ -95,8 +448,10 @@ async def delete_item(
     
     await session.delete(item)
     await session.commit()
+    await cache.invalidate(namespaces=[ITEMS])
     
-    await NATSService.publish_item_deleted(item_id)
-    await manager.broadcast_item_update("deleted", {"id": item_id})
+    deleted = {"id": item_id, "location": item.location}
+    await NATSService.publish_item_deleted(item_id, deleted)
+    await manager.broadcast_item_update("deleted", deleted)
     
     return {"message": "Item deleted successfully"}
\ No newline at end of file
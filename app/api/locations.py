@@ -0,0 +1,96 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import List, Optional
+
+from app.db.db import get_session, get_read_session
+from app.models.models import TrackedLocation
+from app.models.schemas import (
+    LocationCreate,
+    LocationUpdate,
+    LocationResponse
+)
+from app.services.weather import location_key
+
+router = APIRouter(prefix="/locations", tags=["locations"])
+
+
+@router.get("/", response_model=List[LocationResponse])
+async def get_locations(
+    offset: int = 0,
+    limit: int = 100,
+    active: Optional[bool] = None,
+    session: AsyncSession = Depends(get_read_session)
+):
+    stmt = select(TrackedLocation).order_by(TrackedLocation.id)
+    if active is not None:
+        stmt = stmt.where(TrackedLocation.is_active == active)
+    stmt = stmt.offset(offset).limit(limit)
+    result = await session.execute(stmt)
+    return result.scalars().all()
+
+
+@router.get("/{location_id}", response_model=LocationResponse)
+async def get_location(
+    location_id: int,
+    session: AsyncSession = Depends(get_read_session)
+):
+    location = await session.get(TrackedLocation, location_id)
+    if location is None:
+        raise HTTPException(status_code=404, detail="Location not found")
+
+    return location
+
+
+@router.post("/", response_model=LocationResponse)
+async def create_location(
+    payload: LocationCreate,
+    session: AsyncSession = Depends(get_session)
+):
+    key = location_key(payload.latitude, payload.longitude)
+    stmt = select(TrackedLocation).where(TrackedLocation.location == key)
+    result = await session.execute(stmt)
+    if result.scalar_one_or_none() is not None:
+        raise HTTPException(status_code=409, detail="Location already tracked")
+
+    location = TrackedLocation(location=key, **payload.dict())
+    session.add(location)
+    await session.commit()
+    await session.refresh(location)
+
+    return location
+
+
+@router.patch("/{location_id}", response_model=LocationResponse)
+async def update_location(
+    location_id: int,
+    location_update: LocationUpdate,
+    session: AsyncSession = Depends(get_session)
+):
+    location = await session.get(TrackedLocation, location_id)
+    if location is None:
+        raise HTTPException(status_code=404, detail="Location not found")
+
+    update_data = location_update.dict(exclude_unset=True)
+    for field, value in update_data.items():
+        setattr(location, field, value)
+
+    await session.commit()
+    await session.refresh(location)
+
+    return location
+
+
+@router.delete("/{location_id}")
+async def delete_location(
+    location_id: int,
+    session: AsyncSession = Depends(get_session)
+):
+    location = await session.get(TrackedLocation, location_id)
+    if location is None:
+        raise HTTPException(status_code=404, detail="Location not found")
+
+    await session.delete(location)
+    await session.commit()
+
+    return {"message": "Location deleted successfully"}
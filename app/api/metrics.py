@@ -0,0 +1,31 @@
+from fastapi import APIRouter, HTTPException, Query, Response
+from app.config import settings
+from app.metrics import render
+from app.profiler import profile
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_prometheus_metrics():
+    body, content_type = render()
+    return Response(content=body, headers={"Content-Type": content_type})
+
+
+@router.get("/debug/profile", include_in_schema=False)
+async def get_profile(
+    seconds: float = Query(10.0, gt=0),
+    interval: float = Query(0.005, ge=0.001, le=1.0),
+    all_threads: bool = False,
+):
+    # Стеки в формате collapsed: curl .../debug/profile?seconds=30 > out.folded,
+    # затем flamegraph.pl out.folded > flame.svg или speedscope.app
+    if not settings.PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiler is disabled")
+    if seconds > settings.PROFILER_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be <= {settings.PROFILER_MAX_SECONDS}")
+    try:
+        stacks = await profile(seconds, interval, all_threads)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return Response(content=stacks, media_type="text/plain")
@@ -1,14 +1,69 @@
-from fastapi import APIRouter
-from app.tasks.task import background_task
-from app.models.schemas import TaskResponse
+from fastapi import APIRouter, HTTPException
+from app.tasks.task import LeaderForwardError, background_task
+from app.tasks.retention import retention_task
+from app.tasks.writer import weather_writer
+from app.services.hotstore import hot_store
+from app.nats.client import nats_client
+from app.ws.websocket import manager
+from app.models.schemas import (
+    TaskResponse,
+    TaskMetrics,
+    RetentionMetrics,
+    WriterMetrics,
+    PublisherMetrics,
+    WebSocketMetrics,
+    HotStoreMetrics
+)
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
 
 
 @router.post("/run", response_model=TaskResponse)
 async def run_background_task():
-    await background_task.run_once()
+    try:
+        worker = await background_task.run_on_leader()
+    except LeaderForwardError as e:
+        raise HTTPException(status_code=504 if e.timed_out else 502, detail=str(e))
     return TaskResponse(
-        message="Background task executed manually",
+        message=f"Background task executed manually on worker {worker}",
         task_id="manual_execution"
-    )
\ No newline at end of file
+    )
+
+
+@router.get("/metrics", response_model=TaskMetrics)
+async def get_background_task_metrics():
+    return background_task.get_metrics()
+
+
+@router.get("/writer/metrics", response_model=WriterMetrics)
+async def get_writer_metrics():
+    return weather_writer.get_metrics()
+
+
+@router.get("/nats/metrics", response_model=PublisherMetrics)
+async def get_nats_publisher_metrics():
+    return nats_client.publisher.get_metrics()
+
+
+@router.get("/ws/metrics", response_model=WebSocketMetrics)
+async def get_websocket_metrics():
+    return manager.get_metrics()
+
+
+@router.get("/hotstore/metrics", response_model=HotStoreMetrics)
+async def get_hot_store_metrics():
+    return hot_store.get_metrics()
+
+
+@router.post("/retention/run", response_model=TaskResponse)
+async def run_retention_task():
+    await retention_task.run_once()
+    return TaskResponse(
+        message="Retention task executed manually",
+        task_id="manual_retention"
+    )
+
+
+@router.get("/retention/metrics", response_model=RetentionMetrics)
+async def get_retention_task_metrics():
+    return retention_task.get_metrics()
\ No newline at end of file
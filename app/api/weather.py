@@ -1,34 +1,213 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, Tuple
 
-from app.db.db import get_session
-from app.models.models import WeatherHistory
-from app.services.weather import WeatherService
+from app.cache.cache import cache, HISTORY, WEATHER_CURRENT, weather_current_key
+from app.codecs import CODECS, JSON
+from app.config import settings
+from app.db.db import get_read_session, read_session_maker
+from app.models.models import WeatherHistory, WeatherItem
+from app.services.cache import TTLCache, STALE, FALLBACK
+from app.services.history import (
+    BUCKETS,
+    METRICS,
+    aggregate_history,
+    export_history,
+    history_columns,
+    parse_aggregates
+)
+from app.services.hotstore import hot_store
+from app.services.weather import weather_service, location_key
 
 router = APIRouter(prefix="/weather", tags=["weather"])
 
+current_weather_cache = TTLCache(
+    ttl=settings.WEATHER_CACHE_TTL,
+    maxsize=settings.WEATHER_CACHE_MAXSIZE,
+    stale_ttl=settings.WEATHER_CACHE_STALE_TTL,
+)
+
+
+def _drop_current_weather(keys):
+    prefix = f"{WEATHER_CURRENT}:"
+    for key in keys:
+        if key.startswith(prefix):
+            current_weather_cache.invalidate(key[len(prefix):])
+
+
+cache.add_listener(_drop_current_weather)
+
+
+async def _load_current_weather(latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
+    # L1 — TTLCache этого процесса, L2 — общий кэш воркеров
+    key = weather_current_key(location_key(latitude, longitude))
+    weather = await cache.get(key)
+    if weather is None:
+        weather = await weather_service.fetch_current_weather(latitude, longitude)
+        if weather is not None:
+            await cache.set(key, weather, settings.WEATHER_CACHE_TTL)
+    return weather
+
+
+async def _latest_stored_weather(location: str) -> Optional[Tuple[Dict[str, Any], float]]:
+    async with read_session_maker() as session:
+        stmt = select(WeatherItem).where(
+            WeatherItem.location == location
+        ).order_by(WeatherItem.id.desc()).limit(1)
+        result = await session.execute(stmt)
+        item = result.scalar_one_or_none()
+
+    if item is None:
+        return None
+
+    age = 0.0
+    if item.timestamp is not None:
+        timestamp = item.timestamp
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        age = max((datetime.now(timezone.utc) - timestamp).total_seconds(), 0.0)
+
+    return {
+        "location": item.location,
+        "temperature": item.temperature,
+        "humidity": item.humidity,
+        "wind_speed": item.wind_speed,
+    }, age
+
 
 @router.get("/current")
-async def get_current_weather():
-    service = WeatherService()
-    weather = await service.fetch_current_weather()
+async def get_current_weather(
+    response: Response,
+    latitude: Optional[float] = Query(None, ge=-90, le=90),
+    longitude: Optional[float] = Query(None, ge=-180, le=180),
+):
+    if latitude is None or longitude is None:
+        latitude, longitude = settings.LATITUDE, settings.LONGITUDE
+    key = location_key(latitude, longitude)
+
+    weather, age, status = await current_weather_cache.get_or_load(
+        key,
+        lambda: _load_current_weather(latitude, longitude),
+    )
+
+    if weather is None and settings.WEATHER_CACHE_DB_FALLBACK:
+        stored = await _latest_stored_weather(key)
+        if stored is not None:
+            weather, age = stored
+            status = FALLBACK
+
+    response.headers["X-Cache"] = status
+    if weather is None:
+        response.headers["Cache-Control"] = "no-store"
+        return weather
+
+    response.headers["Age"] = str(int(age))
+    if status in (STALE, FALLBACK):
+        response.headers["Cache-Control"] = "public, max-age=0, must-revalidate"
+    else:
+        max_age = max(int(current_weather_cache.ttl - age), 0)
+        response.headers["Cache-Control"] = (
+            f"public, max-age={max_age}, "
+            f"stale-while-revalidate={int(current_weather_cache.stale_ttl)}"
+        )
     return weather
 
 
 @router.get("/history")
 async def get_weather_history(
     hours: int = 24,
-    session: AsyncSession = Depends(get_session)
+    location: Optional[str] = None,
+    layout: str = Query("rows", pattern="^(rows|columns)$"),
+    session: AsyncSession = Depends(get_read_session)
+):
+    if layout == "columns":
+        return await _history_columns(hours, location, session)
+
+    async def load():
+        since = datetime.now() - timedelta(hours=hours)
+
+        stmt = select(WeatherHistory).where(
+            WeatherHistory.recorded_at >= since
+        ).order_by(WeatherHistory.recorded_at.desc())
+        if location is not None:
+            stmt = stmt.where(WeatherHistory.location == location)
+
+        result = await session.execute(stmt)
+        history = result.scalars().all()
+
+        return [h.to_dict() for h in history]
+
+    params = {"hours": hours} if location is None else {"hours": hours, "location": location}
+    return await cache.get_or_load(HISTORY, params, load)
+
+
+async def _history_columns(hours: int, location: Optional[str], session: AsyncSession) -> Response:
+    # Из памяти, если окно там целиком, иначе из БД. Ответ кодируется
+    # напрямую: jsonable_encoder обходил бы каждое число столбцов
+    locations = hot_store.window(hours, location)
+    source = "memory"
+    if locations is None:
+        async def load():
+            since = datetime.now(timezone.utc) - timedelta(hours=hours)
+            return await history_columns(session, since, location)
+
+        locations = await cache.get_or_load(
+            HISTORY, {"columns": hours, "location": location}, load
+        )
+        source = "db"
+
+    body = {"hours": hours, "source": source, "locations": locations}
+    return Response(CODECS[JSON].encode(body), media_type="application/json")
+
+
+@router.get("/history/aggregate")
+async def get_weather_history_aggregate(
+    location: Optional[str] = None,
+    bucket: str = Query("1h", pattern=f"^({'|'.join(BUCKETS)})$"),
+    agg: str = "min,max,avg",
+    metrics: str = ",".join(METRICS),
+    hours: int = Query(24, ge=1, le=24 * 366),
+    session: AsyncSession = Depends(get_read_session)
+):
+    try:
+        aggregates = parse_aggregates(agg)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    metric_names = [name.strip() for name in metrics.split(",") if name.strip()]
+    unknown = [name for name in metric_names if name not in METRICS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown metrics: {', '.join(unknown)}")
+
+    async def load():
+        since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=hours)
+        return await aggregate_history(
+            session, since, bucket, aggregates, metric_names, location
+        )
+
+    return await cache.get_or_load(
+        HISTORY,
+        {
+            "aggregate": bucket, "agg": ",".join(aggregates),
+            "metrics": ",".join(metric_names), "hours": hours, "location": location,
+        },
+        load,
+    )
+
+
+@router.get("/history/export")
+async def export_weather_history(
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    location: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
 ):
-    since = datetime.now() - timedelta(hours=hours)
-    
-    stmt = select(WeatherHistory).where(
-        WeatherHistory.recorded_at >= since
-    ).order_by(WeatherHistory.recorded_at.desc())
-    
-    result = await session.execute(stmt)
-    history = result.scalars().all()
-    
-    return [h.to_dict() for h in history]
\ No newline at end of file
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    filename = f"weather_history.{fmt}"
+    return StreamingResponse(
+        export_history(fmt, since, until, location),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
\ No newline at end of file
@@ -0,0 +1,120 @@
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from app.cache.base import CacheBackend
+from app.cache.memory import MemoryCache
+from app.cache.redis import RedisCache
+from app.config import settings
+from app.nats.client import nats_client
+
+logger = logging.getLogger(__name__)
+
+# Пространства имён. Инвалидация пространства — инкремент его версии,
+# поэтому не нужно перечислять ключи страниц и фильтров
+ITEMS = "items"
+HISTORY = "history"
+WEATHER_CURRENT = "weather:current"
+
+
+def weather_current_key(location: str) -> str:
+    return f"{WEATHER_CURRENT}:{location}"
+
+
+def create_backend() -> CacheBackend:
+    if settings.CACHE_BACKEND == "redis":
+        return RedisCache(
+            settings.CACHE_REDIS_URL,
+            pool_size=settings.CACHE_REDIS_POOL_SIZE,
+            timeout=settings.CACHE_REDIS_TIMEOUT,
+        )
+    return MemoryCache(settings.CACHE_MAXSIZE)
+
+
+class Cache:
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.origin = uuid.uuid4().hex
+        self.ttl = settings.CACHE_TTL
+        self._listeners: List[Callable[[List[str]], None]] = []
+
+    def add_listener(self, listener: Callable[[List[str]], None]):
+        # Локальные L1 кэши (например, TTLCache /weather/current) подписываются
+        # на удаление ключей, чтобы сбрасываться вместе с общим кэшем
+        self._listeners.append(listener)
+
+    async def start(self):
+        await nats_client.subscribe(settings.NATS_TOPIC_CACHE, self.handle_invalidation)
+
+    async def close(self):
+        await self.backend.close()
+
+    async def get(self, key: str) -> Optional[Any]:
+        try:
+            return await self.backend.get(key)
+        except Exception as e:
+            logger.error(f"Cache get failed for {key}: {e}")
+            return None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        try:
+            await self.backend.set(key, value, ttl or self.ttl)
+        except Exception as e:
+            logger.error(f"Cache set failed for {key}: {e}")
+
+    async def get_or_load(
+        self,
+        namespace: str,
+        params: Dict[str, Any],
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+    ) -> Any:
+        try:
+            version = await self.backend.get_counter(f"{namespace}:version")
+        except Exception as e:
+            logger.error(f"Cache unavailable, loading {namespace} directly: {e}")
+            return await loader()
+
+        key = f"{namespace}:v{version}:" + "&".join(
+            f"{name}={params[name]}" for name in sorted(params)
+        )
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        value = await loader()
+        if value is not None:
+            await self.set(key, value, ttl)
+        return value
+
+    async def invalidate(self, namespaces: Iterable[str] = (), keys: Iterable[str] = ()):
+        namespaces, keys = list(namespaces), list(keys)
+        await self._apply(namespaces, keys, self.backend)
+        await nats_client.publish(settings.NATS_TOPIC_CACHE, {
+            "origin": self.origin,
+            "namespaces": namespaces,
+            "keys": keys,
+        })
+
+    async def handle_invalidation(self, message: Dict[str, Any]):
+        if message.get("origin") == self.origin:
+            return
+        # Общий бэкенд уже инвалидирован отправителем, сбрасываем только L1
+        backend = None if self.backend.shared else self.backend
+        await self._apply(message.get("namespaces", []), message.get("keys", []), backend)
+
+    async def _apply(self, namespaces: List[str], keys: List[str], backend: Optional[CacheBackend]):
+        if backend is not None:
+            try:
+                for namespace in namespaces:
+                    await backend.incr(f"{namespace}:version")
+                if keys:
+                    await backend.delete(*keys)
+            except Exception as e:
+                logger.error(f"Cache invalidation failed: {e}")
+
+        for listener in self._listeners:
+            listener(keys)
+
+
+cache = Cache(create_backend())
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import logging
+from typing import Any, List, Optional
+from urllib.parse import urlparse
+
+from app.cache.base import CacheBackend
+
+logger = logging.getLogger(__name__)
+
+
+class RedisError(Exception):
+    pass
+
+
+# Минимальный клиент протокола Redis (RESP2) поверх asyncio streams.
+# Работает с Redis, KeyDB, Dragonfly и любым RESP-совместимым сервером
+class RedisConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host: str, port: int, timeout: float) -> "RedisConnection":
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), timeout
+        )
+        return cls(reader, writer)
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    async def _read_reply(self) -> Any:
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        prefix, payload = line[:1], line[1:-2]
+
+        if prefix == b"+":
+            return payload.decode()
+        if prefix == b"-":
+            raise RedisError(payload.decode())
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length == -1:
+                return None
+            data = await self.reader.readexactly(length + 2)
+            return data[:-2]
+        if prefix == b"*":
+            length = int(payload)
+            if length == -1:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    async def execute(self, *args) -> Any:
+        self.writer.write(self._encode(args))
+        await self.writer.drain()
+        return await self._read_reply()
+
+    def close(self):
+        self.writer.close()
+
+
+class RedisCache(CacheBackend):
+    shared = True
+
+    def __init__(self, url: str, pool_size: int = 10, timeout: float = 1.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._idle: List[RedisConnection] = []
+        self._semaphore = asyncio.Semaphore(pool_size)
+
+    async def _connect(self) -> RedisConnection:
+        conn = await RedisConnection.open(self.host, self.port, self.timeout)
+        if self.password:
+            await conn.execute("AUTH", self.password)
+        if self.db:
+            await conn.execute("SELECT", self.db)
+        return conn
+
+    async def execute(self, *args) -> Any:
+        async with self._semaphore:
+            conn = self._idle.pop() if self._idle else await self._connect()
+            try:
+                reply = await asyncio.wait_for(conn.execute(*args), self.timeout)
+            except RedisError:
+                self._idle.append(conn)
+                raise
+            except BaseException:
+                # Состояние соединения неизвестно — не возвращаем его в пул
+                conn.close()
+                raise
+            self._idle.append(conn)
+            return reply
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self.execute("GET", key)
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    async def set(self, key: str, value: Any, ttl: float):
+        await self.execute(
+            "SET", key, json.dumps(value, default=str), "PX", max(int(ttl * 1000), 1)
+        )
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self.execute("DEL", *keys)
+
+    async def incr(self, key: str) -> int:
+        return await self.execute("INCR", key)
+
+    async def get_counter(self, key: str) -> int:
+        raw = await self.execute("GET", key)
+        return int(raw) if raw is not None else 0
+
+    async def close(self):
+        while self._idle:
+            self._idle.pop().close()
@@ -0,0 +1,124 @@
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+
+# Кодек переводит сообщение (dict) в байты и обратно. format — формат на
+# проводе: его называет клиент WebSocket в subprotocol, а NATS-подписчик
+# видит в заголовке Content-Type
+class Codec:
+    name = ""
+    format = ""
+    content_type = ""
+    binary = False  # WebSocket: бинарный кадр вместо текстового
+
+    def encode(self, message: Any) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, payload: bytes) -> Any:
+        raise NotImplementedError
+
+
+class StdlibJSONCodec(Codec):
+    name = "stdlib"
+    format = JSON
+    content_type = "application/json"
+
+    def encode(self, message: Any) -> bytes:
+        return json.dumps(message, separators=(",", ":")).encode()
+
+    def decode(self, payload: bytes) -> Any:
+        return json.loads(payload)
+
+
+class OrjsonCodec(Codec):
+    name = "orjson"
+    format = JSON
+    content_type = "application/json"
+
+    def encode(self, message: Any) -> bytes:
+        return orjson.dumps(message)
+
+    def decode(self, payload: bytes) -> Any:
+        return orjson.loads(payload)
+
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+    format = MSGPACK
+    content_type = "application/msgpack"
+    binary = True
+
+    def encode(self, message: Any) -> bytes:
+        return msgpack.packb(message)
+
+    def decode(self, payload: bytes) -> Any:
+        return msgpack.unpackb(payload)
+
+
+def _json_codec() -> Codec:
+    if settings.JSON_ENCODER == "orjson":
+        if orjson is not None:
+            return OrjsonCodec()
+        logger.warning("orjson is not installed, falling back to stdlib json")
+    return StdlibJSONCodec()
+
+
+CODECS: Dict[str, Codec] = {JSON: _json_codec()}
+if msgpack is not None:
+    CODECS[MSGPACK] = MsgpackCodec()
+
+BY_CONTENT_TYPE = {codec.content_type: codec for codec in CODECS.values()}
+
+
+def get_codec(fmt: str) -> Codec:
+    codec = CODECS.get(fmt)
+    if codec is None:
+        raise ValueError(f"Codec {fmt!r} is not available (installed: {', '.join(CODECS)})")
+    return codec
+
+
+def codec_for_content_type(content_type: Optional[str]) -> Codec:
+    # Сообщения без заголовка — от старых издателей, это JSON
+    return BY_CONTENT_TYPE.get(content_type or "", CODECS[JSON])
+
+
+# Событие, закодированное не больше одного раза на кодек: одни и те же
+# байты уходят в NATS и всем WebSocket-клиентам с этим форматом
+class Frame:
+    __slots__ = ("message", "_payloads", "_texts")
+
+    def __init__(self, message: Any):
+        self.message = message
+        self._payloads: Dict[str, bytes] = {}
+        self._texts: Dict[str, str] = {}
+
+    def encode(self, codec: Codec) -> bytes:
+        payload = self._payloads.get(codec.name)
+        if payload is None:
+            payload = self._payloads[codec.name] = codec.encode(self.message)
+        return payload
+
+    def text(self, codec: Codec) -> str:
+        # Текстовый кадр WebSocket для JSON-клиентов
+        text = self._texts.get(codec.name)
+        if text is None:
+            text = self._texts[codec.name] = self.encode(codec).decode()
+        return text
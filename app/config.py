@@ -3,19 +3,140 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     # DB
     DATABASE_URL: str = "sqlite+aiosqlite:///./weather.db"
+    DB_PROFILE: str = "production"  # production — WAL и PRAGMA ниже, default — как есть
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 5
+    DB_READ_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT: int = 5000  # ms
+    SQLITE_MMAP_SIZE: int = 268435456  # 256 MB
+    SQLITE_CACHE_SIZE: int = -65536  # отрицательное — в KiB (64 MB)
+    SQLITE_TEMP_STORE: str = "MEMORY"
+    # PostgreSQL (postgresql+asyncpg://...): weather_history секционирована по дням
+    HISTORY_PARTITIONS_AHEAD: int = 3  # дней, для которых секции создаются заранее
     
     # NATS
     NATS_URL: str = "nats://localhost:4222"
     NATS_TOPIC_ITEMS: str = "items.updates"
     NATS_TOPIC_WEATHER: str = "weather.updates"
+    NATS_TOPIC_CACHE: str = "cache.invalidate"
+    NATS_TOPIC_TASKS: str = "tasks.run"  # + .<id воркера-лидера>
+    # Очередь публикации
+    NATS_QUEUE_SIZE: int = 10000
+    NATS_OVERFLOW: str = "drop"  # drop | block | spill
+    NATS_SPILL_PATH: str = "./nats_spill.ndjson"
+    NATS_PUBLISH_BATCH: int = 100
+    NATS_DRAIN_TIMEOUT: float = 5.0  # seconds, дослать очередь при остановке
+    NATS_RECONNECT_INTERVAL: float = 5.0  # seconds
+    NATS_JETSTREAM: bool = False  # публикация с подтверждением в стрим
+    NATS_STREAM: str = "WEATHER"
+    NATS_ACK_TIMEOUT: float = 2.0  # seconds
+    NATS_PUBLISH_RETRIES: int = 3
+    NATS_CODEC: str = "json"  # json | msgpack, формат в заголовке Content-Type
+
+    # Сериализация NATS и WebSocket
+    JSON_ENCODER: str = "orjson"  # orjson | stdlib
+
+    # WebSocket: очередь кадров на клиента
+    WS_QUEUE_SIZE: int = 256
+    WS_SLOW_POLICY: str = "drop_oldest"  # drop_oldest | coalesce | disconnect
+    WS_SEND_TIMEOUT: float = 10.0  # seconds на кадр, дольше — клиент отключается
+    WS_PING_INTERVAL: float = 20.0  # seconds, 0 — без ping
+    WS_PONG_TIMEOUT: float = 0  # seconds тишины от клиента до отключения, 0 — не проверять
+    WS_MAX_TOPICS: int = 1000  # тем подписки на одного клиента
+    WS_COALESCE_WINDOW: float = 0  # seconds, слияние изменений одной записи, 0 — выключено
+    WS_REPLAY_BUFFER: int = 10000  # последних событий для переподключения с ?since=
+    WS_SNAPSHOT_CHUNK: int = 1000  # записей в кадре снимка
+
+    # Кэш (memory — в процессе, redis — общий для воркеров)
+    CACHE_BACKEND: str = "memory"
+    CACHE_TTL: float = 30.0  # seconds
+    CACHE_MAXSIZE: int = 10000
+    CACHE_REDIS_URL: str = "redis://localhost:6379/0"
+    CACHE_REDIS_POOL_SIZE: int = 10
+    CACHE_REDIS_TIMEOUT: float = 1.0
     
     # Open-Meteo API
     OPEN_METEO_URL: str = "https://api.open-meteo.com/v1/forecast"
     LATITUDE: float = 55.7558  # Москва
     LONGITUDE: float = 37.6173
+    OPEN_METEO_BATCH_SIZE: int = 100  # координат в одном запросе
+    OPEN_METEO_BATCH_CONCURRENCY: int = 4
+    OPEN_METEO_BREAKER_THRESHOLD: int = 5  # ошибок подряд до размыкания, 0 — выключено
+    OPEN_METEO_BREAKER_BACKOFF: float = 5.0  # seconds, первая пауза, дальше удваивается
+    OPEN_METEO_BREAKER_MAX_BACKOFF: float = 300.0  # seconds
+
+    # Роллапы истории (часовые и дневные)
+    ROLLUPS_ENABLED: bool = True
+    ROLLUP_MIN_HOURS: int = 48  # окна короче считаются по сырой истории
+
+    # Последние показания в памяти для /weather/history?layout=columns
+    HOT_STORE_ENABLED: bool = True
+    HOT_STORE_HOURS: int = 24  # окно в памяти, запросы шире идут в БД
+    HOT_STORE_CAPACITY: int = 1440  # показаний на локацию (сутки при опросе раз в минуту)
+    HOT_STORE_MAX_LOCATIONS: int = 2000  # не больше 32 байт * CAPACITY на локацию
+    HOT_STORE_SYNC_INTERVAL: float = 2.0  # seconds, догрузка из БД записей других воркеров
+    HOT_STORE_SYNC_OVERLAP: float = 60.0  # seconds, запас на поздно закоммиченные строки
+
+    # Хранение истории: сырые данные -> 5 минут -> часы (0 — бессрочно)
+    RETENTION_ENABLED: bool = True
+    RETENTION_INTERVAL: int = 3600  # seconds
+    RETENTION_RAW_DAYS: int = 7
+    RETENTION_5M_DAYS: int = 90
+    RETENTION_HOURLY_DAYS: int = 0
+    RETENTION_DAILY_DAYS: int = 0
+    RETENTION_CHUNK_SIZE: int = 5000  # строк за одну транзакцию удаления
+    RETENTION_CHUNK_PAUSE: float = 0.05  # seconds между транзакциями
+    RETENTION_VACUUM: str = "incremental"  # incremental | full | off
+    RETENTION_VACUUM_INTERVAL: int = 86400  # seconds, для full VACUUM
+
+    # Bulk операции с items
+    BULK_CHUNK_SIZE: int = 500  # строк в одной транзакции
+    BULK_MAX_ROWS: int = 50000
+
+    # Кэш /weather/current
+    WEATHER_CACHE_TTL: float = 60.0  # seconds
+    WEATHER_CACHE_STALE_TTL: float = 240.0  # stale-while-revalidate, 0 — выключено
+    WEATHER_CACHE_MAXSIZE: int = 1024
+    WEATHER_CACHE_DB_FALLBACK: bool = True
+
+    # HTTP клиент
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0  # seconds
+    HTTP2: bool = False
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    HTTP_READ_TIMEOUT: float = 30.0
+    HTTP_POOL_TIMEOUT: float = 5.0
     
     # Фоновая задача
     BACKGROUND_TASK_INTERVAL: int = 300  # seconds
+    INGEST_CONCURRENCY: int = 20  # одновременных запросов к Open-Meteo
+    INGEST_JITTER: float = 5.0  # seconds, разброс первого опроса новой локации
+    # Интервал опроса локации подстраивается под скорость изменения показаний
+    INGEST_MIN_INTERVAL: int = 60  # seconds
+    INGEST_MAX_INTERVAL: int = 1800  # seconds
+    INGEST_BATCH_WINDOW: float = 5.0  # seconds, локации со сроком в этом окне опрашиваются одной пачкой
+    INGEST_REGISTRY_REFRESH: float = 60.0  # seconds, как часто перечитывать tracked_locations
+    # Изменение за опрос, при котором локация считается быстро меняющейся
+    INGEST_CHANGE_TEMPERATURE: float = 0.5  # °C
+    INGEST_CHANGE_HUMIDITY: float = 3.0  # %
+    INGEST_CHANGE_WIND_SPEED: float = 1.0  # km/h
+    WRITE_BATCH_SIZE: int = 500  # показаний в одной транзакции записи
+    WRITE_BATCH_WINDOW: float = 0.2  # seconds, сколько копить показания
+
+    # Выбор лидера: загрузку погоды и очистку истории выполняет один воркер
+    LEADER_ELECTION: bool = True
+    LEADER_LEASE_TTL: float = 15.0  # seconds, за это время без продления аренду забирает другой
+    LEADER_RENEW_INTERVAL: float = 5.0  # seconds
+    LEADER_FORWARD_TIMEOUT: float = 120.0  # seconds, ожидание /tasks/run на лидере
+
+    # Метрики Prometheus (GET /metrics) и профайлер (GET /debug/profile)
+    METRICS_ENABLED: bool = True
+    PROFILER_ENABLED: bool = False
+    PROFILER_MAX_SECONDS: float = 60.0
     
     class Config:
         env_file = ".env"
@@ -1,14 +1,96 @@
 from app.config import settings
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncEngine, create_async_engine, async_sessionmaker
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import text
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy import Integer, cast, event, func, inspect, text
+from sqlalchemy.exc import OperationalError
+from datetime import datetime, timedelta, timezone
+from typing import Set
+import logging
+
+from app.db.partitions import ensure_history_partitions
+from app.metrics import instrument_engine
 
 Base = declarative_base()
 
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=True,
-)
+logger = logging.getLogger(__name__)
+
+_url = make_url(settings.DATABASE_URL)
+IS_SQLITE = _url.get_backend_name() == "sqlite"
+IS_POSTGRES = _url.get_backend_name() == "postgresql"
+# In-memory SQLite живёт в единственном соединении (StaticPool):
+# отдельного пула для чтения и настроек пула там нет
+IS_SQLITE_MEMORY = IS_SQLITE and _url.database in (None, "", ":memory:")
+
+
+def _sqlite_pragmas(read_only: bool):
+    pragmas = [
+        f"PRAGMA busy_timeout = {settings.SQLITE_BUSY_TIMEOUT}",
+    ]
+    if settings.RETENTION_VACUUM == "incremental" and not read_only:
+        # Действует только на новой БД, до journal_mode (WAL записывает
+        # заголовок); существующую переводит
+        # python -m app.tasks.retention enable-incremental-vacuum
+        pragmas.append("PRAGMA auto_vacuum = INCREMENTAL")
+    if settings.DB_PROFILE == "production":
+        pragmas += [
+            f"PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}",
+            f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}",
+            f"PRAGMA mmap_size = {settings.SQLITE_MMAP_SIZE}",
+            f"PRAGMA cache_size = {settings.SQLITE_CACHE_SIZE}",
+            f"PRAGMA temp_store = {settings.SQLITE_TEMP_STORE}",
+        ]
+    if read_only:
+        pragmas.append("PRAGMA query_only = ON")
+    return pragmas
+
+
+def _create_engine(pool_size: int, read_only: bool = False) -> AsyncEngine:
+    options = {"echo": settings.DB_ECHO}
+    if not IS_SQLITE_MEMORY:
+        options.update(
+            pool_size=pool_size,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_pre_ping=not IS_SQLITE,
+        )
+    if IS_SQLITE and not IS_SQLITE_MEMORY:
+        # По умолчанию aiosqlite открывает файл на каждый checkout (NullPool),
+        # и PRAGMA из connect-события выполнялись бы на каждый запрос
+        options["poolclass"] = AsyncAdaptedQueuePool
+    if IS_POSTGRES and read_only:
+        options["connect_args"] = {
+            "server_settings": {"default_transaction_read_only": "on"}
+        }
+    new_engine = create_async_engine(settings.DATABASE_URL, **options)
+
+    if IS_SQLITE:
+        pragmas = _sqlite_pragmas(read_only)
+
+        @event.listens_for(new_engine.sync_engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+    return new_engine
+
+
+engine = _create_engine(settings.DB_POOL_SIZE)
+
+# В WAL режиме читатели не ждут писателя, поэтому чтение идёт через
+# отдельный пул соединений только для чтения
+if IS_SQLITE_MEMORY:
+    read_engine = engine
+else:
+    read_engine = _create_engine(settings.DB_READ_POOL_SIZE, read_only=True)
+
+if settings.METRICS_ENABLED:
+    instrument_engine(engine, "write")
+    if read_engine is not engine:
+        instrument_engine(read_engine, "read")
 
 async_session_maker = async_sessionmaker(
     engine,
@@ -16,45 +98,204 @@ async_session_maker = async_sessionmaker(
     expire_on_commit=False
 )
 
+read_session_maker = async_sessionmaker(
+    read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False
+)
+
 async def get_session() -> AsyncSession:
     async with async_session_maker() as session:
         yield session
 
+async def get_read_session() -> AsyncSession:
+    async with read_session_maker() as session:
+        yield session
+
+def dialect_insert(session: AsyncSession, model):
+    # INSERT с поддержкой ON CONFLICT для текущей СУБД
+    if session.bind.dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+def epoch_bucket(session: AsyncSession, column, seconds: int):
+    # Начало бакета в unix-секундах, считается на стороне БД
+    if session.bind.dialect.name == "postgresql":
+        epoch = cast(func.floor(func.extract("epoch", column)), Integer)
+    else:
+        epoch = cast(func.strftime("%s", column), Integer)
+    return (epoch // seconds) * seconds
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
         await create_tables_directly()
 
+async def close_db():
+    # Пул держит открытые соединения aiosqlite (у каждого свой поток),
+    # без dispose процесс не завершится
+    if read_engine is not engine:
+        await read_engine.dispose()
+    await engine.dispose()
+
+SQLITE_TYPES = {
+    "pk": "INTEGER PRIMARY KEY AUTOINCREMENT",
+    "bigint": "INTEGER",
+    "float": "REAL",
+    "datetime": "DATETIME",
+    "now": "CURRENT_TIMESTAMP",
+    "true": "1",
+}
+
+POSTGRES_TYPES = {
+    "pk": "BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY",
+    "bigint": "BIGINT",
+    "float": "DOUBLE PRECISION",
+    # Время хранится наивным UTC, как CURRENT_TIMESTAMP в SQLite
+    "datetime": "TIMESTAMP",
+    "now": "(now() AT TIME ZONE 'utc')",
+    "true": "TRUE",
+}
+
+async def _column_names(conn, table: str) -> Set[str]:
+    columns = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_columns(table))
+    return {column["name"] for column in columns}
+
 async def create_tables_directly():
     async with engine.begin() as conn:
-        await conn.execute(text("""
+        postgres = conn.dialect.name == "postgresql"
+        t = POSTGRES_TYPES if postgres else SQLITE_TYPES
+
+        await conn.execute(text(f"""
             CREATE TABLE IF NOT EXISTS weather_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                id {t['pk']},
                 location TEXT NOT NULL,
-                temperature REAL,
-                humidity REAL,
-                wind_speed REAL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME
+                temperature {t['float']},
+                humidity {t['float']},
+                wind_speed {t['float']},
+                timestamp {t['datetime']} DEFAULT {t['now']},
+                updated_at {t['datetime']},
+                ingest_key TEXT
+            )
+        """))
+
+        if "ingest_key" not in await _column_names(conn, "weather_items"):
+            # Схема до ingest_key: строкой загрузки локации становится
+            # последняя из её записей, остальные не трогаем. Воркеры
+            # стартуют одновременно, колонку мог уже добавить другой
+            try:
+                await conn.execute(text(
+                    f"ALTER TABLE weather_items ADD COLUMN {'IF NOT EXISTS ' if postgres else ''}ingest_key TEXT"
+                ))
+            except OperationalError:
+                # SQLite: duplicate column name
+                if "ingest_key" not in await _column_names(conn, "weather_items"):
+                    raise
+            # Локации, у которых строка загрузки уже есть, пропускаются:
+            # повторный запуск ничего не меняет
+            result = await conn.execute(text("""
+                UPDATE weather_items SET ingest_key = location
+                WHERE id IN (SELECT MAX(id) FROM weather_items GROUP BY location)
+                AND location NOT IN (
+                    SELECT ingest_key FROM weather_items WHERE ingest_key IS NOT NULL
+                )
+            """))
+            if result.rowcount:
+                logger.info(f"Added weather_items.ingest_key, {result.rowcount} rows marked as ingestion rows")
+
+        if postgres:
+            # Секционирование по recorded_at: ключ секции обязан входить в PK
+            await conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS weather_history (
+                    id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+                    location TEXT NOT NULL,
+                    temperature {t['float']},
+                    humidity {t['float']},
+                    wind_speed {t['float']},
+                    recorded_at {t['datetime']} NOT NULL DEFAULT {t['now']},
+                    PRIMARY KEY (id, recorded_at)
+                ) PARTITION BY RANGE (recorded_at)
+            """))
+        else:
+            await conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS weather_history (
+                    id {t['pk']},
+                    location TEXT NOT NULL,
+                    temperature {t['float']},
+                    humidity {t['float']},
+                    wind_speed {t['float']},
+                    recorded_at {t['datetime']} DEFAULT {t['now']}
+                )
+            """))
+        
+        for table in ("weather_rollup_5m", "weather_rollup_hourly", "weather_rollup_daily"):
+            await conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    location TEXT NOT NULL,
+                    metric TEXT NOT NULL,
+                    bucket_start {t['bigint']} NOT NULL,
+                    count INTEGER NOT NULL,
+                    min {t['float']},
+                    max {t['float']},
+                    sum {t['float']},
+                    PRIMARY KEY (location, metric, bucket_start)
+                )
+            """))
+
+            await conn.execute(text(f"""
+                CREATE INDEX IF NOT EXISTS idx_{table}_bucket
+                ON {table}(bucket_start)
+            """))
+
+        await conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS tracked_locations (
+                id {t['pk']},
+                location TEXT NOT NULL UNIQUE,
+                name TEXT,
+                latitude {t['float']} NOT NULL,
+                longitude {t['float']} NOT NULL,
+                is_active BOOLEAN NOT NULL DEFAULT {t['true']},
+                created_at {t['datetime']} DEFAULT {t['now']}
             )
         """))
 
         await conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS weather_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                location TEXT NOT NULL,
-                temperature REAL,
-                humidity REAL,
-                wind_speed REAL,
-                recorded_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            CREATE INDEX IF NOT EXISTS idx_tracked_locations_active
+            ON tracked_locations(is_active)
+        """))
+
+        await conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS task_leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                epoch INTEGER NOT NULL DEFAULT 1,
+                expires_at {t['datetime']} NOT NULL
             )
         """))
-        
+
+        # Ключ для INSERT ... ON CONFLICT (ingest_key) фоновой загрузки.
+        # NULL не конфликтуют: записей API на одну локацию может быть сколько угодно
         await conn.execute(text("""
-            CREATE INDEX IF NOT EXISTS idx_weather_items_location 
+            CREATE UNIQUE INDEX IF NOT EXISTS uq_weather_items_ingest_key
+            ON weather_items(ingest_key)
+        """))
+
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_weather_items_location
             ON weather_items(location)
         """))
         
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_weather_items_timestamp
+            ON weather_items(timestamp, id)
+        """))
+
+        for column in ("temperature", "humidity", "wind_speed"):
+            await conn.execute(text(f"""
+                CREATE INDEX IF NOT EXISTS idx_weather_items_{column}
+                ON weather_items({column})
+            """))
+
         await conn.execute(text("""
             CREATE INDEX IF NOT EXISTS idx_weather_history_location 
             ON weather_history(location)
@@ -63,4 +304,18 @@ async def create_tables_directly():
         await conn.execute(text("""
             CREATE INDEX IF NOT EXISTS idx_weather_history_recorded 
             ON weather_history(recorded_at)
-        """))
\ No newline at end of file
+        """))
+
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_weather_history_location_recorded
+            ON weather_history(location, recorded_at)
+        """))
+
+        if postgres:
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            await ensure_history_partitions(
+                conn,
+                now - timedelta(days=1),
+                now + timedelta(days=settings.HISTORY_PARTITIONS_AHEAD),
+                cached=False,
+            )
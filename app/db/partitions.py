@@ -0,0 +1,63 @@
+import logging
+from datetime import date, datetime, timedelta
+from typing import Set
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# В PostgreSQL weather_history секционирована по recorded_at: одна секция
+# на сутки (UTC). Очистка истории — DROP целой секции вместо DELETE
+PARENT_TABLE = "weather_history"
+PARTITION_PREFIX = f"{PARENT_TABLE}_p"
+
+# Секции, которые этот процесс уже создал или видел
+_known_partitions: Set[date] = set()
+
+
+def partition_name(day: date) -> str:
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def _partition_day(name: str) -> date:
+    return datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d").date()
+
+
+async def ensure_history_partitions(conn, start: datetime, end: datetime, cached: bool = True):
+    # conn — AsyncConnection или AsyncSession на PostgreSQL
+    day = start.date()
+    while day <= end.date():
+        if not cached or day not in _known_partitions:
+            await conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {partition_name(day)}
+                PARTITION OF {PARENT_TABLE}
+                FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')
+            """))
+            _known_partitions.add(day)
+        day += timedelta(days=1)
+
+
+async def drop_history_partitions(conn, cutoff: datetime) -> int:
+    # Удаляет секции, целиком лежащие раньше cutoff. Секция, в которую
+    # попадает cutoff, доживает до следующего прогона
+    result = await conn.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = CAST(:parent AS regclass)
+        ORDER BY c.relname
+    """), {"parent": PARENT_TABLE})
+
+    deleted = 0
+    for name in result.scalars().all():
+        if not name.startswith(PARTITION_PREFIX):
+            continue
+        day = _partition_day(name)
+        if datetime.combine(day + timedelta(days=1), datetime.min.time()) > cutoff:
+            continue
+        rows = (await conn.execute(text(f"SELECT count(*) FROM {name}"))).scalar()
+        await conn.execute(text(f"DROP TABLE {name}"))
+        _known_partitions.discard(day)
+        deleted += rows
+        logger.info(f"Dropped history partition {name} ({rows} rows)")
+    return deleted
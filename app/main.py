@@ -3,11 +3,19 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 
-from app.api import items, tasks, weather
-from app.ws.websocket import websocket_endpoint
-from app.db.db import init_db
+from app.api import items, locations, metrics, tasks, weather
+from app.ws.sse import sse_endpoint
+from app.ws.websocket import manager, websocket_endpoint
+from app.cache.cache import cache
+from app.db.db import close_db, init_db
+from app.metrics import MetricsMiddleware, components
 from app.nats.client import nats_client
+from app.services.hotstore import hot_store
+from app.services.http import http_client
 from app.tasks.task import background_task
+from app.tasks.retention import retention_task
+from app.tasks.writer import weather_writer
+from app.config import settings
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,18 +33,53 @@ async def lifespan(app: FastAPI):
     
     await nats_client.connect()
     logger.info("NATS client инициализирован")
+
+    await cache.start()
+    logger.info("Cache инициализирован")
+
+    await http_client.start()
+    logger.info("HTTP client инициализирован")
+
+    await manager.start()
+    logger.info("WebSocket ping и контроль зависших клиентов запущены")
+    
+    await hot_store.start()
+    logger.info("Прогрев истории в памяти запущен")
+
+    await weather_writer.start()
+    logger.info("Запись показаний запущена")
     
     await background_task.start()
     logger.info("Фоновая загрузка запушена")
+
+    if settings.RETENTION_ENABLED:
+        await retention_task.start()
+        logger.info("Очистка истории запущена")
     
     yield
     
     logger.info("Отключение...")
     
     await background_task.stop()
+
+    # Дописываем накопленные показания, пока кэш и NATS ещё доступны
+    await weather_writer.stop()
+
+    await retention_task.stop()
+
+    await hot_store.stop()
+
+    await http_client.close()
+
+    # Последние события уже разложены по очередям клиентов
+    await manager.stop()
+
+    await cache.close()
     
     await nats_client.disconnect()
 
+    await close_db()
+
 
 app = FastAPI(
     title="Weather Parser API",
@@ -53,11 +96,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    components.add("background_task", background_task.get_metrics)
+    components.add("writer", weather_writer.get_metrics)
+    components.add("retention", retention_task.get_metrics)
+    components.add("nats_publisher", nats_client.publisher.get_metrics)
+    components.add("ws", manager.get_metrics)
+    components.add("hot_store", hot_store.get_metrics)
+    app.include_router(metrics.router)
+
 app.include_router(items.router)
+app.include_router(locations.router)
 app.include_router(tasks.router)
 app.include_router(weather.router)
 
 app.add_api_websocket_route("/ws/items", websocket_endpoint)
+app.add_api_route("/sse/items", sse_endpoint, methods=["GET"])
 
 if __name__ == "__main__":
     import uvicorn
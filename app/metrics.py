@@ -0,0 +1,152 @@
+import time
+from typing import Any, Callable, Dict, List, Tuple
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Метрики Prometheus для GET /metrics. Счётчики горячих путей — здесь,
+# всё, что компоненты уже считают в get_metrics(), отдаёт ComponentCollector
+# в момент scrape без затрат на запросах. Каждый воркер uvicorn считает своё
+
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Время до начала ответа по маршрутам",
+    ["method", "route", "status"],
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Время выполнения SQL",
+    ["engine", "operation"],
+    buckets=FAST_BUCKETS,
+)
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "Ошибки SQL", ["engine", "operation"])
+OPEN_METEO_DURATION = Histogram(
+    "open_meteo_request_duration_seconds",
+    "Запросы к Open-Meteo",
+    ["kind"],
+)
+OPEN_METEO_ERRORS = Counter("open_meteo_errors_total", "Ошибки Open-Meteo", ["kind", "error"])
+NATS_PUBLISH_DURATION = Histogram(
+    "nats_publish_duration_seconds",
+    "Отправка пачки сообщений в NATS (с flush или подтверждениями JetStream)",
+    buckets=FAST_BUCKETS,
+)
+NATS_QUEUE_DELAY = Histogram(
+    "nats_publish_queue_delay_seconds",
+    "Сколько сообщение ждало в очереди публикации",
+    buckets=FAST_BUCKETS,
+)
+NATS_PUBLISH_FAILURES = Counter(
+    "nats_publish_failures_total",
+    "Неудачные публикации: error — будет повтор, dropped — очередь полна, failed — повторы исчерпаны",
+    ["reason"],
+)
+WS_BROADCAST_DURATION = Histogram(
+    "ws_broadcast_duration_seconds",
+    "Раскладка события по очередям WebSocket-клиентов",
+    buckets=FAST_BUCKETS,
+)
+BACKGROUND_TICK_DURATION = Histogram(
+    "background_task_tick_duration_seconds",
+    "Тик фоновой загрузки погоды",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+
+
+class ComponentCollector:
+    # Числовые поля get_metrics() компонентов: weather_<component>_<поле>.
+    # Поля *_total — счётчики, остальные — gauge
+    def __init__(self):
+        self.components: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+
+    def add(self, name: str, get_metrics: Callable[[], Dict[str, Any]]):
+        self.components.append((name, get_metrics))
+
+    def collect(self):
+        for component, get_metrics in self.components:
+            for key, value in get_metrics().items():
+                if isinstance(value, bool):
+                    value = int(value)
+                elif not isinstance(value, (int, float)):
+                    continue
+                name = f"weather_{component}_{key}"
+                if key.endswith("_total"):
+                    yield CounterMetricFamily(name[:-len("_total")], f"{component}.{key}", value=value)
+                else:
+                    yield GaugeMetricFamily(name, f"{component}.{key}", value=value)
+
+
+components = ComponentCollector()
+REGISTRY.register(components)
+
+
+def render() -> Tuple[bytes, str]:
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def instrument_engine(engine: AsyncEngine, name: str):
+    # Время от отправки запроса драйверу до ответа, по первому слову SQL
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        DB_QUERY_DURATION.labels(name, _operation(statement)).observe(time.perf_counter() - started)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        stack = context.connection.info.get("query_started") if context.connection is not None else None
+        if stack:
+            stack.pop()
+        DB_QUERY_ERRORS.labels(name, _operation(context.statement or "")).inc()
+
+
+def _operation(statement: str) -> str:
+    # SELECT/INSERT/UPDATE/DELETE/PRAGMA..., без роста числа меток
+    return statement.lstrip().split(None, 1)[0].upper()[:16] if statement.strip() else "UNKNOWN"
+
+
+class MetricsMiddleware:
+    # ASGI, а не BaseHTTPMiddleware: без лишней задачи на запрос и без
+    # буферизации потоков. Время — до начала ответа, так что /sse/items
+    # не копит часы. Метка route — шаблон пути, а не сам путь
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        observed = False
+
+        def observe(status: int):
+            nonlocal observed
+            if observed:
+                return
+            observed = True
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                str(status),
+            ).observe(time.perf_counter() - started)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            observe(500)
+            raise
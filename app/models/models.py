@@ -1,6 +1,6 @@
 from sqlalchemy.orm import declarative_base
 
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean
 from sqlalchemy.sql import func
 
 Base = declarative_base()
@@ -13,7 +13,10 @@ class WeatherItem(Base):
     temperature = Column(Float)
     humidity = Column(Float)
     wind_speed = Column(Float)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(DateTime, server_default=func.now())
+    # Строка фоновой загрузки для локации (ключ upsert); у записей,
+    # созданных через API, NULL
+    ingest_key = Column(String, unique=True)
     
     def to_dict(self):
         return {
@@ -34,7 +37,7 @@ class WeatherHistory(Base):
     temperature = Column(Float)
     humidity = Column(Float)
     wind_speed = Column(Float)
-    recorded_at = Column(DateTime(timezone=True), server_default=func.now())
+    recorded_at = Column(DateTime, server_default=func.now())
 
     def to_dict(self):
         return {
@@ -44,4 +47,64 @@ class WeatherHistory(Base):
             "humidity": self.humidity,
             "wind_speed": self.wind_speed,
             "recorded_at": self.recorded_at.isoformat() if self.recorded_at else None,
-        }
\ No newline at end of file
+        }
+
+
+class TrackedLocation(Base):
+    __tablename__ = "tracked_locations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    location = Column(String, unique=True, nullable=False)
+    name = Column(String)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    is_active = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime, server_default=func.now())
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "location": self.location,
+            "name": self.name,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "is_active": self.is_active,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+
+
+# Аренда фоновой задачи: её выполняет только держатель. epoch растёт при
+# каждой смене держателя
+class TaskLease(Base):
+    __tablename__ = "task_leases"
+
+    name = Column(String, primary_key=True)
+    holder = Column(String, nullable=False)
+    epoch = Column(Integer, nullable=False, default=1)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class WeatherRollupMixin:
+    location = Column(String, primary_key=True)
+    metric = Column(String, primary_key=True)
+    bucket_start = Column(Integer, primary_key=True)  # unix seconds
+    count = Column(Integer, nullable=False)
+    min = Column(Float)
+    max = Column(Float)
+    sum = Column(Float)
+
+
+class WeatherRollup5m(WeatherRollupMixin, Base):
+    __tablename__ = "weather_rollup_5m"
+    bucket_seconds = 300
+
+
+class WeatherRollupHourly(WeatherRollupMixin, Base):
+    __tablename__ = "weather_rollup_hourly"
+    bucket_seconds = 3600
+
+
+class WeatherRollupDaily(WeatherRollupMixin, Base):
+    __tablename__ = "weather_rollup_daily"
+    bucket_seconds = 86400
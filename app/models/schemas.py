@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Optional, List, Dict
 from datetime import datetime
 
 
@@ -24,11 +24,182 @@ class WeatherResponse(WeatherBase):
         from_attributes = True
 
 
+class BulkItemUpdate(WeatherUpdate):
+    id: int
+
+
+class BulkDelete(BaseModel):
+    ids: List[int]
+
+
+class BulkError(BaseModel):
+    index: int
+    id: Optional[int] = None
+    detail: str
+
+
+class BulkResult(BaseModel):
+    items: List[WeatherResponse] = []
+    deleted: List[int] = []
+    errors: List[BulkError] = []
+
+
+class LocationCreate(BaseModel):
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+    name: Optional[str] = None
+    is_active: bool = True
+
+
+class LocationUpdate(BaseModel):
+    name: Optional[str] = None
+    is_active: Optional[bool] = None
+
+
+class LocationResponse(BaseModel):
+    id: int
+    location: str
+    name: Optional[str] = None
+    latitude: float
+    longitude: float
+    is_active: bool
+
+    class Config:
+        from_attributes = True
+
+
 class TaskResponse(BaseModel):
     message: str
     task_id: Optional[str] = None
 
 
+class TaskMetrics(BaseModel):
+    is_leader: bool
+    leader: Optional[str] = None
+    lease_epoch: int = 0
+    lease_acquired_total: int = 0
+    lease_lost_total: int = 0
+    is_running: bool
+    interval: int
+    min_interval: float
+    max_interval: float
+    concurrency: int
+    scheduled_locations: int = 0
+    next_due_in: Optional[float] = None
+    interval_min: Optional[float] = None
+    interval_avg: Optional[float] = None
+    interval_max: Optional[float] = None
+    interval_faster_total: int = 0
+    interval_slower_total: int = 0
+    breaker_state: str
+    breaker_open: bool
+    breaker_failures: int
+    breaker_retry_in: float
+    breaker_opened_total: int
+    breaker_rejected_total: int
+    tick_count: int
+    last_tick_started_at: Optional[datetime] = None
+    last_tick_duration: Optional[float] = None
+    last_tick_locations: int
+    last_tick_failed: int
+    pending_locations: int
+
+
+class WriterMetrics(BaseModel):
+    is_running: bool
+    batch_size: int
+    window: float
+    pending_rows: int
+    flush_count: int
+    rows_written: int
+    rows_failed: int
+    last_flush_rows: int
+    last_flush_duration: Optional[float] = None
+
+
+class PublisherMetrics(BaseModel):
+    connected: bool
+    jetstream: bool
+    overflow: str
+    queue_depth: int
+    queue_size: int
+    published_total: int
+    dropped_total: int
+    spilled_total: int
+    replayed_total: int
+    retries_total: int
+    failed_total: int
+    batch_count: int
+    last_batch_size: int
+    last_publish_latency: Optional[float] = None
+    avg_publish_latency: Optional[float] = None
+    last_queue_delay: Optional[float] = None
+
+
+class WebSocketMetrics(BaseModel):
+    connections: int
+    connections_total: int
+    topics: int
+    evicted_total: int
+    slow_policy: str
+    queue_size: int
+    queued_frames: int
+    max_queue_depth: int
+    frames_sent_total: int
+    frames_dropped_total: int
+    frames_coalesced_total: int
+    broadcast_count: int
+    remote_events_total: int
+    updates_coalesced_total: int
+    pending_updates: int
+    last_broadcast_recipients: int
+    last_broadcast_duration: Optional[float] = None
+    stream_id: str
+    seq: int
+    replay_buffered: int
+    resumed_total: int
+    replayed_total: int
+    snapshots_total: int
+
+
+class HotStoreMetrics(BaseModel):
+    enabled: bool
+    is_ready: bool
+    hours: int
+    capacity: int
+    locations: int
+    max_locations: int
+    readings: int
+    bytes: int
+    max_bytes: int
+    sync_lag: Optional[float] = None
+    last_sync_duration: Optional[float] = None
+    warm_rows: int
+    warm_duration: Optional[float] = None
+    hits_total: int
+    misses_total: int
+    appended_total: int
+    rejected_total: int
+    synced_rows_total: int
+
+
+class RetentionMetrics(BaseModel):
+    is_leader: bool
+    leader: Optional[str] = None
+    lease_epoch: int = 0
+    lease_acquired_total: int = 0
+    lease_lost_total: int = 0
+    is_running: bool
+    interval: int
+    run_count: int
+    last_run_started_at: Optional[datetime] = None
+    last_run_duration: Optional[float] = None
+    last_rows_deleted: Dict[str, int]
+    rows_deleted_total: int
+    last_bytes_reclaimed: int
+    bytes_reclaimed_total: int
+
+
 class WebSocketMessage(BaseModel):
     type: str
     data: dict
@@ -1,9 +1,11 @@
 import asyncio
-import json
 import logging
-from typing import Optional
+import uuid
+from typing import Any, Optional, Union
 from nats.aio.client import Client as NATS
+from app.codecs import Frame, codec_for_content_type, get_codec
 from app.config import settings
+from app.nats.publisher import NATSPublisher
 
 logger = logging.getLogger(__name__)
 
@@ -11,84 +13,148 @@ logger = logging.getLogger(__name__)
 class NATSClient:
     def __init__(self):
         self.nc: Optional[NATS] = None
+        self.js = None
         self.is_connected = False
+        self.stream_subjects = set()
+        self._subscriptions = []
+        self.codec = get_codec(settings.NATS_CODEC)
+        # Метка процесса в событиях items/weather: воркер не рассылает
+        # своим WebSocket-клиентам то, что сам опубликовал
+        self.origin = uuid.uuid4().hex
+        self.publisher = NATSPublisher(self)
+
+    @property
+    def connected(self) -> bool:
+        return self.nc is not None and self.nc.is_connected
     
     async def connect(self):
+        await self._open()
+        # Публикации идут через очередь и тогда, когда NATS пока недоступен
+        self.publisher.start()
+
+    async def _open(self):
         try:
             self.nc = NATS()
             await self.nc.connect(servers=[settings.NATS_URL])
             self.is_connected = True
             logger.info(f"Connected to NATS at {settings.NATS_URL}")
+
+            if settings.NATS_JETSTREAM:
+                await self._ensure_stream()
             
-            await self.subscribe_items()
+            for subject, handler in self._subscriptions:
+                await self._subscribe(subject, handler)
             
         except Exception as e:
             logger.error(f"Failed to connect to NATS: {e}")
+            self.nc = None
             self.is_connected = False
+
+    async def _ensure_stream(self):
+        self.js = self.nc.jetstream()
+        subjects = [settings.NATS_TOPIC_ITEMS, settings.NATS_TOPIC_WEATHER]
+        try:
+            await self.js.add_stream(name=settings.NATS_STREAM, subjects=subjects)
+        except Exception:
+            # Стрим уже есть с другими настройками
+            await self.js.update_stream(name=settings.NATS_STREAM, subjects=subjects)
+        self.stream_subjects = set(subjects)
+
+    async def wait_connected(self):
+        if self.nc is None or self.nc.is_closed:
+            # Первое подключение не удалось или клиент исчерпал попытки
+            # переподключения — пробуем заново
+            await asyncio.sleep(settings.NATS_RECONNECT_INTERVAL)
+            await self._open()
+        else:
+            # Клиент переподключается сам
+            await asyncio.sleep(0.2)
     
     async def disconnect(self):
+        await self.publisher.stop()
         if self.nc and self.is_connected:
             await self.nc.drain()
             await self.nc.close()
             self.is_connected = False
             logger.info("Disconnected from NATS")
     
-    async def publish(self, subject: str, message: dict):
-        if not self.nc or not self.is_connected:
-            logger.warning("NATS not connected, skipping publish")
-            return
-        
-        try:
-            await self.nc.publish(
-                subject,
-                json.dumps(message).encode()
-            )
-            logger.debug(f"Published to {subject}: {message}")
-        except Exception as e:
-            logger.error(f"Failed to publish to NATS: {e}")
+    async def publish(self, subject: str, message: Union[dict, Frame]):
+        # Не ждёт брокера: сообщение уходит в очередь публикации.
+        # Frame кодируется один раз, те же байты получают и WebSocket-клиенты
+        if not isinstance(message, Frame):
+            message = Frame(message)
+        await self.publisher.enqueue(subject, message.encode(self.codec), self.codec.content_type)
+
+    @staticmethod
+    def decode(msg) -> Any:
+        content_type = msg.headers.get("Content-Type") if msg.headers else None
+        return codec_for_content_type(content_type).decode(msg.data)
     
-    async def subscribe_items(self):
-        if not self.nc or not self.is_connected:
+    async def subscribe(self, subject: str, handler):
+        self._subscriptions.append((subject, handler))
+        if not self.connected:
+            logger.warning(f"NATS not connected, will subscribe to {subject} after connect")
             return
-        
+        await self._subscribe(subject, handler)
+
+    async def _subscribe(self, subject: str, handler):
+        # Если обработчик вернул ответ, а сообщение — запрос (request),
+        # ответ уходит отправителю
         async def message_handler(msg):
             try:
-                data = json.loads(msg.data.decode())
-                logger.info(f"Received NATS message from {msg.subject}: {data}")
-                
+                reply = await handler(self.decode(msg))
+                if msg.reply and reply is not None:
+                    await self.nc.publish(msg.reply, Frame(reply).encode(self.codec), headers=self._headers)
             except Exception as e:
-                logger.error(f"Error processing NATS message: {e}")
-        
-        await self.nc.subscribe(
-            settings.NATS_TOPIC_ITEMS,
-            cb=message_handler
-        )
+                logger.error(f"Error processing NATS message from {msg.subject}: {e}")
 
-        await self.nc.subscribe(
-            settings.NATS_TOPIC_WEATHER,
-            cb=message_handler
+        await self.nc.subscribe(subject, cb=message_handler)
+
+    async def request(self, subject: str, message: dict, timeout: float) -> Any:
+        # Запрос-ответ мимо очереди публикации: отправителю нужен ответ,
+        # а не доставка когда-нибудь. ConnectionError — NATS недоступен
+        if not self.connected:
+            raise ConnectionError("NATS not connected")
+        msg = await self.nc.request(
+            subject, Frame(message).encode(self.codec), timeout=timeout, headers=self._headers
         )
-    
+        return self.decode(msg)
+
+    @property
+    def _headers(self) -> dict:
+        return {"Content-Type": self.codec.content_type}
+
     async def publish_item_update(self, item_id: int, action: str, data: dict):
         message = {
             "action": action,
             "item_id": item_id,
             "data": data,
+            "origin": self.origin,
             "timestamp": asyncio.get_event_loop().time()
         }
         await self.publish(settings.NATS_TOPIC_ITEMS, message)
     
+    async def publish_items_batch(self, action: str, items: list):
+        message = {
+            "action": action,
+            "items": items,
+            "origin": self.origin,
+            "timestamp": asyncio.get_event_loop().time()
+        }
+        await self.publish(settings.NATS_TOPIC_ITEMS, message)
+
     async def publish_weather_update(self, weather_data: dict):
         message = {
             "type": "weather_update",
             "data": weather_data,
+            "origin": self.origin,
             "timestamp": asyncio.get_event_loop().time()
         }
         await self.publish(settings.NATS_TOPIC_WEATHER, message)
 
 nats_client = NATSClient()
 
-from typing import Dict, Any
+from typing import Dict, Any, List
 
 # Сервис NATS
 class NATSService:
@@ -109,13 +175,17 @@ class NATSService:
         )
     
     @staticmethod
-    async def publish_item_deleted(item_id: int):
+    async def publish_item_deleted(item_id: int, item_data: Optional[Dict[str, Any]] = None):
         await nats_client.publish_item_update(
             item_id, 
             "deleted", 
-            {}
+            item_data or {}
         )
     
+    @staticmethod
+    async def publish_items_batch(action: str, items: List[Dict[str, Any]]):
+        await nats_client.publish_items_batch(action, items)
+    
     @staticmethod
     async def publish_weather_data(weather_data: Dict[str, Any]):
         await nats_client.publish_weather_update(weather_data)
\ No newline at end of file
@@ -0,0 +1,325 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from app.config import settings
+from app.metrics import NATS_PUBLISH_DURATION, NATS_PUBLISH_FAILURES, NATS_QUEUE_DELAY
+
+logger = logging.getLogger(__name__)
+
+DROP = "drop"
+BLOCK = "block"
+SPILL = "spill"
+
+# Пауза после непредвиденной ошибки в цикле отправки
+ERROR_BACKOFF = 1.0
+
+
+class OutboundMessage:
+    __slots__ = ("subject", "payload", "content_type", "msg_id", "enqueued_at")
+
+    def __init__(
+        self,
+        subject: str,
+        payload: bytes,
+        content_type: str = "application/json",
+        msg_id: Optional[str] = None,
+    ):
+        self.subject = subject
+        self.payload = payload
+        self.content_type = content_type
+        # Nats-Msg-Id: JetStream отбрасывает дубли при повторной отправке
+        self.msg_id = msg_id or uuid.uuid4().hex
+        self.enqueued_at = time.monotonic()
+
+    def to_line(self) -> str:
+        return json.dumps({
+            "subject": self.subject,
+            "payload": base64.b64encode(self.payload).decode(),
+            "content_type": self.content_type,
+            "msg_id": self.msg_id,
+        }) + "\n"
+
+    @classmethod
+    def from_line(cls, line: str) -> "OutboundMessage":
+        data = json.loads(line)
+        if "content_type" not in data:
+            # Файл, записанный до появления кодеков: JSON текстом
+            return cls(data["subject"], data["payload"].encode(), msg_id=data["msg_id"])
+        return cls(
+            data["subject"],
+            base64.b64decode(data["payload"]),
+            data["content_type"],
+            data["msg_id"],
+        )
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Content-Type": self.content_type}
+
+
+# Очередь исходящих сообщений: обработчики запросов только кладут в неё,
+# отдельная задача отправляет пачками. Пока NATS недоступен, сообщения
+# копятся; при переполнении — NATS_OVERFLOW (drop | block | spill на диск)
+class NATSPublisher:
+    def __init__(self, client):
+        self.client = client
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.NATS_QUEUE_SIZE)
+        self.overflow = settings.NATS_OVERFLOW
+        self.batch_size = settings.NATS_PUBLISH_BATCH
+        self.spill_path = settings.NATS_SPILL_PATH
+        self.task: Optional[asyncio.Task] = None
+        # Неотправленные из прошлой пачки уходят первыми
+        self._retry: Deque[OutboundMessage] = deque()
+        self._replay_path: Optional[str] = None
+
+        # Метрики
+        self.published_total = 0
+        self.dropped_total = 0
+        self.spilled_total = 0
+        self.replayed_total = 0
+        self.retries_total = 0
+        self.failed_total = 0
+        self.batch_count = 0
+        self.last_batch_size = 0
+        self.last_publish_latency: Optional[float] = None
+        self.avg_publish_latency: Optional[float] = None
+        self.last_queue_delay: Optional[float] = None
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize() + len(self._retry)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "connected": self.client.connected,
+            "jetstream": settings.NATS_JETSTREAM,
+            "overflow": self.overflow,
+            "queue_depth": self.depth,
+            "queue_size": self.queue.maxsize,
+            "published_total": self.published_total,
+            "dropped_total": self.dropped_total,
+            "spilled_total": self.spilled_total,
+            "replayed_total": self.replayed_total,
+            "retries_total": self.retries_total,
+            "failed_total": self.failed_total,
+            "batch_count": self.batch_count,
+            "last_batch_size": self.last_batch_size,
+            "last_publish_latency": self.last_publish_latency,
+            "avg_publish_latency": self.avg_publish_latency,
+            "last_queue_delay": self.last_queue_delay,
+        }
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Даём очереди разойтись за NATS_DRAIN_TIMEOUT, остаток — на диск
+        # (при spill) или в потери
+        if self.task is None:
+            return
+        deadline = time.monotonic() + settings.NATS_DRAIN_TIMEOUT
+        while self.depth and self.client.connected and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+        left = list(self._retry)
+        self._retry.clear()
+        while not self.queue.empty():
+            left.append(self.queue.get_nowait())
+        if left:
+            if self.overflow == SPILL:
+                await self._spill(left)
+            else:
+                self.dropped_total += len(left)
+                logger.warning(f"NATS publisher stopped with {len(left)} unsent messages")
+
+    async def enqueue(self, subject: str, payload: bytes, content_type: str):
+        message = OutboundMessage(subject, payload, content_type)
+        if self.overflow == BLOCK:
+            await self.queue.put(message)
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            if self.overflow == SPILL:
+                await self._spill([message])
+            else:
+                self.dropped_total += 1
+                NATS_PUBLISH_FAILURES.labels("dropped").inc()
+                logger.warning(f"NATS outbound queue full, dropping message to {subject}")
+
+    async def _run(self):
+        while True:
+            batch = None
+            try:
+                if not self.client.connected:
+                    await self.client.wait_connected()
+                    continue
+
+                if not self._retry and self._replay_path is None and self._has_spill():
+                    await self._load_spill()
+
+                batch = await self._next_batch()
+                started = time.monotonic()
+                self.last_queue_delay = started - min(message.enqueued_at for message in batch)
+                unsent = await self._publish_batch(batch)
+                sent = len(batch) - len(unsent)
+                batch = None
+                latency = time.monotonic() - started
+                self._record_latency(latency, sent)
+                NATS_PUBLISH_DURATION.observe(latency)
+                NATS_QUEUE_DELAY.observe(self.last_queue_delay)
+                if unsent:
+                    self._retry.extendleft(reversed(unsent))
+                elif self._replay_path is not None and not self._retry:
+                    # Всё прочитанное с диска отправлено
+                    os.remove(self._replay_path)
+                    self._replay_path = None
+            except Exception as e:
+                # Цикл не должен умирать: иначе публикация встанет до рестарта
+                logger.error(f"NATS publisher loop failed: {e}")
+                if batch:
+                    self._retry.extendleft(reversed(batch))
+                await asyncio.sleep(ERROR_BACKOFF)
+
+    async def _next_batch(self) -> List[OutboundMessage]:
+        batch = []
+        while self._retry and len(batch) < self.batch_size:
+            batch.append(self._retry.popleft())
+        if not batch:
+            batch.append(await self.queue.get())
+        while len(batch) < self.batch_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _publish_batch(self, batch: List[OutboundMessage]) -> List[OutboundMessage]:
+        # Возвращает сообщения, которые надо повторить после переподключения
+        if settings.NATS_JETSTREAM:
+            return await self._publish_jetstream(batch)
+
+        nc = self.client.nc
+        for index, message in enumerate(batch):
+            try:
+                await nc.publish(message.subject, message.payload, headers=message.headers)
+            except Exception as e:
+                NATS_PUBLISH_FAILURES.labels("error").inc(len(batch) - index)
+                logger.error(f"Failed to publish to NATS: {e}")
+                return batch[index:]
+        try:
+            # Один PING/PONG на пачку: сервер получил всё, что выше
+            await nc.flush(timeout=settings.NATS_ACK_TIMEOUT)
+        except Exception as e:
+            # Дошла ли пачка, неизвестно: в published_total не считаем
+            logger.warning(f"NATS flush failed, {len(batch)} messages unconfirmed: {e}")
+            return []
+        self.published_total += len(batch)
+        return []
+
+    async def _publish_jetstream(self, batch: List[OutboundMessage]) -> List[OutboundMessage]:
+        pending = batch
+        for attempt in range(settings.NATS_PUBLISH_RETRIES + 1):
+            if attempt:
+                self.retries_total += len(pending)
+                await asyncio.sleep(min(0.1 * 2 ** attempt, 2.0))
+            if not self.client.connected:
+                return pending
+
+            results = await asyncio.gather(
+                *(self._publish_acked(message) for message in pending),
+                return_exceptions=True,
+            )
+            errors = [error for error in results if error is not None]
+            failed = [message for message, error in zip(pending, results) if error is not None]
+            self.published_total += len(pending) - len(failed)
+            if not failed:
+                return []
+            NATS_PUBLISH_FAILURES.labels("error").inc(len(failed))
+            logger.warning(f"JetStream publish failed for {len(failed)} messages: {errors[0]!r}")
+            pending = failed
+
+        if not self.client.connected:
+            return pending
+        self.failed_total += len(pending)
+        NATS_PUBLISH_FAILURES.labels("failed").inc(len(pending))
+        logger.error(f"Giving up on {len(pending)} JetStream messages")
+        return []
+
+    async def _publish_acked(self, message: OutboundMessage):
+        if message.subject not in self.client.stream_subjects:
+            # Служебные темы (инвалидация кэша) не пишутся в стрим
+            await self.client.nc.publish(message.subject, message.payload, headers=message.headers)
+            return None
+        await self.client.js.publish(
+            message.subject,
+            message.payload,
+            timeout=settings.NATS_ACK_TIMEOUT,
+            headers={**message.headers, "Nats-Msg-Id": message.msg_id},
+        )
+        return None
+
+    def _record_latency(self, latency: float, published: int):
+        if not published:
+            return
+        self.batch_count += 1
+        self.last_batch_size = published
+        self.last_publish_latency = latency
+        if self.avg_publish_latency is None:
+            self.avg_publish_latency = latency
+        else:
+            self.avg_publish_latency += 0.1 * (latency - self.avg_publish_latency)
+
+    async def _spill(self, messages: List[OutboundMessage]):
+        lines = "".join(message.to_line() for message in messages)
+
+        def append():
+            with open(self.spill_path, "a") as f:
+                f.write(lines)
+
+        await asyncio.to_thread(append)
+        self.spilled_total += len(messages)
+
+    def _has_spill(self) -> bool:
+        return os.path.exists(self.spill_path + ".replay") or os.path.exists(self.spill_path)
+
+    async def _load_spill(self):
+        # Файл переименовывается, новые сообщения пишутся в свежий. .replay
+        # удаляется только после отправки, так что после падения процесса
+        # он дочитывается заново (JetStream отбросит дубли по Nats-Msg-Id)
+        replay_path = self.spill_path + ".replay"
+        if not os.path.exists(replay_path):
+            os.replace(self.spill_path, replay_path)
+
+        def read():
+            messages, skipped = [], 0
+            with open(replay_path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        messages.append(OutboundMessage.from_line(line))
+                    except (ValueError, KeyError, TypeError):
+                        # Оборванная при падении процесса последняя строка
+                        skipped += 1
+            return messages, skipped
+
+        messages, skipped = await asyncio.to_thread(read)
+        if skipped:
+            logger.warning(f"Skipped {skipped} undecodable lines in {replay_path}")
+        logger.info(f"Replaying {len(messages)} spilled NATS messages")
+        self.replayed_total += len(messages)
+        self._retry.extend(messages)
+        self._replay_path = replay_path
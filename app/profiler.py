@@ -0,0 +1,48 @@
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+# Семплирующий профайлер без зависимостей: отдельный поток раз в interval
+# снимает стеки через sys._current_frames() и копит их в формате
+# collapsed stacks ("a;b;c N") — его читают flamegraph.pl, speedscope
+# и inferno. Сервис продолжает работать, цена — один проход по стекам
+# на семпл. Одновременно идёт не больше одного профиля
+
+_lock = threading.Lock()
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+
+def _sample(seconds: float, interval: float, thread_id: Optional[int]) -> str:
+    stacks: Counter = Counter()
+    own = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == own or (thread_id is not None and ident != thread_id):
+                continue
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            stacks[";".join(reversed(names))] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+async def profile(seconds: float, interval: float, all_threads: bool = False) -> str:
+    # По умолчанию — только поток event loop, где идёт вся работа сервиса
+    if not _lock.acquire(blocking=False):
+        raise RuntimeError("Profile is already running")
+    try:
+        thread_id = None if all_threads else threading.get_ident()
+        return await asyncio.to_thread(_sample, seconds, interval, thread_id)
+    finally:
+        _lock.release()
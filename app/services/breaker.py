@@ -0,0 +1,87 @@
+import logging
+import time
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+
+# closed -> open после threshold ошибок подряд. Пока open, запросы не
+# уходят вовсе; по истечении паузы — half_open, пропускается один пробный
+# запрос. Удача закрывает цепь, неудача снова открывает её с удвоенной
+# паузой (до max_backoff). threshold=0 — выключено
+class CircuitBreaker:
+    def __init__(self, name: str, threshold: int, backoff: float, max_backoff: float):
+        self.name = name
+        self.threshold = threshold
+        self.base_backoff = backoff
+        self.max_backoff = max(max_backoff, backoff)
+        self.state = "closed"
+        self.failures = 0
+        self.backoff = backoff
+        self.open_until = 0.0
+        self.probing = False
+
+        # Метрики
+        self.opened_total = 0
+        self.rejected_total = 0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() < self.open_until:
+                self.rejected_total += 1
+                return False
+            self.state = "half_open"
+            logger.info(f"Circuit {self.name} half-open, probing")
+        if self.probing:
+            self.rejected_total += 1
+            return False
+        self.probing = True
+        return True
+
+    def retry_in(self) -> float:
+        # Сколько ждать, прежде чем запрос пропустят
+        if self.state == "open":
+            return max(self.open_until - time.monotonic(), 0.0)
+        if self.probing:
+            # Проба уже идёт, её исход станет известен не сразу
+            return self.base_backoff
+        return 0.0
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"Circuit {self.name} closed")
+        self.state = "closed"
+        self.failures = 0
+        self.backoff = self.base_backoff
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open":
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+            self._open()
+        elif self.state == "closed" and 0 < self.threshold <= self.failures:
+            self._open()
+
+    def release(self):
+        # Запрос отменён, исход неизвестен: пробу можно повторить
+        self.probing = False
+
+    def _open(self):
+        self.state = "open"
+        self.probing = False
+        self.open_until = time.monotonic() + self.backoff
+        self.opened_total += 1
+        logger.warning(f"Circuit {self.name} open for {self.backoff:.1f}s after {self.failures} failures")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "breaker_state": self.state,
+            "breaker_open": self.state != "closed",
+            "breaker_failures": self.failures,
+            "breaker_retry_in": self.retry_in(),
+            "breaker_opened_total": self.opened_total,
+            "breaker_rejected_total": self.rejected_total,
+        }
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HIT = "HIT"
+MISS = "MISS"
+STALE = "STALE"
+FALLBACK = "FALLBACK"
+
+
+# In-process TTL кэш с LRU вытеснением и склейкой одновременных промахов
+class TTLCache:
+    def __init__(self, ttl: float, maxsize: int, stale_ttl: float = 0.0):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stale_ttl = stale_ttl
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        age = time.monotonic() - stored_at
+        if age > self.ttl + self.stale_ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value, age
+
+    def set(self, key: str, value: Any):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: str):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Optional[Any]]],
+    ) -> Tuple[Optional[Any], float, str]:
+        # Возвращает (value, age, status). None от loader не кэшируется
+        entry = self.get(key)
+        if entry is not None:
+            value, age = entry
+            if age <= self.ttl:
+                return value, age, HIT
+            # stale-while-revalidate: отдаём старое, обновляем в фоне
+            self._load(key, loader)
+            return value, age, STALE
+
+        value = await asyncio.shield(self._load(key, loader))
+        return value, 0.0, MISS
+
+    def _load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Optional[Any]]],
+    ) -> asyncio.Future:
+        future = self._inflight.get(key)
+        if future is not None:
+            return future
+
+        async def run():
+            try:
+                value = await loader()
+                if value is not None:
+                    self.set(key, value)
+                return value
+            except Exception as e:
+                logger.error(f"Cache loader failed for {key}: {e}")
+                return None
+            finally:
+                self._inflight.pop(key, None)
+
+        future = asyncio.ensure_future(run())
+        self._inflight[key] = future
+        return future
@@ -0,0 +1,353 @@
+import argparse
+import asyncio
+import csv
+import io
+import json
+import logging
+import re
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import numpy as np
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.db import async_session_maker, close_db, init_db, read_session_maker, epoch_bucket
+from app.db.partitions import ensure_history_partitions
+from app.models.models import WeatherHistory
+from app.services.rollups import aggregate_from_rollup, apply_readings, choose_rollup
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = {
+    "1m": 60,
+    "5m": 300,
+    "15m": 900,
+    "1h": 3600,
+    "6h": 21600,
+    "1d": 86400,
+}
+METRICS = ("temperature", "humidity", "wind_speed")
+SQL_AGGREGATES = {
+    "min": func.min,
+    "max": func.max,
+    "avg": func.avg,
+    "sum": func.sum,
+}
+EXPORT_COLUMNS = [
+    WeatherHistory.id,
+    WeatherHistory.location,
+    WeatherHistory.temperature,
+    WeatherHistory.humidity,
+    WeatherHistory.wind_speed,
+    WeatherHistory.recorded_at,
+]
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 10000
+HISTORY_COLUMNS = ["location", "temperature", "humidity", "wind_speed", "recorded_at"]
+# Меньше этого числа строк COPY не окупается, идём обычным INSERT
+COPY_MIN_ROWS = 100
+PERCENTILE_RE = re.compile(r"^p(\d{1,2}(\.\d+)?)$")
+
+
+def parse_aggregates(agg: str) -> List[str]:
+    names = [name.strip() for name in agg.split(",") if name.strip()]
+    for name in names:
+        if name not in SQL_AGGREGATES and name != "count" and not PERCENTILE_RE.match(name):
+            raise ValueError(f"Unknown aggregate: {name}")
+    return names
+
+
+def _grouped_percentiles(
+    buckets: np.ndarray,
+    values: np.ndarray,
+    starts: np.ndarray,
+    quantiles: List[float],
+) -> Dict[float, List[Optional[float]]]:
+    # Векторный перцентиль (линейная интерполяция, как np.percentile) для всех
+    # бакетов сразу: сортируем по (bucket, value) и индексируем границы групп
+    mask = ~np.isnan(values)
+    buckets, values = buckets[mask], values[mask]
+    order = np.lexsort((values, buckets))
+    buckets, values = buckets[order], values[order]
+
+    group_ids = np.searchsorted(buckets, starts)
+    group_ends = np.searchsorted(buckets, starts, side="right")
+    counts = group_ends - group_ids
+    empty = counts == 0
+
+    result = {}
+    for q in quantiles:
+        position = group_ids + q * np.maximum(counts - 1, 0)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        lower = np.minimum(lower, max(len(values) - 1, 0))
+        upper = np.minimum(upper, max(len(values) - 1, 0))
+        if len(values):
+            weight = position - lower
+            series = values[lower] * (1 - weight) + values[upper] * weight
+        else:
+            series = np.full(len(starts), np.nan)
+        series = np.where(empty, np.nan, series)
+        result[q] = [None if np.isnan(v) else float(v) for v in series]
+    return result
+
+
+async def aggregate_history(
+    session: AsyncSession,
+    since: datetime,
+    bucket: str,
+    aggregates: List[str],
+    metrics: List[str],
+    location: Optional[str] = None,
+) -> Dict[str, Any]:
+    seconds = BUCKETS[bucket]
+    window = (datetime.now(timezone.utc).replace(tzinfo=None) - since).total_seconds()
+    rollup = choose_rollup(seconds, aggregates, window)
+    if rollup is not None:
+        data = await aggregate_from_rollup(
+            session, rollup, since, seconds, aggregates, metrics, location
+        )
+        starts = data.pop("starts")
+        return {
+            "location": location,
+            "bucket": bucket,
+            "bucket_seconds": seconds,
+            "source": rollup.__tablename__,
+            "timestamps": [
+                datetime.fromtimestamp(start, tz=timezone.utc).isoformat() for start in starts
+            ],
+            **data,
+        }
+
+    bucket_start = epoch_bucket(session, WeatherHistory.recorded_at, seconds).label("bucket")
+    conditions = [WeatherHistory.recorded_at >= since]
+    if location is not None:
+        conditions.append(WeatherHistory.location == location)
+
+    columns = [bucket_start, func.count().label("count")]
+    for metric in metrics:
+        column = getattr(WeatherHistory, metric)
+        for name in aggregates:
+            if name in SQL_AGGREGATES:
+                columns.append(SQL_AGGREGATES[name](column).label(f"{metric}__{name}"))
+
+    percentiles = [name for name in aggregates if PERCENTILE_RE.match(name)]
+    native_percentiles = session.bind.dialect.name == "postgresql"
+    if native_percentiles:
+        for metric in metrics:
+            column = getattr(WeatherHistory, metric)
+            for name in percentiles:
+                q = float(name[1:]) / 100
+                columns.append(
+                    func.percentile_cont(q).within_group(column).label(f"{metric}__{name}")
+                )
+
+    stmt = select(*columns).where(*conditions).group_by(bucket_start).order_by(bucket_start)
+    result = await session.execute(stmt)
+    rows = result.all()
+
+    starts = [row.bucket for row in rows]
+    response: Dict[str, Any] = {
+        "location": location,
+        "bucket": bucket,
+        "bucket_seconds": seconds,
+        "source": WeatherHistory.__tablename__,
+        "timestamps": [
+            datetime.fromtimestamp(start, tz=timezone.utc).isoformat() for start in starts
+        ],
+        "count": [row.count for row in rows],
+    }
+    for metric in metrics:
+        response[metric] = {
+            name: [getattr(row, f"{metric}__{name}") for row in rows]
+            for name in aggregates
+            if name in SQL_AGGREGATES or (native_percentiles and name in percentiles)
+        }
+
+    if percentiles and not native_percentiles and rows:
+        # SQLite не умеет перцентили: забираем только (bucket, значения)
+        # Core-строками и считаем в NumPy
+        raw = await session.execute(
+            select(bucket_start, *(getattr(WeatherHistory, metric) for metric in metrics))
+            .where(*conditions)
+        )
+        data = np.array(
+            [tuple(np.nan if v is None else v for v in row) for row in raw],
+            dtype=np.float64,
+        ).reshape(-1, len(metrics) + 1)
+        bucket_values = data[:, 0].astype(np.int64)
+        start_array = np.array(starts, dtype=np.int64)
+        quantiles = [float(name[1:]) / 100 for name in percentiles]
+
+        for index, metric in enumerate(metrics, start=1):
+            computed = _grouped_percentiles(bucket_values, data[:, index], start_array, quantiles)
+            for name, q in zip(percentiles, quantiles):
+                response[metric][name] = computed[q]
+
+    return response
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # recorded_at хранится наивным UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+async def insert_history(session: AsyncSession, rows: List[Dict[str, Any]]):
+    # Вставка пачки показаний в weather_history в текущей транзакции.
+    # В PostgreSQL большие пачки идут через COPY
+    if not rows:
+        return
+    if session.bind.dialect.name != "postgresql":
+        await session.execute(insert(WeatherHistory), rows)
+        return
+
+    times = [row["recorded_at"] for row in rows]
+    if len(rows) < COPY_MIN_ROWS:
+        await ensure_history_partitions(session, min(times), max(times))
+        await session.execute(insert(WeatherHistory), rows)
+        return
+
+    # Перед COPY секции проверяются запросом всегда: он же открывает
+    # транзакцию адаптера asyncpg, и COPY выполняется внутри неё
+    await ensure_history_partitions(session, min(times), max(times), cached=False)
+    connection = await session.connection()
+    raw = await connection.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        WeatherHistory.__tablename__,
+        records=[tuple(row.get(column) for column in HISTORY_COLUMNS) for row in rows],
+        columns=HISTORY_COLUMNS,
+    )
+
+
+async def history_columns(
+    session: AsyncSession,
+    since: datetime,
+    location: Optional[str] = None,
+) -> Dict[str, Dict[str, List[Any]]]:
+    # По локации — столбцы recorded_at (секунды UTC) и METRICS, как отдаёт
+    # hot store, когда окна нет в памяти
+    stmt = select(
+        WeatherHistory.location,
+        WeatherHistory.recorded_at,
+        *(getattr(WeatherHistory, metric) for metric in METRICS),
+    ).where(
+        WeatherHistory.recorded_at >= _naive_utc(since)
+    ).order_by(WeatherHistory.location, WeatherHistory.recorded_at)
+    if location is not None:
+        stmt = stmt.where(WeatherHistory.location == location)
+
+    result: Dict[str, Dict[str, List[Any]]] = {}
+    for key, recorded_at, *values in await session.execute(stmt):
+        columns = result.get(key)
+        if columns is None:
+            columns = result[key] = {"recorded_at": [], **{metric: [] for metric in METRICS}}
+        columns["recorded_at"].append(recorded_at.replace(tzinfo=timezone.utc).timestamp())
+        for metric, value in zip(METRICS, values):
+            columns[metric].append(value)
+    return result
+
+
+def _export_row(row) -> Dict[str, Any]:
+    data = dict(row._mapping)
+    if data["recorded_at"] is not None:
+        data["recorded_at"] = data["recorded_at"].isoformat()
+    return data
+
+
+async def export_history(
+    fmt: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    location: Optional[str] = None,
+) -> AsyncIterator[bytes]:
+    # Отдаём выгрузку кусками по EXPORT_BATCH_SIZE строк: session.stream()
+    # с yield_per держит в памяти только текущую пачку. Сессия своя, потому
+    # что генератор живёт дольше обработчика запроса
+    stmt = select(*EXPORT_COLUMNS).order_by(WeatherHistory.recorded_at, WeatherHistory.id)
+    if since is not None:
+        stmt = stmt.where(WeatherHistory.recorded_at >= _naive_utc(since))
+    if until is not None:
+        stmt = stmt.where(WeatherHistory.recorded_at < _naive_utc(until))
+    if location is not None:
+        stmt = stmt.where(WeatherHistory.location == location)
+    stmt = stmt.execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    header = [column.key for column in EXPORT_COLUMNS]
+    if fmt == "csv":
+        yield (",".join(header) + "\r\n").encode()
+
+    async with read_session_maker() as session:
+        result = await session.stream(stmt)
+        async for partition in result.partitions():
+            rows = [_export_row(row) for row in partition]
+            if fmt == "csv":
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=header)
+                writer.writerows(rows)
+                yield buffer.getvalue().encode()
+            else:
+                yield "".join(json.dumps(row) + "\n" for row in rows).encode()
+
+
+def _read_export(path: str, fmt: str) -> Iterator[Dict[str, Any]]:
+    # Читает файл выгрузки /weather/history/export. id не переносится:
+    # строки получают новые id в целевой БД
+    with open(path, newline="") as f:
+        records = csv.DictReader(f) if fmt == "csv" else (json.loads(line) for line in f if line.strip())
+        for record in records:
+            row = {"location": record["location"]}
+            for metric in METRICS:
+                value = record.get(metric)
+                row[metric] = None if value in (None, "") else float(value)
+            row["recorded_at"] = _naive_utc(datetime.fromisoformat(record["recorded_at"]))
+            yield row
+
+
+async def import_history(path: str, fmt: str) -> int:
+    # Загружает выгрузку обратно пачками по IMPORT_BATCH_SIZE строк,
+    # каждая пачка вместе с роллапами — одна транзакция
+    total = 0
+    batch: List[Dict[str, Any]] = []
+
+    async def flush():
+        async with async_session_maker() as session:
+            await insert_history(session, batch)
+            await apply_readings(session, batch)
+            await session.commit()
+
+    for row in _read_export(path, fmt):
+        batch.append(row)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await flush()
+            total += len(batch)
+            batch = []
+            logger.info(f"Imported {total} rows")
+    if batch:
+        await flush()
+        total += len(batch)
+    return total
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Weather history maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="load an NDJSON/CSV export into weather_history")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", dest="fmt", choices=["ndjson", "csv"], default="ndjson")
+    args = parser.parse_args()
+
+    await init_db()
+    try:
+        if args.command == "import":
+            total = await import_history(args.path, args.fmt)
+            logger.info(f"Imported {total} rows into weather_history")
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -0,0 +1,282 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+
+from app.config import settings
+from app.db.db import read_session_maker
+from app.models.models import WeatherHistory
+from app.services.history import METRICS
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ("recorded_at",) + METRICS
+INITIAL_CAPACITY = 64
+LOAD_BATCH_SIZE = 5000
+
+
+def epoch(value: datetime) -> float:
+    # В БД время наивное, в UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def column_list(values: np.ndarray) -> List[Optional[float]]:
+    # NaN — пропуск показания, в JSON это null
+    result = values.tolist()
+    if np.isnan(values).any():
+        result = [None if value != value else value for value in result]
+    return result
+
+
+class LocationRing:
+    # Показания одной локации: столбцы COLUMNS в одном массиве float64,
+    # время по возрастанию. Массив растёт удвоением до capacity, дальше
+    # новое показание перезаписывает самое старое
+    __slots__ = ("data", "start", "size", "capacity")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.data = np.empty((len(COLUMNS), min(INITIAL_CAPACITY, capacity)))
+        self.start = 0
+        self.size = 0
+
+    @property
+    def first(self) -> float:
+        return float(self.data[0, self.start])
+
+    @property
+    def last(self) -> float:
+        return float(self.data[0, (self.start + self.size - 1) % self.data.shape[1]])
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+    def append(self, values: List[float]) -> bool:
+        # Показания одной локации приходят по порядку: то, что не новее
+        # последнего, уже есть (повторное чтение из БД внахлёст)
+        if self.size and values[0] <= self.last:
+            return False
+        length = self.data.shape[1]
+        if self.size == length and length < self.capacity:
+            # До заполнения start == 0, данные лежат с начала массива
+            grown = np.empty((len(COLUMNS), min(length * 2, self.capacity)))
+            grown[:, :length] = self.data
+            self.data, length = grown, grown.shape[1]
+        if self.size < length:
+            index = self.start + self.size
+            self.size += 1
+        else:
+            index = self.start
+            self.start = (self.start + 1) % length
+        self.data[:, index] = values
+        return True
+
+    def since(self, timestamp: float) -> np.ndarray:
+        end = self.start + self.size
+        length = self.data.shape[1]
+        if end <= length:
+            ordered = self.data[:, self.start:end]
+        else:
+            ordered = np.concatenate((self.data[:, self.start:], self.data[:, :end - length]), axis=1)
+        return ordered[:, np.searchsorted(ordered[0], timestamp):]
+
+
+# Последние HOT_STORE_HOURS часов weather_history в памяти процесса для
+# /weather/history?layout=columns. Пополняется записью показаний (writer)
+# и раз в HOT_STORE_SYNC_INTERVAL догружает из БД строки новее последней
+# виденной минус HOT_STORE_SYNC_OVERLAP — так видны записи лидера на
+# остальных воркерах. Память ограничена: не больше HOT_STORE_CAPACITY
+# показаний на локацию и HOT_STORE_MAX_LOCATIONS локаций. Если окно не
+# помещается (шире хранимого, кольцо уже перезаписано, локации не хватило
+# места, данные давно не догружались) — None, и запрос идёт в БД
+class HotStore:
+    def __init__(self):
+        self.enabled = settings.HOT_STORE_ENABLED
+        self.hours = settings.HOT_STORE_HOURS
+        self.capacity = settings.HOT_STORE_CAPACITY
+        self.max_locations = settings.HOT_STORE_MAX_LOCATIONS
+        self.sync_interval = settings.HOT_STORE_SYNC_INTERVAL
+        self.sync_overlap = settings.HOT_STORE_SYNC_OVERLAP
+        self.rings: Dict[str, LocationRing] = {}
+        self.task: Optional[asyncio.Task] = None
+        # Начало прогрева: раньше этого момента данных в памяти нет
+        self.covered_since: Optional[float] = None
+        # Последнее показание, которому не хватило места
+        self.rejected_until = float("-inf")
+        self.watermark = 0.0
+        self.synced_at: Optional[float] = None
+
+        # Метрики
+        self.hits_total = 0
+        self.misses_total = 0
+        self.appended_total = 0
+        self.rejected_total = 0
+        self.synced_rows_total = 0
+        self.warm_rows = 0
+        self.warm_duration: Optional[float] = None
+        self.last_sync_duration: Optional[float] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.covered_since is not None
+
+    @property
+    def max_bytes(self) -> int:
+        return len(COLUMNS) * 8 * self.capacity * self.max_locations
+
+    async def start(self):
+        if self.enabled and self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    def extend(self, readings: Iterable[Dict[str, Any]]):
+        # Показания, только что записанные этим процессом. До конца
+        # прогрева не берём: их подхватит первая догрузка из БД
+        if self.is_ready:
+            for reading in readings:
+                self._append(
+                    reading["location"],
+                    [epoch(reading["recorded_at"])] + [reading.get(metric) for metric in METRICS],
+                )
+
+    def window(self, hours: int, location: Optional[str] = None) -> Optional[Dict[str, Dict[str, List]]]:
+        since = time.time() - hours * 3600
+        if not self._fits(hours, since):
+            self.misses_total += 1
+            return None
+
+        rings = [(location, self.rings.get(location))] if location is not None else list(self.rings.items())
+        result = {}
+        for key, ring in rings:
+            if ring is None:
+                continue
+            if ring.size == ring.capacity and ring.first > since:
+                # Начало окна уже перезаписано
+                self.misses_total += 1
+                return None
+            data = ring.since(since)
+            if data.shape[1]:
+                result[key] = {name: column_list(values) for name, values in zip(COLUMNS, data)}
+        self.hits_total += 1
+        return result
+
+    def _fits(self, hours: int, since: float) -> bool:
+        if not self.is_ready or hours > self.hours or since < self.covered_since:
+            return False
+        if since <= self.rejected_until:
+            return False
+        # Догрузка из БД давно не удавалась: данные других воркеров устарели
+        return time.monotonic() - self.synced_at <= max(3 * self.sync_interval, 10.0)
+
+    def _append(self, location: str, values: List[Any]):
+        ring = self.rings.get(location)
+        if ring is None:
+            if len(self.rings) >= self.max_locations:
+                self.rejected_total += 1
+                self.rejected_until = max(self.rejected_until, values[0])
+                return
+            ring = self.rings[location] = LocationRing(self.capacity)
+        if ring.append([np.nan if value is None else value for value in values]):
+            self.appended_total += 1
+
+    async def _run(self):
+        while True:
+            try:
+                if self.is_ready:
+                    await self._sync()
+                else:
+                    await self._warm()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Hot store {'sync' if self.is_ready else 'warm-up'} failed: {e}")
+            await asyncio.sleep(self.sync_interval)
+
+    async def _warm(self):
+        started = time.monotonic()
+        since = time.time() - self.hours * 3600
+        self.rings.clear()
+        rows = await self._load(since)
+        self.warm_rows = rows
+        self.warm_duration = time.monotonic() - started
+        self.covered_since = since
+        # Пустая БД: иначе первая догрузка читала бы всю таблицу с нуля
+        self.watermark = max(self.watermark, since)
+        self.synced_at = time.monotonic()
+        logger.info(f"Hot store warmed: {rows} readings, {len(self.rings)} locations in {self.warm_duration:.2f}s")
+
+    async def _sync(self):
+        started = time.monotonic()
+        # Не раньше хранимого окна: старше всё равно отрежет _prune
+        since = max(self.watermark - self.sync_overlap, time.time() - self.hours * 3600)
+        self.synced_rows_total += await self._load(since)
+        self.synced_at = time.monotonic()
+        self.last_sync_duration = self.synced_at - started
+        self._prune(time.time() - self.hours * 3600)
+
+    async def _load(self, since: float) -> int:
+        stmt = select(
+            WeatherHistory.location,
+            WeatherHistory.recorded_at,
+            *(getattr(WeatherHistory, metric) for metric in METRICS),
+        ).where(
+            WeatherHistory.recorded_at >= datetime.fromtimestamp(since, timezone.utc).replace(tzinfo=None)
+        ).order_by(WeatherHistory.recorded_at).execution_options(yield_per=LOAD_BATCH_SIZE)
+
+        rows = 0
+        async with read_session_maker() as session:
+            result = await session.stream(stmt)
+            async for partition in result.partitions():
+                for location, recorded_at, *values in partition:
+                    timestamp = epoch(recorded_at)
+                    self._append(location, [timestamp] + values)
+                    self.watermark = max(self.watermark, timestamp)
+                rows += len(partition)
+        return rows
+
+    def _prune(self, cutoff: float):
+        # Локации без показаний за хранимое окно (удалённые из реестра)
+        for key in [key for key, ring in self.rings.items() if ring.last < cutoff]:
+            del self.rings[key]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        rings = list(self.rings.values())
+        return {
+            "enabled": self.enabled,
+            "is_ready": self.is_ready,
+            "hours": self.hours,
+            "capacity": self.capacity,
+            "locations": len(rings),
+            "max_locations": self.max_locations,
+            "readings": sum(ring.size for ring in rings),
+            "bytes": sum(ring.nbytes for ring in rings),
+            "max_bytes": self.max_bytes,
+            "sync_lag": time.monotonic() - self.synced_at if self.synced_at is not None else None,
+            "last_sync_duration": self.last_sync_duration,
+            "warm_rows": self.warm_rows,
+            "warm_duration": self.warm_duration,
+            "hits_total": self.hits_total,
+            "misses_total": self.misses_total,
+            "appended_total": self.appended_total,
+            "rejected_total": self.rejected_total,
+            "synced_rows_total": self.synced_rows_total,
+        }
+
+
+hot_store = HotStore()
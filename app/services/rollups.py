@@ -0,0 +1,231 @@
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, func, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db.db import async_session_maker, close_db, dialect_insert, epoch_bucket, init_db
+from app.models.models import (
+    WeatherHistory,
+    WeatherRollup5m,
+    WeatherRollupDaily,
+    WeatherRollupHourly
+)
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("temperature", "humidity", "wind_speed")
+# От крупного к мелкому: планировщик берёт первый подходящий
+ROLLUPS = [WeatherRollupDaily, WeatherRollupHourly, WeatherRollup5m]
+ROLLUP_AGGREGATES = {"min", "max", "avg", "sum", "count"}
+
+
+def _epoch(value: datetime) -> int:
+    # Наивные datetime в БД хранятся в UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def _upsert(session: AsyncSession, model):
+    # Выполняется как executemany: один скомпилированный и закэшированный
+    # запрос вместо многострочного VALUES, который компилируется заново
+    stmt = dialect_insert(session, model)
+    if session.bind.dialect.name == "postgresql":
+        least, greatest = func.least, func.greatest
+    else:
+        # В SQLite min/max с двумя аргументами — скалярные функции
+        least, greatest = func.min, func.max
+
+    table = model.__table__
+    excluded = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.location, table.c.metric, table.c.bucket_start],
+        set_={
+            "count": table.c.count + excluded.count,
+            "min": least(func.coalesce(table.c.min, excluded.min), excluded.min),
+            "max": greatest(func.coalesce(table.c.max, excluded.max), excluded.max),
+            "sum": func.coalesce(table.c.sum, 0) + excluded.sum,
+        },
+    )
+
+
+async def apply_readings(session: AsyncSession, readings: List[Dict[str, Any]]):
+    # Инкрементально добавляет показания в часовые и дневные роллапы.
+    # Вызывается в той же транзакции, что и вставка в weather_history
+    for model in ROLLUPS:
+        merged: Dict[tuple, Dict[str, Any]] = {}
+        for reading in readings:
+            bucket = _epoch(reading["recorded_at"]) // model.bucket_seconds * model.bucket_seconds
+            for metric in METRICS:
+                value = reading.get(metric)
+                if value is None:
+                    continue
+                key = (reading["location"], metric, bucket)
+                row = merged.get(key)
+                if row is None:
+                    merged[key] = {
+                        "location": reading["location"], "metric": metric, "bucket_start": bucket,
+                        "count": 1, "min": value, "max": value, "sum": value,
+                    }
+                else:
+                    row["count"] += 1
+                    row["min"] = min(row["min"], value)
+                    row["max"] = max(row["max"], value)
+                    row["sum"] += value
+        if merged:
+            await session.execute(_upsert(session, model), list(merged.values()))
+
+
+def retention_days(model) -> int:
+    # 0 — хранится бессрочно
+    return {
+        WeatherHistory: settings.RETENTION_RAW_DAYS,
+        WeatherRollup5m: settings.RETENTION_5M_DAYS,
+        WeatherRollupHourly: settings.RETENTION_HOURLY_DAYS,
+        WeatherRollupDaily: settings.RETENTION_DAILY_DAYS,
+    }[model]
+
+
+def _covers(model, window_seconds: float) -> bool:
+    days = retention_days(model)
+    return days == 0 or window_seconds <= days * 86400
+
+
+def choose_rollup(bucket_seconds: int, aggregates: List[str], window_seconds: float):
+    # Роллап подходит, если его бакет делит запрошенный, все агрегаты
+    # выражаются через count/min/max/sum, его срок хранения покрывает окно
+    # и окно достаточно длинное, чтобы неполный первый бакет не играл роли.
+    # Если сырая история уже не покрывает окно — роллап обязателен
+    if not settings.ROLLUPS_ENABLED:
+        return None
+    if not set(aggregates) <= ROLLUP_AGGREGATES:
+        return None
+    if window_seconds < settings.ROLLUP_MIN_HOURS * 3600 and _covers(WeatherHistory, window_seconds):
+        return None
+    for model in ROLLUPS:
+        if bucket_seconds % model.bucket_seconds == 0 and _covers(model, window_seconds):
+            return model
+    return None
+
+
+async def aggregate_from_rollup(
+    session: AsyncSession,
+    model,
+    since: datetime,
+    bucket_seconds: int,
+    aggregates: List[str],
+    metrics: List[str],
+    location: Optional[str] = None,
+) -> Dict[str, Any]:
+    bucket = (model.bucket_start // bucket_seconds * bucket_seconds).label("bucket")
+    stmt = select(
+        bucket,
+        model.metric,
+        func.sum(model.count).label("count"),
+        func.min(model.min).label("min"),
+        func.max(model.max).label("max"),
+        func.sum(model.sum).label("sum"),
+    ).where(
+        model.bucket_start >= _epoch(since) // model.bucket_seconds * model.bucket_seconds,
+        model.metric.in_(metrics),
+    ).group_by(bucket, model.metric).order_by(bucket)
+    if location is not None:
+        stmt = stmt.where(model.location == location)
+
+    result = await session.execute(stmt)
+    by_bucket: Dict[int, Dict[str, Any]] = {}
+    for row in result:
+        by_bucket.setdefault(row.bucket, {})[row.metric] = row
+
+    starts = sorted(by_bucket)
+    response: Dict[str, Any] = {
+        "starts": starts,
+        "count": [max(row.count for row in by_bucket[start].values()) for start in starts],
+    }
+    for metric in metrics:
+        series: Dict[str, List[Any]] = {}
+        rows = [by_bucket[start].get(metric) for start in starts]
+        for name in aggregates:
+            if name == "count":
+                continue
+            if name == "avg":
+                series[name] = [row.sum / row.count if row and row.count else None for row in rows]
+            else:
+                series[name] = [getattr(row, name) if row else None for row in rows]
+        response[metric] = series
+    return response
+
+
+async def backfill(since: Optional[datetime] = None):
+    # Пересобирает роллапы из сырой истории начиная с since. Без since —
+    # с первого полного бакета, который ещё покрыт сырыми данными: более
+    # старые бакеты могли пережить очистку weather_history и пересобирать
+    # их не из чего
+    async with async_session_maker() as session:
+        oldest = None
+        if since is None:
+            result = await session.execute(select(func.min(WeatherHistory.recorded_at)))
+            oldest = result.scalar()
+            if oldest is None:
+                logger.info("weather_history is empty, nothing to backfill")
+                return
+
+        for model in ROLLUPS:
+            seconds = model.bucket_seconds
+            if since is not None:
+                start = _epoch(since) // seconds * seconds
+            else:
+                start = -(-_epoch(oldest) // seconds) * seconds
+
+            await session.execute(delete(model).where(model.bucket_start >= start))
+
+            bucket = epoch_bucket(session, WeatherHistory.recorded_at, seconds)
+            since_filter = WeatherHistory.recorded_at >= datetime.fromtimestamp(
+                start, timezone.utc
+            ).replace(tzinfo=None)
+            for metric in METRICS:
+                column = getattr(WeatherHistory, metric)
+                source = select(
+                    WeatherHistory.location,
+                    literal(metric),
+                    bucket,
+                    func.count(column),
+                    func.min(column),
+                    func.max(column),
+                    func.sum(column),
+                ).where(column.is_not(None), since_filter).group_by(
+                    WeatherHistory.location, bucket
+                )
+                await session.execute(
+                    model.__table__.insert().from_select(
+                        ["location", "metric", "bucket_start", "count", "min", "max", "sum"],
+                        source,
+                    )
+                )
+            await session.commit()
+            logger.info(f"Rebuilt {model.__tablename__} from {datetime.fromtimestamp(start, timezone.utc)}")
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Weather rollup maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="rebuild rollups from weather_history")
+    backfill_parser.add_argument("--since", type=datetime.fromisoformat, default=None)
+    args = parser.parse_args()
+
+    await init_db()
+    try:
+        if args.command == "backfill":
+            await backfill(args.since)
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -1,38 +1,145 @@
+import asyncio
+import time
+from typing import Dict, Any, Optional, List, Iterable, Tuple
 import httpx
-from typing import Dict, Any, Optional
 from app.config import settings
+from app.metrics import OPEN_METEO_DURATION, OPEN_METEO_ERRORS
+from app.services.breaker import CircuitBreaker
+from app.services.http import http_client
+from app.utils import chunked
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def location_key(latitude: float, longitude: float) -> str:
+    return f"{latitude},{longitude}"
+
+
+def _parse_current(latitude: float, longitude: float, data: Dict[str, Any]) -> Dict[str, Any]:
+    current = data.get("current", {})
+    return {
+        "location": location_key(latitude, longitude),
+        "temperature": current.get("temperature_2m"),
+        "humidity": current.get("relative_humidity_2m"),
+        "wind_speed": current.get("wind_speed_10m"),
+    }
+
+
 class WeatherService:
     def __init__(self):
+        self.http = http_client
         self.base_url = settings.OPEN_METEO_URL
+        self.batch_size = settings.OPEN_METEO_BATCH_SIZE
+        self.batch_concurrency = settings.OPEN_METEO_BATCH_CONCURRENCY
+        # При недоступности API не ждём таймаутов на каждом запросе
+        self.breaker = CircuitBreaker(
+            "open-meteo",
+            settings.OPEN_METEO_BREAKER_THRESHOLD,
+            settings.OPEN_METEO_BREAKER_BACKOFF,
+            settings.OPEN_METEO_BREAKER_MAX_BACKOFF,
+        )
         self.default_params = {
             "latitude": settings.LATITUDE,
             "longitude": settings.LONGITUDE,
-            "current": ["temperature_2m", "relative_humidity_2m", 
+            "current": ["temperature_2m", "relative_humidity_2m",
                        "wind_speed_10m"],
             "timezone": "UTC"
         }
-    
-    async def fetch_current_weather(self) -> Optional[Dict[str, Any]]:
+
+    async def fetch_current_weather(
+        self,
+        latitude: Optional[float] = None,
+        longitude: Optional[float] = None,
+    ) -> Optional[Dict[str, Any]]:
+        if latitude is None or longitude is None:
+            latitude, longitude = settings.LATITUDE, settings.LONGITUDE
+
+        params = {**self.default_params, "latitude": latitude, "longitude": longitude}
+        if not self.breaker.allow():
+            return None
+
+        started = time.perf_counter()
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(self.base_url, params=self.default_params)
-                response.raise_for_status()
-                data = response.json()
-                
-                current = data.get("current", {})
-                
-                return {
-                    "location": f"{settings.LATITUDE},{settings.LONGITUDE}",
-                    "temperature": current.get("temperature_2m"),
-                    "humidity": current.get("relative_humidity_2m"),
-                    "wind_speed": current.get("wind_speed_10m"),
-                }
-                
+            return _parse_current(latitude, longitude, await self._get(params))
+
         except Exception as e:
-            logger.error(f"Error fetching weather data: {e}")
-            return None
\ No newline at end of file
+            OPEN_METEO_ERRORS.labels("current", type(e).__name__).inc()
+            logger.error(f"Error fetching weather data for {latitude},{longitude}: {e}")
+            return None
+        finally:
+            OPEN_METEO_DURATION.labels("current").observe(time.perf_counter() - started)
+
+    async def fetch_current_weather_many(
+        self,
+        coords: Iterable[Tuple[float, float]],
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        # Open-Meteo принимает списки координат через запятую и отвечает массивом
+        # в том же порядке. Если чанк упал, его локации получают None.
+        coords = list(dict.fromkeys(coords))
+        results: Dict[str, Optional[Dict[str, Any]]] = {
+            location_key(lat, lon): None for lat, lon in coords
+        }
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def fetch_chunk(chunk: List[Tuple[float, float]]):
+            async with semaphore:
+                for item in await self._fetch_chunk(chunk):
+                    results[item["location"]] = item
+
+        await asyncio.gather(*(
+            fetch_chunk(chunk) for chunk in chunked(coords, self.batch_size)
+        ))
+        return results
+
+    async def _fetch_chunk(self, chunk: List[Tuple[float, float]]) -> List[Dict[str, Any]]:
+        params = {
+            **self.default_params,
+            "latitude": ",".join(str(lat) for lat, _ in chunk),
+            "longitude": ",".join(str(lon) for _, lon in chunk),
+        }
+        if not self.breaker.allow():
+            return []
+
+        started = time.perf_counter()
+        try:
+            data = await self._get(params)
+
+            if isinstance(data, dict):
+                data = [data]
+            if len(data) != len(chunk):
+                raise ValueError(f"expected {len(chunk)} results, got {len(data)}")
+
+            return [
+                _parse_current(lat, lon, entry)
+                for (lat, lon), entry in zip(chunk, data)
+            ]
+
+        except Exception as e:
+            OPEN_METEO_ERRORS.labels("batch", type(e).__name__).inc()
+            logger.error(f"Error fetching weather batch of {len(chunk)} locations: {e}")
+            return []
+        finally:
+            OPEN_METEO_DURATION.labels("batch").observe(time.perf_counter() - started)
+
+    async def _get(self, params: Dict[str, Any]) -> Any:
+        # Цепь размыкают только сбои самого API: сеть, таймауты, 5xx и 429.
+        # Прочие 4xx и кривой ответ — вопрос к запросу, а не к API
+        try:
+            response = await self.http.client.get(self.base_url, params=params)
+        except httpx.TransportError:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+
+        if response.status_code == 429 or response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        response.raise_for_status()
+        return response.json()
+
+
+weather_service = WeatherService()
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import case, or_, select, update
+
+from app.config import settings
+from app.db.db import async_session_maker, dialect_insert
+from app.models.models import TaskLease
+from app.nats.client import nats_client
+
+logger = logging.getLogger(__name__)
+
+
+# Аренда в таблице task_leases: строку продлевает держатель, просроченную
+# забирает любой воркер одним UPDATE. Держатель считает себя лидером до
+# срока, который сам записал (по часам процесса, отсчёт от начала
+# запроса), и слагает полномочия, если продлить не удалось. Так два
+# лидера не пересекаются, а после падения держателя задачу подхватывают
+# не позже чем через LEADER_LEASE_TTL + LEADER_RENEW_INTERVAL.
+# Часы воркеров на разных машинах должны расходиться меньше, чем на TTL
+class LeaderLease:
+    def __init__(self, name: str, on_acquire: Callable[[], None], on_release: Callable[[], None]):
+        self.name = name
+        self.on_acquire = on_acquire
+        self.on_release = on_release
+        # Тот же id, что в событиях NATS: по нему лидеру пересылается /tasks/run
+        self.holder_id = nats_client.origin
+        self.ttl = settings.LEADER_LEASE_TTL
+        self.renew_interval = min(settings.LEADER_RENEW_INTERVAL, self.ttl / 2)
+        self.is_leader = False
+        self.valid_until = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.leader: Optional[str] = None
+        self.epoch = 0
+        self.acquired_total = 0
+        self.lost_total = 0
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "is_leader": self.is_leader,
+            "leader": self.leader,
+            "lease_epoch": self.epoch,
+            "lease_acquired_total": self.acquired_total,
+            "lease_lost_total": self.lost_total,
+        }
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+        if self.is_leader:
+            self._step_down("released")
+            # Отдаём аренду сразу, не дожидаясь срока
+            try:
+                await self._release()
+            except Exception as e:
+                logger.error(f"Failed to release lease {self.name}: {e}")
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                acquired = await self._acquire()
+            except Exception as e:
+                logger.error(f"Failed to renew lease {self.name}: {e}")
+                acquired = None
+
+            if acquired:
+                self.valid_until = started + self.ttl
+                if not self.is_leader:
+                    self.is_leader = True
+                    self.acquired_total += 1
+                    logger.info(f"Lease {self.name} acquired (epoch {self.epoch})")
+                    self.on_acquire()
+            elif self.is_leader and (acquired is False or time.monotonic() >= self.valid_until):
+                self._step_down("lost")
+
+            delay = self.renew_interval
+            if self.is_leader:
+                # Проснуться не позже конца аренды, даже если БД не отвечает
+                delay = max(min(delay, self.valid_until - time.monotonic()), 0.05)
+            await asyncio.sleep(delay)
+
+    def _step_down(self, reason: str):
+        self.is_leader = False
+        if reason == "lost":
+            self.lost_total += 1
+            logger.warning(f"Lease {self.name} lost, stopping")
+        else:
+            logger.info(f"Lease {self.name} {reason}")
+        self.on_release()
+
+    async def _acquire(self) -> bool:
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        expires_at = now + timedelta(seconds=self.ttl)
+        async with async_session_maker() as session:
+            result = await session.execute(
+                update(TaskLease)
+                .where(
+                    TaskLease.name == self.name,
+                    or_(TaskLease.holder == self.holder_id, TaskLease.expires_at < now),
+                )
+                .values(
+                    # SET вычисляется по старой строке: epoch растёт при смене держателя
+                    epoch=case((TaskLease.holder == self.holder_id, TaskLease.epoch), else_=TaskLease.epoch + 1),
+                    holder=self.holder_id,
+                    expires_at=expires_at,
+                )
+            )
+            if result.rowcount == 0:
+                # Первый запуск: строки ещё нет
+                stmt = dialect_insert(session, TaskLease).values(
+                    name=self.name, holder=self.holder_id, epoch=1, expires_at=expires_at
+                ).on_conflict_do_nothing(index_elements=["name"])
+                await session.execute(stmt)
+            row = (await session.execute(
+                select(TaskLease.holder, TaskLease.epoch).where(TaskLease.name == self.name)
+            )).one()
+            await session.commit()
+
+        self.leader, self.epoch = row.holder, row.epoch
+        return row.holder == self.holder_id
+
+    async def _release(self):
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        async with async_session_maker() as session:
+            await session.execute(
+                update(TaskLease)
+                .where(TaskLease.name == self.name, TaskLease.holder == self.holder_id)
+                .values(expires_at=now)
+            )
+            await session.commit()
+        self.leader = None
+
+    async def current_leader(self) -> Optional[str]:
+        # Держатель неистёкшей аренды или None
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        async with async_session_maker() as session:
+            holder = (await session.execute(
+                select(TaskLease.holder).where(TaskLease.name == self.name, TaskLease.expires_at >= now)
+            )).scalar_one_or_none()
+        return holder
@@ -0,0 +1,269 @@
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from sqlalchemy import delete, select, text, tuple_
+
+from app.config import settings
+from app.db.db import IS_POSTGRES, async_session_maker, close_db, engine, init_db
+from app.db.partitions import drop_history_partitions, ensure_history_partitions
+from app.models.models import (
+    WeatherHistory,
+    WeatherRollup5m,
+    WeatherRollupDaily,
+    WeatherRollupHourly
+)
+from app.services.rollups import retention_days
+from app.tasks.leader import LeaderLease
+
+logger = logging.getLogger(__name__)
+
+VACUUM_PAGES_PER_STEP = 1000
+
+
+# Периодическая очистка истории: удаляет устаревшие строки небольшими
+# транзакциями (писатели не блокируются надолго), затем VACUUM/ANALYZE
+class RetentionTask:
+    def __init__(self):
+        self.is_running = False
+        self.task: Optional[asyncio.Task] = None
+        self.interval = settings.RETENTION_INTERVAL
+        self.last_vacuum_at: Optional[float] = None
+        self.vacuum_warned = False
+        self.lease = LeaderLease("retention", self._start_loop, self._stop_loop) if settings.LEADER_ELECTION else None
+
+        # Метрики
+        self.run_count = 0
+        self.last_run_started_at: Optional[datetime] = None
+        self.last_run_duration: Optional[float] = None
+        self.last_rows_deleted: Dict[str, int] = {}
+        self.rows_deleted_total = 0
+        self.last_bytes_reclaimed = 0
+        self.bytes_reclaimed_total = 0
+
+    async def start(self):
+        if self.is_running:
+            logger.warning("Retention task is already running")
+            return
+
+        self.is_running = True
+        if self.lease is None:
+            self._start_loop()
+        else:
+            self.lease.start()
+        logger.info("Retention task started")
+
+    def _start_loop(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run_periodically())
+
+    def _stop_loop(self):
+        if self.task:
+            self.task.cancel()
+
+    async def stop(self):
+        self.is_running = False
+        if self.lease is not None:
+            await self.lease.stop()
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        logger.info("Retention task stopped")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        lease = self.lease.get_metrics() if self.lease is not None else {"is_leader": True}
+        return {
+            **lease,
+            "is_running": self.is_running,
+            "interval": self.interval,
+            "run_count": self.run_count,
+            "last_run_started_at": self.last_run_started_at,
+            "last_run_duration": self.last_run_duration,
+            "last_rows_deleted": self.last_rows_deleted,
+            "rows_deleted_total": self.rows_deleted_total,
+            "last_bytes_reclaimed": self.last_bytes_reclaimed,
+            "bytes_reclaimed_total": self.bytes_reclaimed_total,
+        }
+
+    async def _run_periodically(self):
+        while self.is_running:
+            try:
+                await self.run_once()
+                await asyncio.sleep(self.interval)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in retention task: {e}")
+                await asyncio.sleep(self.interval)
+
+    async def run_once(self):
+        started = time.monotonic()
+        self.last_run_started_at = datetime.now(timezone.utc)
+        size_before = await self._database_size()
+
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        if IS_POSTGRES:
+            async with engine.begin() as conn:
+                await ensure_history_partitions(
+                    conn, now, now + timedelta(days=settings.HISTORY_PARTITIONS_AHEAD)
+                )
+
+        deleted = {}
+        for model in (WeatherHistory, WeatherRollup5m, WeatherRollupHourly, WeatherRollupDaily):
+            days = retention_days(model)
+            if days <= 0:
+                continue
+            cutoff = now - timedelta(days=days)
+            deleted[model.__tablename__] = await self._purge(model, cutoff)
+
+        await self._vacuum(any(deleted.values()))
+
+        size_after = await self._database_size()
+        self.last_rows_deleted = deleted
+        self.rows_deleted_total += sum(deleted.values())
+        self.last_bytes_reclaimed = max(size_before - size_after, 0)
+        self.bytes_reclaimed_total += self.last_bytes_reclaimed
+        self.run_count += 1
+        self.last_run_duration = time.monotonic() - started
+        logger.info(
+            f"Retention finished: deleted {deleted}, "
+            f"reclaimed {self.last_bytes_reclaimed} bytes in {self.last_run_duration:.2f}s"
+        )
+
+    async def _purge(self, model, cutoff: datetime) -> int:
+        if model is WeatherHistory and IS_POSTGRES:
+            # Сырая история секционирована: удаляем секции целиком
+            async with engine.begin() as conn:
+                return await drop_history_partitions(conn, cutoff)
+
+        if model is WeatherHistory:
+            key = (WeatherHistory.id,)
+            expired = WeatherHistory.recorded_at < cutoff
+        else:
+            key = (model.location, model.metric, model.bucket_start)
+            expired = model.bucket_start < int(cutoff.replace(tzinfo=timezone.utc).timestamp())
+
+        total = 0
+        while True:
+            batch = select(*key).where(expired).limit(settings.RETENTION_CHUNK_SIZE)
+            target = key[0] if len(key) == 1 else tuple_(*key)
+            async with async_session_maker() as session:
+                result = await session.execute(
+                    delete(model).where(target.in_(batch)).execution_options(
+                        synchronize_session=False
+                    )
+                )
+                await session.commit()
+
+            total += result.rowcount
+            if result.rowcount < settings.RETENTION_CHUNK_SIZE:
+                return total
+            # Пауза между транзакциями, чтобы пропустить писателей
+            await asyncio.sleep(settings.RETENTION_CHUNK_PAUSE)
+
+    async def _database_size(self) -> int:
+        async with engine.connect() as conn:
+            if conn.dialect.name == "postgresql":
+                result = await conn.execute(text("SELECT pg_database_size(current_database())"))
+                return int(result.scalar())
+            page_count = (await conn.execute(text("PRAGMA page_count"))).scalar()
+            page_size = (await conn.execute(text("PRAGMA page_size"))).scalar()
+            return int(page_count * page_size)
+
+    async def _incremental_vacuum(self, conn):
+        driver = (await conn.get_raw_connection()).driver_connection
+        previous = None
+        while True:
+            free_pages = (await conn.execute(text("PRAGMA freelist_count"))).scalar()
+            if not free_pages or free_pages == previous:
+                break
+            previous = free_pages
+            # Прагма освобождает по странице на каждый шаг. У неё нет столбцов
+            # результата, и execute в sqlite3 делает только первый шаг (fetchall
+            # не помогает); executescript проходит её до конца
+            await driver.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_STEP})")
+            await asyncio.sleep(settings.RETENTION_CHUNK_PAUSE)
+
+    async def _vacuum(self, deleted_rows: bool):
+        mode = settings.RETENTION_VACUUM
+        if mode == "off":
+            return
+
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+
+            if conn.dialect.name == "postgresql":
+                if deleted_rows:
+                    await conn.execute(text("VACUUM (ANALYZE) weather_history"))
+                return
+
+            if mode == "incremental":
+                auto_vacuum = (await conn.execute(text("PRAGMA auto_vacuum"))).scalar()
+                if auto_vacuum != 2:
+                    # Перевод существующей БД требует полного VACUUM (блокирует
+                    # запись на всё время) — только вручную
+                    if not self.vacuum_warned:
+                        logger.warning(
+                            "SQLite auto_vacuum is not INCREMENTAL, free pages are not reclaimed; "
+                            "run: python -m app.tasks.retention enable-incremental-vacuum"
+                        )
+                        self.vacuum_warned = True
+                else:
+                    await self._incremental_vacuum(conn)
+            elif mode == "full":
+                now = time.monotonic()
+                if self.last_vacuum_at is None or now - self.last_vacuum_at >= settings.RETENTION_VACUUM_INTERVAL:
+                    await conn.execute(text("VACUUM"))
+                    self.last_vacuum_at = now
+
+            if deleted_rows:
+                # ANALYZE только для таблиц, чья статистика устарела
+                await conn.execute(text("PRAGMA optimize"))
+
+
+async def enable_incremental_vacuum():
+    async with engine.connect() as conn:
+        if conn.dialect.name != "sqlite":
+            logger.info("Not a SQLite database, nothing to do")
+            return
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        if (await conn.execute(text("PRAGMA auto_vacuum"))).scalar() == 2:
+            logger.info("SQLite auto_vacuum is already INCREMENTAL")
+            return
+        # Режим auto_vacuum применяется только после полного VACUUM
+        started = time.monotonic()
+        logger.info("Switching SQLite to auto_vacuum=INCREMENTAL, running VACUUM")
+        await conn.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
+        await conn.execute(text("VACUUM"))
+        logger.info(f"SQLite auto_vacuum=INCREMENTAL in {time.monotonic() - started:.1f}s")
+
+
+retention_task = RetentionTask()
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Weather history retention maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser(
+        "enable-incremental-vacuum",
+        help="switch an existing SQLite database to auto_vacuum=INCREMENTAL (full VACUUM, blocks writers)",
+    )
+    args = parser.parse_args()
+
+    await init_db()
+    try:
+        if args.command == "enable-incremental-vacuum":
+            await enable_incremental_vacuum()
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -0,0 +1,156 @@
+import heapq
+import random
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+
+_FIELDS = ("temperature", "humidity", "wind_speed")
+
+
+class ScheduledLocation:
+    __slots__ = ("location", "latitude", "longitude", "interval", "due", "last")
+
+    def __init__(self, location: str, latitude: float, longitude: float, interval: float, due: float):
+        self.location = location
+        self.latitude = latitude
+        self.longitude = longitude
+        self.interval = interval
+        self.due = due
+        self.last: Optional[Tuple[Any, ...]] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"location": self.location, "latitude": self.latitude, "longitude": self.longitude}
+
+
+# Очередь сроков опроса (куча по monotonic-времени). Следующий срок
+# считается от предыдущего срока, а не от конца опроса, поэтому медленный
+# ответ не сдвигает расписание. Интервал локации: пополам, если показания
+# изменились хотя бы на порог INGEST_CHANGE_*, в полтора раза больше, если
+# почти не изменились, в границах INGEST_MIN_INTERVAL..INGEST_MAX_INTERVAL.
+# Из кучи не удаляем: устаревшие записи пропускаются при извлечении
+class AdaptiveSchedule:
+    def __init__(self):
+        self.min_interval = float(settings.INGEST_MIN_INTERVAL)
+        self.max_interval = float(max(settings.INGEST_MAX_INTERVAL, settings.INGEST_MIN_INTERVAL))
+        self.initial_interval = min(max(float(settings.BACKGROUND_TASK_INTERVAL), self.min_interval), self.max_interval)
+        self.jitter = min(settings.INGEST_JITTER, self.initial_interval)
+        self.thresholds = (
+            settings.INGEST_CHANGE_TEMPERATURE,
+            settings.INGEST_CHANGE_HUMIDITY,
+            settings.INGEST_CHANGE_WIND_SPEED,
+        )
+        self.entries: Dict[str, ScheduledLocation] = {}
+        self.heap: List[Tuple[float, int, ScheduledLocation]] = []
+        self._counter = 0
+
+        # Метрики
+        self.faster_total = 0
+        self.slower_total = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def sync(self, locations: Iterable[Dict[str, Any]]):
+        # Новые локации — в очередь с разбросом по jitter, пропавшие — вон
+        now = time.monotonic()
+        seen = set()
+        for location in locations:
+            key = location["location"]
+            seen.add(key)
+            if key not in self.entries:
+                entry = ScheduledLocation(
+                    key, location["latitude"], location["longitude"],
+                    self.initial_interval, now + random.uniform(0, self.jitter),
+                )
+                self.entries[key] = entry
+                self._push(entry)
+        for key in [key for key in self.entries if key not in seen]:
+            del self.entries[key]
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self._compact()
+
+    def due_in(self) -> Optional[float]:
+        self._drop_stale()
+        if not self.heap:
+            return None
+        return self.heap[0][0] - time.monotonic()
+
+    def pop_due(self, until: float, limit: Optional[int] = None) -> List[ScheduledLocation]:
+        batch = []
+        while self.heap and self.heap[0][0] <= until and (limit is None or len(batch) < limit):
+            due, _, entry = heapq.heappop(self.heap)
+            if self._is_current(due, entry):
+                batch.append(entry)
+        return batch
+
+    def reschedule(self, entry: ScheduledLocation, reading: Optional[Dict[str, Any]]):
+        now = time.monotonic()
+        if reading is not None:
+            self._adapt(entry, reading)
+        due = entry.due + entry.interval
+        if due <= now:
+            # Отстали больше чем на интервал: не догоняем пачкой, а сдвигаем
+            due = now + entry.interval
+        entry.due = due
+        if self.entries.get(entry.location) is entry:
+            self._push(entry)
+
+    def retry(self, entry: ScheduledLocation, at: float):
+        # Опрос не состоялся (цепь разомкнута): повторить в срок at
+        entry.due = at
+        if self.entries.get(entry.location) is entry:
+            self._push(entry)
+
+    def _adapt(self, entry: ScheduledLocation, reading: Dict[str, Any]):
+        values = tuple(reading.get(field) for field in _FIELDS)
+        previous, entry.last = entry.last, values
+        if previous is None:
+            return
+
+        change = 0.0
+        for old, new, threshold in zip(previous, values, self.thresholds):
+            if old is not None and new is not None and threshold > 0:
+                change = max(change, abs(new - old) / threshold)
+
+        if change >= 1.0:
+            interval = max(entry.interval / 2, self.min_interval)
+            if interval < entry.interval:
+                self.faster_total += 1
+        elif change < 0.5:
+            interval = min(entry.interval * 1.5, self.max_interval)
+            if interval > entry.interval:
+                self.slower_total += 1
+        else:
+            return
+        entry.interval = interval
+
+    def _push(self, entry: ScheduledLocation):
+        self._counter += 1
+        heapq.heappush(self.heap, (entry.due, self._counter, entry))
+
+    def _is_current(self, due: float, entry: ScheduledLocation) -> bool:
+        return entry.due == due and self.entries.get(entry.location) is entry
+
+    def _drop_stale(self):
+        while self.heap and not self._is_current(self.heap[0][0], self.heap[0][2]):
+            heapq.heappop(self.heap)
+
+    def _compact(self):
+        self.heap = [item for item in self.heap if self._is_current(item[0], item[2])]
+        heapq.heapify(self.heap)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        intervals = [entry.interval for entry in self.entries.values()]
+        due_in = self.due_in()
+        return {
+            "min_interval": self.min_interval,
+            "max_interval": self.max_interval,
+            "scheduled_locations": len(intervals),
+            "next_due_in": max(due_in, 0.0) if due_in is not None else None,
+            "interval_min": min(intervals) if intervals else None,
+            "interval_avg": sum(intervals) / len(intervals) if intervals else None,
+            "interval_max": max(intervals) if intervals else None,
+            "interval_faster_total": self.faster_total,
+            "interval_slower_total": self.slower_total,
+        }
@@ -1,35 +1,81 @@
 import asyncio
 import logging
-from typing import Optional
+import time
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Any
 from sqlalchemy import select
 
 from app.db.db import async_session_maker
-from app.models.models import WeatherItem, WeatherHistory
-from app.services.weather import WeatherService
-from app.nats.client import NATSService
+from app.metrics import BACKGROUND_TICK_DURATION
+from app.models.models import TrackedLocation
+from app.nats.client import nats_client
+from app.services.weather import weather_service, location_key
+from app.tasks.leader import LeaderLease
+from app.tasks.scheduler import AdaptiveSchedule, ScheduledLocation
+from app.tasks.writer import weather_writer
+from app.utils import chunked
 from app.config import settings
-from app.ws.websocket import manager
 
 logger = logging.getLogger(__name__)
 
+
+# Лидер есть, но ручной запуск до него не дошёл (timed_out — нет ответа
+# за LEADER_FORWARD_TIMEOUT, запуск мог и состояться)
+class LeaderForwardError(Exception):
+    def __init__(self, leader: str, timed_out: bool):
+        super().__init__(f"Leader {leader} {'did not reply in time' if timed_out else 'is unreachable'}")
+        self.leader = leader
+        self.timed_out = timed_out
+
+
 class BackgroundTask:
     def __init__(self):
         self.is_running = False
         self.task: Optional[asyncio.Task] = None
-        self.weather_service = WeatherService()
+        self.weather_service = weather_service
         self.interval = settings.BACKGROUND_TASK_INTERVAL
-    
+        self.concurrency = settings.INGEST_CONCURRENCY
+        self.schedule = AdaptiveSchedule()
+        self.batch_window = settings.INGEST_BATCH_WINDOW
+        self.registry_refresh = settings.INGEST_REGISTRY_REFRESH
+        self.registry_loaded_at: Optional[float] = None
+        # С выбором лидера цикл загрузки крутит только держатель аренды
+        self.lease = LeaderLease("ingest", self._start_loop, self._stop_loop) if settings.LEADER_ELECTION else None
+
+        # Метрики
+        self.tick_count = 0
+        self.last_tick_started_at: Optional[datetime] = None
+        self.last_tick_duration: Optional[float] = None
+        self.last_tick_locations = 0
+        self.last_tick_failed = 0
+        self.pending_locations = 0
+
     async def start(self):
         if self.is_running:
             logger.warning("Background task is already running")
             return
-        
+
         self.is_running = True
-        self.task = asyncio.create_task(self._run_periodically())
+        if self.lease is None:
+            self._start_loop()
+        else:
+            # Сюда пересылают /tasks/run остальные воркеры
+            await nats_client.subscribe(f"{settings.NATS_TOPIC_TASKS}.{nats_client.origin}", self._handle_run_request)
+            self.lease.start()
         logger.info("Background task started")
-    
+
+    def _start_loop(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run_periodically())
+
+    def _stop_loop(self):
+        if self.task:
+            self.task.cancel()
+
     async def stop(self):
         self.is_running = False
+        if self.lease is not None:
+            await self.lease.stop()
         if self.task:
             self.task.cancel()
             try:
@@ -37,69 +83,185 @@ class BackgroundTask:
             except asyncio.CancelledError:
                 pass
         logger.info("Background task stopped")
-    
+
     async def run_once(self):
+        # Все локации сразу, вне расписания
         logger.info("Running background task manually")
-        await self._fetch_and_process_weather()
-    
+        try:
+            locations = await self._load_locations()
+        except Exception as e:
+            logger.error(f"Error loading tracked locations: {e}")
+            return
+        await self._fetch_and_process_weather(locations)
+
+    async def run_on_leader(self) -> str:
+        # Ручной запуск выполняет лидер (запрос через NATS), чтобы не
+        # пересекаться с его циклом. Здесь — только если лидера нет: при
+        # живом лидере локальный запуск шёл бы параллельно его циклу, так
+        # что без связи с ним — LeaderForwardError. Возвращает id
+        # выполнившего воркера
+        if self.lease is not None and not self.lease.is_leader:
+            leader = await self.lease.current_leader()
+            if leader is not None and leader != self.lease.holder_id:
+                try:
+                    reply = await nats_client.request(
+                        f"{settings.NATS_TOPIC_TASKS}.{leader}",
+                        {"task": "ingest"},
+                        timeout=settings.LEADER_FORWARD_TIMEOUT,
+                    )
+                    return reply["worker"]
+                except Exception as e:
+                    logger.warning(f"Failed to forward run to leader {leader}: {e!r}")
+                    raise LeaderForwardError(leader, isinstance(e, asyncio.TimeoutError)) from e
+        await self.run_once()
+        return nats_client.origin
+
+    async def _handle_run_request(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        await self.run_once()
+        return {"worker": nats_client.origin}
+
+    def get_metrics(self) -> Dict[str, Any]:
+        lease = self.lease.get_metrics() if self.lease is not None else {"is_leader": True}
+        return {
+            **lease,
+            **self.schedule.get_metrics(),
+            **self.weather_service.breaker.get_metrics(),
+            "is_running": self.is_running,
+            "interval": self.interval,
+            "concurrency": self.concurrency,
+            "tick_count": self.tick_count,
+            "last_tick_started_at": self.last_tick_started_at,
+            "last_tick_duration": self.last_tick_duration,
+            "last_tick_locations": self.last_tick_locations,
+            "last_tick_failed": self.last_tick_failed,
+            "pending_locations": self.pending_locations,
+        }
+
     async def _run_periodically(self):
+        breaker = self.weather_service.breaker
         while self.is_running:
             try:
-                await self._fetch_and_process_weather()
-                await asyncio.sleep(self.interval)
+                await self._refresh_registry()
+                # Спим до ближайшего срока, перечитывания реестра
+                # или, если цепь разомкнута, до пробного запроса
+                refresh_in = self.registry_loaded_at + self.registry_refresh - time.monotonic()
+                due_in = self.schedule.due_in()
+                wait = refresh_in if due_in is None else min(due_in, refresh_in)
+                wait = max(wait, breaker.retry_in())
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+
+                # В half_open — только одна пачка: остальные всё равно отклонит цепь
+                limit = self.weather_service.batch_size if breaker.state == "half_open" else None
+                due = self.schedule.pop_due(time.monotonic() + self.batch_window, limit)
+                if due:
+                    await self._poll(due)
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"Error in background task: {e}")
-                await asyncio.sleep(self.interval)
-    
-    async def _fetch_and_process_weather(self):
+                await asyncio.sleep(self.schedule.min_interval)
+
+    async def _refresh_registry(self):
+        now = time.monotonic()
+        if self.registry_loaded_at is not None and now - self.registry_loaded_at < self.registry_refresh:
+            return
         try:
-            weather_data = await self.weather_service.fetch_current_weather()
-            
-            if not weather_data:
-                logger.warning("No weather data received")
-                return
-            
-            async with async_session_maker() as session:
-                stmt = select(WeatherItem).where(
-                    WeatherItem.location == weather_data["location"]
-                )
-                result = await session.execute(stmt)
-                item = result.scalar_one_or_none()
-                
-                if item:
-                    item.temperature = weather_data["temperature"]
-                    item.humidity = weather_data["humidity"]
-                    item.wind_speed = weather_data["wind_speed"]
-                else:
-                    item = WeatherItem(
-                        location=weather_data["location"],
-                        temperature=weather_data["temperature"],
-                        humidity=weather_data["humidity"],
-                        wind_speed=weather_data["wind_speed"],
-                    )
-                    session.add(item)
-                
-                await session.commit()
-                await session.refresh(item)
-                
-                history = WeatherHistory(
-                    location=weather_data["location"],
-                    temperature=weather_data["temperature"],
-                    humidity=weather_data["humidity"],
-                    wind_speed=weather_data["wind_speed"],
-                )
-                session.add(history)
-                await session.commit()
-                
-                await NATSService.publish_weather_data(item.to_dict())
-                
-                await manager.broadcast_item_update("created", item.to_dict())
-                logger.info(f"Weather data updated for {weather_data['location']}")
-                
+            self.schedule.sync(await self._load_locations())
         except Exception as e:
-            logger.error(f"Error processing weather data: {e}")
+            logger.error(f"Error loading tracked locations: {e}")
+            if not len(self.schedule):
+                raise
+        self.registry_loaded_at = now
+
+    async def _poll(self, entries: List[ScheduledLocation]):
+        readings: Dict[str, Dict[str, Any]] = {}
+        try:
+            readings = await self._fetch_and_process_weather([entry.as_dict() for entry in entries])
+        finally:
+            breaker = self.weather_service.breaker
+            for entry in entries:
+                reading = readings.get(entry.location)
+                if reading is None and breaker.state != "closed":
+                    # Запрос не дошёл до API или отклонён цепью: повторим, как только она пустит
+                    self.schedule.retry(entry, time.monotonic() + breaker.retry_in())
+                else:
+                    self.schedule.reschedule(entry, reading)
+
+    async def _load_locations(self) -> List[Dict[str, Any]]:
+        async with async_session_maker() as session:
+            stmt = select(
+                TrackedLocation.location,
+                TrackedLocation.latitude,
+                TrackedLocation.longitude,
+            ).where(TrackedLocation.is_active == True)  # noqa: E712
+            result = await session.execute(stmt)
+            locations = [dict(row._mapping) for row in result]
+
+        if not locations:
+            # Реестр пуст: работаем с локацией по умолчанию
+            locations = [{
+                "location": location_key(settings.LATITUDE, settings.LONGITUDE),
+                "latitude": settings.LATITUDE,
+                "longitude": settings.LONGITUDE,
+            }]
+        return locations
+
+    async def _fetch_and_process_weather(self, locations: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        # Один опрос: показания, записанные в БД, по ключу локации
+        started = time.monotonic()
+        self.last_tick_started_at = datetime.now(timezone.utc)
+        self.last_tick_locations = len(locations)
+        self.last_tick_failed = 0
+        self.pending_locations = len(locations)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        received: Dict[str, Dict[str, Any]] = {}
+
+        async def worker(chunk: List[Dict[str, Any]]):
+            try:
+                async with semaphore:
+                    readings = await self._process_chunk(chunk)
+                self.last_tick_failed += len(chunk) - len(readings)
+                for reading in readings:
+                    received[reading["location"]] = reading
+            finally:
+                self.pending_locations -= len(chunk)
+
+        try:
+            await asyncio.gather(*(
+                worker(chunk)
+                for chunk in chunked(locations, self.weather_service.batch_size)
+            ))
+        finally:
+            self.pending_locations = 0
+            self.tick_count += 1
+            self.last_tick_duration = time.monotonic() - started
+            BACKGROUND_TICK_DURATION.observe(self.last_tick_duration)
+            logger.info(
+                f"Weather tick finished: {len(locations)} locations, "
+                f"{self.last_tick_failed} failed, {self.last_tick_duration:.2f}s"
+            )
+        return received
+
+    async def _process_chunk(self, chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        results = await self.weather_service.fetch_current_weather_many(
+            (location["latitude"], location["longitude"]) for location in chunk
+        )
+
+        recorded_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        readings = []
+        for location in chunk:
+            weather_data = results.get(location["location"])
+            if not weather_data:
+                logger.warning(f"No weather data received for {location['location']}")
+                continue
+            readings.append({**weather_data, "recorded_at": recorded_at})
+
+        # Запись, кэш и уведомления — в write-behind батчере
+        if readings and await weather_writer.submit(readings):
+            return readings
+        return []
 
 
-background_task = BackgroundTask()
\ No newline at end of file
+background_task = BackgroundTask()
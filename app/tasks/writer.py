@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.cache.cache import cache, ITEMS, HISTORY, weather_current_key
+from app.config import settings
+from app.db.db import async_session_maker, dialect_insert
+from app.models.models import WeatherItem
+from app.nats.client import NATSService
+from app.services.history import insert_history
+from app.services.hotstore import hot_store
+from app.services.rollups import apply_readings
+from app.ws.websocket import manager
+
+logger = logging.getLogger(__name__)
+
+ITEM_COLUMNS = [
+    WeatherItem.id,
+    WeatherItem.location,
+    WeatherItem.temperature,
+    WeatherItem.humidity,
+    WeatherItem.wind_speed,
+    WeatherItem.timestamp,
+]
+
+
+def _item_dict(row) -> Dict[str, Any]:
+    # Тот же формат, что WeatherItem.to_dict()
+    data = dict(row._mapping)
+    if data["timestamp"] is not None:
+        data["timestamp"] = data["timestamp"].isoformat()
+    return data
+
+
+# Write-behind запись показаний: копит их до WRITE_BATCH_SIZE строк или
+# WRITE_BATCH_WINDOW секунд и пишет одной транзакцией — один upsert
+# weather_items, одна вставка в weather_history и роллапы
+class WeatherWriter:
+    def __init__(self):
+        self.is_running = False
+        self.task: Optional[asyncio.Task] = None
+        self.batch_size = settings.WRITE_BATCH_SIZE
+        self.window = settings.WRITE_BATCH_WINDOW
+        self._pending: List[Tuple[List[Dict[str, Any]], asyncio.Future]] = []
+        self._pending_rows = 0
+        self._has_data = asyncio.Event()
+        self._full = asyncio.Event()
+
+        # Метрики
+        self.flush_count = 0
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.last_flush_rows = 0
+        self.last_flush_duration: Optional[float] = None
+
+    async def start(self):
+        if self.is_running:
+            logger.warning("Weather writer is already running")
+            return
+
+        self.is_running = True
+        self.task = asyncio.create_task(self._run())
+        logger.info("Weather writer started")
+
+    async def stop(self):
+        # Дописывает всё, что накоплено, и только потом выходит
+        self.is_running = False
+        self._has_data.set()
+        self._full.set()
+        if self.task:
+            await self.task
+            self.task = None
+        logger.info("Weather writer stopped")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "is_running": self.is_running,
+            "batch_size": self.batch_size,
+            "window": self.window,
+            "pending_rows": self._pending_rows,
+            "flush_count": self.flush_count,
+            "rows_written": self.rows_written,
+            "rows_failed": self.rows_failed,
+            "last_flush_rows": self.last_flush_rows,
+            "last_flush_duration": self.last_flush_duration,
+        }
+
+    async def submit(self, readings: List[Dict[str, Any]]) -> bool:
+        # Ждёт коммита пачки, в которую попали показания
+        if not readings:
+            return True
+        if not self.is_running:
+            return await self._flush([(readings, None)])
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((readings, future))
+        self._pending_rows += len(readings)
+        self._has_data.set()
+        if self._pending_rows >= self.batch_size:
+            self._full.set()
+        return await future
+
+    async def _run(self):
+        while self.is_running or self._pending:
+            await self._has_data.wait()
+            if self.is_running and not self._full.is_set():
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=self.window)
+                except asyncio.TimeoutError:
+                    pass
+
+            # Не больше batch_size строк за транзакцию (submit целиком)
+            taken, rows = 0, 0
+            while taken < len(self._pending) and rows < self.batch_size:
+                rows += len(self._pending[taken][0])
+                taken += 1
+            pending, self._pending = self._pending[:taken], self._pending[taken:]
+            self._pending_rows -= rows
+            if not self._pending:
+                self._has_data.clear()
+            if self._pending_rows < self.batch_size:
+                self._full.clear()
+            if pending:
+                try:
+                    await self._flush(pending)
+                except Exception as e:
+                    # Цикл не должен падать: иначе submit() ждёт вечно
+                    logger.error(f"Weather writer flush failed: {e}")
+                    for _, future in pending:
+                        if future is not None and not future.done():
+                            future.set_result(False)
+
+    async def _flush(self, pending: List[Tuple[List[Dict[str, Any]], Optional[asyncio.Future]]]) -> bool:
+        readings = [reading for batch, _ in pending for reading in batch]
+        started = time.monotonic()
+        try:
+            items = await self._write(readings)
+            ok = True
+        except Exception as e:
+            logger.error(f"Error writing weather batch of {len(readings)} readings: {e}")
+            ok = False
+
+        for _, future in pending:
+            if future is not None and not future.done():
+                future.set_result(ok)
+
+        self.flush_count += 1
+        self.last_flush_rows = len(readings)
+        self.last_flush_duration = time.monotonic() - started
+        if not ok:
+            self.rows_failed += len(readings)
+            return False
+
+        self.rows_written += len(readings)
+        logger.info(f"Stored {len(readings)} readings in {self.last_flush_duration:.3f}s")
+        try:
+            hot_store.extend(readings)
+            await self._announce(items)
+        except Exception as e:
+            # Строки уже закоммичены, пачку считаем записанной
+            logger.error(f"Error announcing weather batch of {len(items)} items: {e}")
+        return True
+
+    async def _write(self, readings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # ON CONFLICT DO UPDATE не может дважды обновить одну строку в одном
+        # запросе: в weather_items идёт последнее показание по локации.
+        # Строка загрузки локации — по ingest_key, записи API не трогаем
+        latest = {reading["location"]: reading for reading in readings}
+        async with async_session_maker() as session:
+            stmt = dialect_insert(session, WeatherItem)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[WeatherItem.ingest_key],
+                set_={
+                    "location": stmt.excluded.location,
+                    "temperature": stmt.excluded.temperature,
+                    "humidity": stmt.excluded.humidity,
+                    "wind_speed": stmt.excluded.wind_speed,
+                },
+            ).returning(*ITEM_COLUMNS)
+            # executemany с RETURNING: SQLAlchemy склеивает строки в пачки
+            # INSERT ... VALUES, сам запрос компилируется один раз
+            result = await session.execute(stmt, [
+                {
+                    "location": reading["location"],
+                    "ingest_key": reading["location"],
+                    "temperature": reading["temperature"],
+                    "humidity": reading["humidity"],
+                    "wind_speed": reading["wind_speed"],
+                }
+                for reading in latest.values()
+            ])
+            items = [_item_dict(row) for row in result]
+
+            await insert_history(session, readings)
+            await apply_readings(session, readings)
+            await session.commit()
+        return items
+
+    async def _announce(self, items: List[Dict[str, Any]]):
+        keys = [weather_current_key(item["location"]) for item in items]
+        await cache.invalidate(namespaces=[ITEMS, HISTORY], keys=keys)
+        for key, item in zip(keys, items):
+            # Свежие показания сразу кладём в кэш /weather/current
+            await cache.set(key, {
+                "location": item["location"],
+                "temperature": item["temperature"],
+                "humidity": item["humidity"],
+                "wind_speed": item["wind_speed"],
+            }, settings.WEATHER_CACHE_TTL)
+
+        for item in items:
+            await NATSService.publish_weather_data(item)
+            await manager.broadcast_item_update("created", item)
+
+
+weather_writer = WeatherWriter()
@@ -0,0 +1,6 @@
+from typing import Any, Iterable, List
+
+
+def chunked(items: List[Any], size: int) -> Iterable[List[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
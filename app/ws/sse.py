@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from typing import List, Optional
+from fastapi import Query, Request
+from fastapi.responses import StreamingResponse
+from app.codecs import CODECS, JSON, Frame
+from app.ws.websocket import ClientConnection, manager
+
+logger = logging.getLogger(__name__)
+
+# Чанков ответа впереди сети: дальше отправка ждёт, и зависшего клиента
+# отключает сторож ConnectionManager, как и WebSocket
+SSE_BUFFER = 16
+
+
+# Вместо сокета для ConnectionManager: ключ в clients и close() при отключении
+class SSEStream:
+    def __init__(self):
+        self.chunks: asyncio.Queue = asyncio.Queue(maxsize=SSE_BUFFER)
+        self.close_code: Optional[int] = None
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
+        while True:
+            try:
+                self.chunks.put_nowait(None)
+                return
+            except asyncio.QueueFull:
+                self.chunks.get_nowait()
+
+
+# Те же очередь, политика медленного клиента и подписки, что у WebSocket;
+# кадр пишется событием SSE. id — курсор для Last-Event-ID
+class SSEConnection(ClientConnection):
+    async def write(self, frame: Frame):
+        message = frame.message
+        lines = []
+        if message.get("seq") is not None:
+            lines.append(f"id: {self.manager.stream_id}:{message['seq']}\n")
+        lines.append(f"event: {message.get('type', 'message')}\n")
+        lines.append(f"data: {frame.text(self.codec)}\n\n")
+        await self.websocket.chunks.put("".join(lines))
+
+
+async def sse_endpoint(
+    request: Request,
+    topic: List[str] = Query([]),
+    since: Optional[str] = None,
+):
+    # /sse/items?topic=location:...&topic=event:updated — для клиентов без
+    # WebSocket. EventSource при переподключении сам присылает Last-Event-ID
+    stream = SSEStream()
+    client = SSEConnection(manager, stream, CODECS[JSON])
+    await manager.attach(client, topic, request.headers.get("last-event-id") or since)
+    logger.info(f"Новый SSE клиент. Всего: {len(manager.clients)}")
+
+    async def events():
+        try:
+            # Через сколько переподключаться после обрыва, ms
+            yield "retry: 3000\n\n"
+            while True:
+                chunk = await stream.chunks.get()
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            manager.disconnect(stream)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
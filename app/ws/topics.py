@@ -0,0 +1,66 @@
+from typing import Any, Dict, Iterable, List, Set
+
+# Темы подписки /ws/items:
+#   *                     — все события (по умолчанию, пока клиент не подписался)
+#   location:<location>   — записи с этой локацией, например location:55.7558,37.6173
+#   item:<id>             — одна запись
+#   event:<action>        — created | updated | deleted
+# Клиент получает событие, если совпала хотя бы одна из его тем
+ALL = "*"
+EVENTS = ("created", "updated", "deleted")
+
+
+def parse_topic(topic: Any) -> str:
+    if topic == ALL:
+        return ALL
+    if not isinstance(topic, str) or ":" not in topic:
+        raise ValueError(f"Invalid topic: {topic!r}")
+    kind, value = topic.split(":", 1)
+    if kind == "location" and value:
+        return topic
+    if kind == "item":
+        try:
+            return f"item:{int(value)}"
+        except ValueError:
+            raise ValueError(f"Invalid item id in topic: {topic!r}")
+    if kind == "event" and value in EVENTS:
+        return topic
+    raise ValueError(f"Invalid topic: {topic!r}")
+
+
+def item_topics(item: Dict[str, Any]) -> List[str]:
+    topics = []
+    if item.get("id") is not None:
+        topics.append(f"item:{item['id']}")
+    if item.get("location") is not None:
+        topics.append(f"location:{item['location']}")
+    return topics
+
+
+# Индекс тема -> подписчики: рассылка перебирает только подписчиков тем
+# события, а не все соединения
+class TopicIndex:
+    def __init__(self):
+        self.subscribers: Dict[str, Set[Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self.subscribers)
+
+    def add(self, topic: str, subscriber: Any):
+        self.subscribers.setdefault(topic, set()).add(subscriber)
+
+    def discard(self, topic: str, subscriber: Any):
+        subscribers = self.subscribers.get(topic)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self.subscribers[topic]
+
+    def match(self, topics: Iterable[str]) -> Set[Any]:
+        matched: Set[Any] = set()
+        for topic in topics:
+            subscribers = self.subscribers.get(topic)
+            if subscribers:
+                matched |= subscribers
+        return matched
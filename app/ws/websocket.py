@@ -1,67 +1,641 @@
-import json
 import asyncio
 import logging
-from typing import Dict, Any, List
+import time
+import uuid
+from collections import deque
+from itertools import islice
+from typing import Dict, Any, Deque, FrozenSet, List, Optional, Set, Tuple, Union
 from fastapi import WebSocket, WebSocketDisconnect
-from app.models.schemas import WebSocketMessage
+from sqlalchemy import select
+from app.codecs import CODECS, JSON, Codec, Frame
+from app.config import settings
+from app.db.db import read_session_maker
+from app.metrics import WS_BROADCAST_DURATION
+from app.models.models import WeatherItem
+from app.nats.client import nats_client
+from app.ws.topics import ALL, TopicIndex, item_topics, parse_topic
 
 logger = logging.getLogger(__name__)
 
+DROP_OLDEST = "drop_oldest"
+COALESCE = "coalesce"
+DISCONNECT = "disconnect"
+
+# 1008 — policy violation: клиент не успевает читать
+SLOW_CONSUMER_CODE = 1008
+GOING_AWAY_CODE = 1001
+
+
+def negotiate_codec(websocket: WebSocket) -> Optional[str]:
+    # Клиент перечисляет форматы в Sec-WebSocket-Protocol (json, msgpack)
+    # в порядке предпочтения; без заголовка — JSON текстовыми кадрами
+    for subprotocol in websocket.scope.get("subprotocols", []):
+        if subprotocol in CODECS:
+            return subprotocol
+    return None
+
+
+async def send_frame(websocket: WebSocket, codec: Codec, frame: Frame):
+    if codec.binary:
+        await websocket.send_bytes(frame.encode(codec))
+    else:
+        await websocket.send_text(frame.text(codec))
+
+
+# Подключённый клиент: своя ограниченная очередь кадров и своя задача
+# отправки. Медленный сокет задерживает только собственную очередь
+class ClientConnection:
+    def __init__(self, manager: "ConnectionManager", websocket: WebSocket, codec: Codec):
+        self.manager = manager
+        self.websocket = websocket
+        self.codec = codec
+        # (ключ для coalesce, кадр)
+        self.queue: Deque[Tuple[Any, Frame]] = deque()
+        # Пока клиент не подписался явно, он получает всё
+        self.topics: Set[str] = {ALL}
+        self.subscribed = False
+        self.last_seen = time.monotonic()
+        # Начало текущей отправки: зависший сокет отключает сторож менеджера
+        self.sending_since: Optional[float] = None
+        self.sent = 0
+        self.dropped = 0
+        self._waiter: Optional[asyncio.Future] = None
+        self.task = asyncio.create_task(self._run())
+
+    def enqueue(self, frame: Frame, key: Any = None, force: bool = False) -> bool:
+        # Не ждёт сокет. False — клиента надо отключить. force — мимо
+        # лимита очереди (снимок и повтор при переподключении)
+        if not force and len(self.queue) >= self.manager.queue_size:
+            policy = self.manager.slow_policy
+            if policy == DISCONNECT:
+                return False
+            if policy == COALESCE and key is not None and self._coalesce(frame, key):
+                self.manager.frames_coalesced_total += 1
+                return True
+            self.queue.popleft()
+            self.dropped += 1
+            self.manager.frames_dropped_total += 1
+
+        self.queue.append((key, frame))
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+        return True
+
+    def _coalesce(self, frame: Frame, key: Any) -> bool:
+        # Более раннее событие по тому же ключу заменяется последним
+        for index, (queued_key, _) in enumerate(self.queue):
+            if queued_key == key:
+                self.queue[index] = (key, frame)
+                return True
+        return False
+
+    async def write(self, frame: Frame):
+        await send_frame(self.websocket, self.codec, frame)
+
+    async def _run(self):
+        # Без таймера на каждый кадр: на 10k клиентов это 10k таймеров на
+        # событие. Долгие отправки ловит ConnectionManager._watchdog
+        try:
+            while True:
+                if not self.queue:
+                    self._waiter = asyncio.get_running_loop().create_future()
+                    await self._waiter
+                    self._waiter = None
+                    continue
+                _, frame = self.queue.popleft()
+                self.sending_since = time.monotonic()
+                await self.write(frame)
+                self.sending_since = None
+                self.sent += 1
+                self.manager.frames_sent_total += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка отправки WebSocket: {e}")
+            self.manager.disconnect(self.websocket)
+
+
+# Событие в буфере повтора. Кадр хранится уже собранным (и закодированным
+# после первой отправки), для пачек — ещё записи, чтобы отдать подписчику
+# локаций только его часть
+class BufferedEvent:
+    __slots__ = ("seq", "frame", "topics", "action", "items")
+
+    def __init__(
+        self,
+        seq: int,
+        frame: Frame,
+        topics: FrozenSet[str],
+        action: Optional[str] = None,
+        items: Optional[List[Dict[str, Any]]] = None,
+    ):
+        self.seq = seq
+        self.frame = frame
+        self.topics = topics
+        self.action = action
+        self.items = items
+
+
+async def load_items_snapshot() -> List[Dict[str, Any]]:
+    async with read_session_maker() as session:
+        result = await session.execute(select(WeatherItem).order_by(WeatherItem.id))
+        return [item.to_dict() for item in result.scalars()]
+
+
+def wants_everything(topics: Set[str]) -> bool:
+    return ALL in topics or any(topic.startswith("event:") for topic in topics)
+
+
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
-    
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.info(f"Новый WebSocket подключён. Всего: {len(self.active_connections)}")
-    
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        logger.info(f"WebSocket отсоединён. Всего: {len(self.active_connections)}")
-    
-    async def broadcast(self, message: Dict[str, Any]):
-        disconnected = []
-        for connection in self.active_connections:
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        self.index = TopicIndex()
+        self.max_topics = settings.WS_MAX_TOPICS
+        self.queue_size = settings.WS_QUEUE_SIZE
+        self.slow_policy = settings.WS_SLOW_POLICY
+        self.send_timeout = settings.WS_SEND_TIMEOUT
+        self.ping_interval = settings.WS_PING_INTERVAL
+        self.pong_timeout = settings.WS_PONG_TIMEOUT
+        self.coalesce_window = settings.WS_COALESCE_WINDOW
+        # id записи -> [action, данные, сколько событий слито]
+        self._pending: Dict[Any, List[Any]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self.watchdog_task: Optional[asyncio.Task] = None
+        self._closing: Set[asyncio.Task] = set()
+        # Номера событий монотонны в пределах потока stream_id: после
+        # рестарта или на другом воркере номер клиента не имеет смысла
+        self.stream_id = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.history: Deque[BufferedEvent] = deque(maxlen=settings.WS_REPLAY_BUFFER)
+        self.snapshot_chunk = settings.WS_SNAPSHOT_CHUNK
+        self.load_snapshot = load_items_snapshot
+
+        # Метрики
+        self.connections_total = 0
+        self.evicted_total = 0
+        self.frames_sent_total = 0
+        self.frames_dropped_total = 0
+        self.frames_coalesced_total = 0
+        self.broadcast_count = 0
+        self.remote_events_total = 0
+        self.updates_coalesced_total = 0
+        self.last_broadcast_recipients = 0
+        self.last_broadcast_duration: Optional[float] = None
+        self.resumed_total = 0
+        self.replayed_total = 0
+        self.snapshots_total = 0
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.clients)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        depths = [len(client.queue) for client in self.clients.values()]
+        return {
+            "connections": len(self.clients),
+            "connections_total": self.connections_total,
+            "topics": len(self.index),
+            "evicted_total": self.evicted_total,
+            "slow_policy": self.slow_policy,
+            "queue_size": self.queue_size,
+            "queued_frames": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "frames_sent_total": self.frames_sent_total,
+            "frames_dropped_total": self.frames_dropped_total,
+            "frames_coalesced_total": self.frames_coalesced_total,
+            "broadcast_count": self.broadcast_count,
+            "remote_events_total": self.remote_events_total,
+            "updates_coalesced_total": self.updates_coalesced_total,
+            "pending_updates": len(self._pending),
+            "last_broadcast_recipients": self.last_broadcast_recipients,
+            "last_broadcast_duration": self.last_broadcast_duration,
+            "stream_id": self.stream_id,
+            "seq": self.seq,
+            "replay_buffered": len(self.history),
+            "resumed_total": self.resumed_total,
+            "replayed_total": self.replayed_total,
+            "snapshots_total": self.snapshots_total,
+        }
+
+    async def start(self):
+        if self.watchdog_task is None:
+            self.watchdog_task = asyncio.create_task(self._watchdog())
+        # События других воркеров и реплик приходят через NATS
+        await nats_client.subscribe(settings.NATS_TOPIC_ITEMS, self.handle_remote_items)
+        await nats_client.subscribe(settings.NATS_TOPIC_WEATHER, self.handle_remote_weather)
+
+    async def stop(self):
+        if self.watchdog_task:
+            self.watchdog_task.cancel()
             try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Ошибка трансляции сообщения: {e}")
-                disconnected.append(connection)
-        
-        for connection in disconnected:
-            self.disconnect(connection)
-    
+                await self.watchdog_task
+            except asyncio.CancelledError:
+                pass
+            self.watchdog_task = None
+        self._flush_pending()
+        clients = list(self.clients.values())
+        for client in clients:
+            self.evict(client, GOING_AWAY_CODE)
+        await asyncio.gather(
+            *(client.task for client in clients), *self._closing, return_exceptions=True
+        )
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        topics: Optional[List[Any]] = None,
+        since: Optional[str] = None,
+    ) -> ClientConnection:
+        subprotocol = negotiate_codec(websocket)
+        await websocket.accept(subprotocol=subprotocol)
+        client = ClientConnection(self, websocket, CODECS[subprotocol or JSON])
+        await self.attach(client, topics, since)
+        logger.info(f"Новый WebSocket подключён ({client.codec.format}). Всего: {len(self.clients)}")
+        return client
+
+    async def attach(
+        self,
+        client: ClientConnection,
+        topics: Optional[List[Any]] = None,
+        since: Optional[str] = None,
+    ):
+        # Регистрирует клиента и досылает пропущенное с курсора since
+        # ("<stream_id>:<seq>" из hello или id события SSE). Если событий
+        # уже нет в буфере или поток другой — снимок записей, затем события
+        # после него. ValueError — неверные темы
+        error = None
+        try:
+            parsed = {parse_topic(topic) for topic in topics or []}
+            if len(parsed) > self.max_topics:
+                raise ValueError(f"Too many topics: limit is {self.max_topics}")
+        except ValueError as e:
+            parsed, error = set(), str(e)
+
+        try:
+            resume_from = self._resume_point(since) if since else None
+            snapshot = None
+            if resume_from is not None and resume_from < 0:
+                # Снимок не старше текущего номера: события после него
+                # досылаются из буфера, повтор уже учтённого изменения безвреден
+                resume_from = self.seq
+                snapshot = await self.load_snapshot()
+
+            # Дальше без await: между снимком/повтором и живыми событиями нет
+            # ни пропусков, ни дублей
+            self.clients[client.websocket] = client
+            self.index.add(ALL, client)
+            self.connections_total += 1
+            if parsed:
+                self.subscribe(client, list(parsed))
+            # seq в hello — курсор клиента: с него досылается дальнейшее. До
+            # конца снимка курсора нет, номер несёт последняя часть снимка
+            hello = {"type": "hello", "stream": self.stream_id}
+            if snapshot is None:
+                hello["seq"] = self.seq if resume_from is None else resume_from
+            self.send(client, hello)
+            if error is not None:
+                self.send(client, {"type": "error", "detail": error})
+            if snapshot is not None:
+                self._send_snapshot(client, snapshot, resume_from)
+            if resume_from is not None:
+                self.resumed_total += 1
+                self._replay(client, resume_from)
+        except BaseException:
+            # Задача отправки создаётся вместе с клиентом: без этого она
+            # осталась бы висеть (например, если не загрузился снимок)
+            if self.clients.get(client.websocket) is client:
+                self.disconnect(client.websocket)
+            else:
+                client.task.cancel()
+            raise
+
+    def _resume_point(self, since: str) -> int:
+        # Номер, после которого досылать, или -1 — нужен снимок
+        stream, _, seq = since.rpartition(":")
+        try:
+            seq = int(seq)
+        except ValueError:
+            return -1
+        if stream and stream != self.stream_id:
+            return -1
+        if seq > self.seq:
+            return -1
+        if seq < self.seq and (not self.history or self.history[0].seq > seq + 1):
+            return -1
+        return seq
+
+    def _replay(self, client: ClientConnection, since: int):
+        # Повтор идёт мимо лимита очереди: пропущенное не должно вытеснять
+        # само себя. Объём ограничен WS_REPLAY_BUFFER
+        if not self.history:
+            return
+        # Номера в буфере идут подряд — начало находится без перебора
+        start = max(since - self.history[0].seq + 1, 0)
+        for event in islice(self.history, start, None):
+            frame = None
+            if event.items is None:
+                if client.topics & event.topics:
+                    frame = event.frame
+            elif ALL in client.topics or f"event:{event.action}" in client.topics:
+                frame = event.frame
+            else:
+                subset = [item for item in event.items if client.topics.intersection(item_topics(item))]
+                if subset:
+                    frame = Frame({**event.frame.message, "data": {"items": subset}})
+            if frame is not None:
+                client.enqueue(frame, force=True)
+                self.replayed_total += 1
+
+    def _send_snapshot(self, client: ClientConnection, items: List[Dict[str, Any]], seq: int):
+        # {"type": "snapshot", "data": {"items": [...]}, "last": bool} частями
+        # по WS_SNAPSHOT_CHUNK записей, тоже мимо лимита очереди. "seq" — у
+        # последней части: обрыв посреди снимка повторяет снимок целиком
+        if not wants_everything(client.topics):
+            items = [item for item in items if client.topics.intersection(item_topics(item))]
+        chunk = max(self.snapshot_chunk, 1)
+        parts = [items[i:i + chunk] for i in range(0, len(items), chunk)] or [[]]
+        for number, part in enumerate(parts, 1):
+            message = {"type": "snapshot", "data": {"items": part}, "last": number == len(parts)}
+            if message["last"]:
+                message["seq"] = seq
+            client.enqueue(Frame(message), force=True)
+        self.snapshots_total += 1
+
+    def _record(self, frame: Frame, topics: List[str], action: Optional[str] = None, items=None):
+        self.history.append(BufferedEvent(frame.message["seq"], frame, frozenset(topics), action, items))
+
+    def _next_seq(self) -> int:
+        self.seq += 1
+        return self.seq
+
+    def disconnect(self, websocket: WebSocket):
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        for topic in client.topics:
+            self.index.discard(topic, client)
+        client.task.cancel()
+        logger.info(f"WebSocket отсоединён. Всего: {len(self.clients)}")
+
+    def evict(self, client: ClientConnection, code: int = SLOW_CONSUMER_CODE):
+        # Закрывает сокет в фоне: close() к зависшему клиенту тоже может ждать
+        if self.clients.get(client.websocket) is not client:
+            return
+        self.disconnect(client.websocket)
+        if code == SLOW_CONSUMER_CODE:
+            self.evicted_total += 1
+        task = asyncio.create_task(self._close(client.websocket, code))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _close(self, websocket: WebSocket, code: int):
+        try:
+            await asyncio.wait_for(websocket.close(code=code), timeout=self.send_timeout)
+        except Exception:
+            pass
+
+    def send(self, client: ClientConnection, message: Union[Dict[str, Any], Frame], key: Any = None):
+        frame = message if isinstance(message, Frame) else Frame(message)
+        if not client.enqueue(frame, key):
+            logger.warning(f"WebSocket не успевает читать ({len(client.queue)} кадров в очереди), отключаем")
+            self.evict(client)
+
+    def subscribe(self, client: ClientConnection, topics: List[Any]):
+        # ValueError — неверная тема или превышен WS_MAX_TOPICS
+        parsed = {parse_topic(topic) for topic in topics}
+        # Первая явная подписка заменяет подписку на всё
+        current = client.topics if client.subscribed else set()
+        if len(current | parsed) > self.max_topics:
+            raise ValueError(f"Too many topics: limit is {self.max_topics}")
+        if not client.subscribed:
+            client.subscribed = True
+            if ALL not in parsed:
+                self._discard(client, ALL)
+        for topic in parsed:
+            client.topics.add(topic)
+            self.index.add(topic, client)
+
+    def unsubscribe(self, client: ClientConnection, topics: List[Any]):
+        parsed = {parse_topic(topic) for topic in topics}
+        client.subscribed = True
+        for topic in parsed:
+            self._discard(client, topic)
+
+    def _discard(self, client: ClientConnection, topic: str):
+        client.topics.discard(topic)
+        self.index.discard(topic, client)
+
+    async def broadcast(
+        self,
+        message: Union[Dict[str, Any], Frame],
+        key: Any = None,
+        topics: Optional[List[str]] = None,
+    ):
+        self._broadcast(message, key, topics)
+
+    def _broadcast(
+        self,
+        message: Union[Dict[str, Any], Frame],
+        key: Any = None,
+        topics: Optional[List[str]] = None,
+    ):
+        # Только раскладывает кадр по очередям подписчиков тем (без topics —
+        # всем), сокеты не ждёт. Кодируется один раз на формат — первой
+        # задачей отправки
+        started = time.monotonic()
+        frame = message if isinstance(message, Frame) else Frame(message)
+        recipients = self.index.match(topics) if topics is not None else list(self.clients.values())
+        for client in recipients:
+            self.send(client, frame, key)
+        self.broadcast_count += 1
+        self.last_broadcast_recipients = len(recipients)
+        self.last_broadcast_duration = time.monotonic() - started
+        WS_BROADCAST_DURATION.observe(self.last_broadcast_duration)
+
     async def broadcast_item_update(self, action: str, item_data: Dict[str, Any]):
-        message = WebSocketMessage(
-            type=f"item_{action}",
-            data=item_data
+        # С WS_COALESCE_WINDOW > 0 изменения одной записи за окно сливаются
+        # в один кадр (поля последнего изменения поверх предыдущих, action —
+        # первого). Удаление сначала досылает накопленное
+        item_id = item_data.get("id")
+        if self.coalesce_window > 0 and action != "deleted" and item_id is not None:
+            pending = self._pending.get(item_id)
+            if pending is None:
+                self._pending[item_id] = [action, dict(item_data), 1]
+                if self._flush_handle is None:
+                    self._flush_handle = asyncio.get_running_loop().call_later(
+                        self.coalesce_window, self._flush_pending
+                    )
+            else:
+                pending[1].update(item_data)
+                pending[2] += 1
+                self.updates_coalesced_total += 1
+            return
+
+        self._flush_pending()
+        self._broadcast_item(action, item_data)
+
+    def _broadcast_item(self, action: str, item_data: Dict[str, Any], coalesced: int = 1):
+        # Формат WebSocketMessage без валидации pydantic на каждое событие.
+        # При coalesce в очереди медленного клиента остаётся последнее
+        # событие по записи
+        message = {"type": f"item_{action}", "seq": self._next_seq(), "data": item_data}
+        if coalesced > 1:
+            message["coalesced"] = coalesced
+        frame = Frame(message)
+        topics = [ALL, f"event:{action}", *item_topics(item_data)]
+        self._record(frame, topics)
+        self._broadcast(frame, key=("item", item_data.get("id")), topics=topics)
+
+    def _flush_pending(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        for action, item_data, coalesced in pending.values():
+            self._broadcast_item(action, item_data, coalesced)
+
+    async def broadcast_items_batch(self, action: str, items: List[Dict[str, Any]]):
+        # Один кадр на пачку вместо кадра на каждую запись. Подписчики *
+        # и event:<action> получают пачку целиком, подписчики локаций и
+        # записей — только свои записи (одинаковые подмножества кодируются
+        # один раз)
+        self._flush_pending()
+        started = time.monotonic()
+        message_type = f"items_{action}"
+        seq = self._next_seq()
+        frame = Frame({"type": message_type, "seq": seq, "data": {"items": items}})
+        self._record(
+            frame,
+            [ALL, f"event:{action}", *(topic for item in items for topic in item_topics(item))],
+            action,
+            items,
         )
-        await self.broadcast(message.dict())
+        everyone = self.index.match([ALL, f"event:{action}"])
+        for client in everyone:
+            self.send(client, frame)
+
+        partial: Dict[ClientConnection, List[int]] = {}
+        for index, item in enumerate(items):
+            for client in self.index.match(item_topics(item)):
+                if client not in everyone:
+                    partial.setdefault(client, []).append(index)
+
+        frames: Dict[tuple, Frame] = {}
+        for client, indexes in partial.items():
+            subset = tuple(indexes)
+            frame = frames.get(subset)
+            if frame is None:
+                frame = frames[subset] = Frame({
+                    "type": message_type,
+                    "seq": seq,
+                    "data": {"items": [items[index] for index in subset]},
+                })
+            self.send(client, frame)
+
+        self.broadcast_count += 1
+        self.last_broadcast_recipients = len(everyone) + len(partial)
+        self.last_broadcast_duration = time.monotonic() - started
+        WS_BROADCAST_DURATION.observe(self.last_broadcast_duration)
+
+    async def handle_remote_items(self, message: Dict[str, Any]):
+        # Свои события уже разосланы локально — пропускаем
+        if message.get("origin") == nats_client.origin:
+            return
+        self.remote_events_total += 1
+        action = message.get("action")
+        if "items" in message:
+            await self.broadcast_items_batch(action, message["items"])
+        else:
+            await self.broadcast_item_update(action, message.get("data") or {"id": message.get("item_id")})
+
+    async def handle_remote_weather(self, message: Dict[str, Any]):
+        # Показания, записанные другим воркером (WeatherWriter рассылает их
+        # как item_created)
+        if message.get("origin") == nats_client.origin:
+            return
+        self.remote_events_total += 1
+        await self.broadcast_item_update("created", message["data"])
+
+    async def _watchdog(self):
+        # Раз в секунду: отключает клиентов, чья отправка висит дольше
+        # WS_SEND_TIMEOUT, и раз в WS_PING_INTERVAL шлёт ping (один кадр
+        # на всех). При WS_PONG_TIMEOUT > 0 молчащие клиенты отключаются
+        last_ping = time.monotonic()
+        while True:
+            await asyncio.sleep(1.0)
+            now = time.monotonic()
+            ping = None
+            if self.ping_interval > 0 and now - last_ping >= self.ping_interval:
+                ping = Frame({"type": "ping", "timestamp": now})
+                last_ping = now
+
+            for client in list(self.clients.values()):
+                if client.sending_since is not None and now - client.sending_since > self.send_timeout:
+                    logger.warning(f"WebSocket не принимает кадры {self.send_timeout}s, отключаем")
+                    self.evict(client)
+                elif self.pong_timeout > 0 and now - client.last_seen > self.pong_timeout:
+                    logger.warning(f"WebSocket не отвечает {self.pong_timeout}s, отключаем")
+                    self.evict(client)
+                elif ping is not None:
+                    self.send(client, ping, key="ping")
 
 manager = ConnectionManager()
 
 
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    # /ws/items?since=<stream>:<seq>&topic=location:...&topic=event:updated
+    client = await manager.connect(
+        websocket,
+        topics=websocket.query_params.getlist("topic"),
+        since=websocket.query_params.get("since"),
+    )
+    codec = client.codec
     try:
         while True:
-            data = await websocket.receive_text()
+            received = await websocket.receive()
+            if received["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(received.get("code", 1000))
+            client.last_seen = time.monotonic()
+            data = received.get("bytes")
+            if data is None:
+                data = (received.get("text") or "").encode()
             try:
-                message = json.loads(data)
-                logger.info(f"Получено WebSocket сообщение: {message}")
-                
-                # Echo back (or process as needed)
-                await websocket.send_json({
-                    "type": "echo",
-                    "data": message,
-                    "timestamp": asyncio.get_event_loop().time()
-                })
-            except json.JSONDecodeError:
-                logger.warning(f"Получен невалидный JSON: {data}")
+                message = codec.decode(data)
+            except ValueError:
+                logger.warning(f"Получено сообщение не в формате {codec.format}: {data!r}")
+                continue
+
+            message_type = message.get("type") if isinstance(message, dict) else None
+            if message_type == "pong":
+                continue
+            if message_type == "ping":
+                manager.send(client, {"type": "pong", "timestamp": asyncio.get_event_loop().time()})
+                continue
+            if message_type in ("subscribe", "unsubscribe"):
+                # {"type": "subscribe", "topics": ["location:55.7558,37.6173", "event:updated"]}
+                try:
+                    topics = message.get("topics")
+                    if not isinstance(topics, list):
+                        raise ValueError("topics must be a list")
+                    if message_type == "subscribe":
+                        manager.subscribe(client, topics)
+                    else:
+                        manager.unsubscribe(client, topics)
+                except ValueError as e:
+                    manager.send(client, {"type": "error", "detail": str(e)})
+                    continue
+                manager.send(client, {"type": "subscriptions", "topics": sorted(client.topics)})
+                continue
+
+            logger.info(f"Получено WebSocket сообщение: {message}")
+            # Echo back (or process as needed)
+            manager.send(client, {
+                "type": "echo",
+                "data": message,
+                "timestamp": asyncio.get_event_loop().time()
+            })
     except WebSocketDisconnect:
         manager.disconnect(websocket)
     except Exception as e:
         logger.error(f"Ошибка WebSocket: {e}")
-        manager.disconnect(websocket)
\ No newline at end of file
+        manager.disconnect(websocket)
@@ -0,0 +1,89 @@
+"""Микробенчмарк кодеков NATS/WebSocket: CPU на сообщение и размер.
+
+Запуск: python -m bench.codecs [--messages 20000] [--clients 50]
+Сравнивает stdlib json, orjson и msgpack на событии одной записи и на
+пачке из 100 записей, плюс рассылку WebSocket: старый путь
+(WebSocketMessage(...).dict() и json.dumps на каждого клиента) против
+Frame, закодированного один раз.
+"""
+import argparse
+import json
+import time
+
+from app.codecs import Frame, MsgpackCodec, OrjsonCodec, StdlibJSONCodec, msgpack, orjson
+from app.models.schemas import WebSocketMessage
+
+
+def make_item(i: int):
+    return {
+        "id": i,
+        "location": f"{55 + i % 90 / 100:.4f},{37 + i % 180 / 100:.4f}",
+        "temperature": 12.3 + i % 10,
+        "humidity": 61.0,
+        "wind_speed": 4.2,
+        "timestamp": "2024-01-01T12:00:00.123456",
+    }
+
+
+def codecs():
+    available = [StdlibJSONCodec()]
+    if orjson is not None:
+        available.append(OrjsonCodec())
+    if msgpack is not None:
+        available.append(MsgpackCodec())
+    return available
+
+
+def measure(fn, count: int) -> float:
+    # CPU-время процесса на одну операцию, мкс
+    started = time.process_time()
+    for _ in range(count):
+        fn()
+    return (time.process_time() - started) / count * 1e6
+
+
+def bench_payloads(count: int):
+    messages = {
+        "item": {"action": "created", "item_id": 1, "data": make_item(1), "timestamp": 12345.678},
+        "batch100": {"action": "created", "items": [make_item(i) for i in range(100)], "timestamp": 12345.678},
+    }
+    for name, message in messages.items():
+        n = count if name == "item" else max(count // 100, 1)
+        for codec in codecs():
+            payload = codec.encode(message)
+            assert codec.decode(payload) == message
+            encode = measure(lambda: codec.encode(message), n)
+            decode = measure(lambda: codec.decode(payload), n)
+            print(
+                f"{name:<9} {codec.name:<8} size={len(payload):6d}B "
+                f"encode={encode:8.2f}us decode={decode:8.2f}us"
+            )
+
+
+def bench_broadcast(count: int, clients: int):
+    item = make_item(1)
+    codec = OrjsonCodec() if orjson is not None else StdlibJSONCodec()
+
+    def old():
+        message = WebSocketMessage(type="item_created", data=item).dict()
+        for _ in range(clients):
+            json.dumps(message)
+
+    def new():
+        frame = Frame({"type": "item_created", "data": item})
+        for _ in range(clients):
+            frame.text(codec)
+
+    n = max(count // clients, 1)
+    print(f"broadcast to {clients} clients, per event:")
+    print(f"  send_json per client       {measure(old, n):9.2f}us")
+    print(f"  {'Frame once (' + codec.name + ')':<26} {measure(new, n):9.2f}us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=50)
+    args = parser.parse_args()
+    bench_payloads(args.messages)
+    bench_broadcast(args.messages, args.clients)
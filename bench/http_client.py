@@ -0,0 +1,87 @@
+"""Микробенчмарк: новый httpx.AsyncClient на запрос против общего пула.
+
+Запуск: python -m bench.http_client [--requests 500] [--concurrency 10]
+Поднимает локальный HTTP/1.1 stub, внешняя сеть не нужна.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app.services.http import HTTPClient
+
+BODY = b'{"current": {"temperature_2m": 1.0, "relative_humidity_2m": 50, "wind_speed_10m": 3}}'
+RESPONSE = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: application/json\r\n"
+    b"Content-Length: " + str(len(BODY)).encode() + b"\r\n"
+    b"Connection: keep-alive\r\n\r\n" + BODY
+)
+
+
+async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            request = await reader.readuntil(b"\r\n\r\n")
+            if not request:
+                break
+            writer.write(RESPONSE)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+
+async def run(name, fetch, url, total, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            response = await fetch(url)
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(
+        f"{name:<12} mean={statistics.mean(latencies):7.3f}ms "
+        f"p50={latencies[len(latencies) // 2]:7.3f}ms "
+        f"p95={latencies[int(len(latencies) * 0.95)]:7.3f}ms "
+        f"rps={total / elapsed:8.1f}"
+    )
+
+
+async def main(total: int, concurrency: int):
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/v1/forecast"
+
+    async def per_request(url):
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            return await client.get(url)
+
+    shared = HTTPClient()
+
+    async def pooled(url):
+        return await shared.client.get(url)
+
+    async with server:
+        await run("per-request", per_request, url, total, concurrency)
+        await run("shared-pool", pooled, url, total, concurrency)
+        await shared.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
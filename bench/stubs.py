@@ -0,0 +1,310 @@
+"""Локальные заглушки для нагрузочных тестов и проверок: Open-Meteo, NATS, Redis.
+
+OpenMeteoStub — HTTP/1.1 сервер с ответом в формате Open-Meteo на один
+или несколько наборов координат (списки через запятую), с настраиваемой
+задержкой. NATS — настоящий nats-server ($NATS_SERVER_BIN или PATH), если
+он есть, иначе NATSStub: core NATS в процессе (PUB/HPUB/SUB/UNSUB/PING),
+без JetStream, но с доставкой между воркерами приложения. RedisStub —
+RESP2 сервер в процессе с командами, которые использует RedisCache
+(GET/SET с PX и EX/DEL/INCR/PING/AUTH/SELECT), и TTL по monotonic-часам.
+"""
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+
+class StubServer:
+    # TCP сервер на свободном порту. stop() закрывает соединения и ждёт
+    # обработчики: иначе asyncio.run отменяет их с трассировкой в stderr
+    def __init__(self):
+        self.server: Optional[asyncio.base_events.Server] = None
+        self.port = 0
+        self.connections: Dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._accept, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is None:
+            return
+        self.server.close()
+        for writer in list(self.connections):
+            writer.close()
+        await asyncio.gather(*self.connections.values(), return_exceptions=True)
+        await self.server.wait_closed()
+        self.server = None
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections[writer] = asyncio.current_task()
+        try:
+            await self._handle(reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self.connections[writer]
+            writer.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        raise NotImplementedError
+
+
+class OpenMeteoStub(StubServer):
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.requests = 0
+        self.coordinates = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1/forecast"
+
+    def _body(self, target: str) -> bytes:
+        query = parse_qs(urlsplit(target).query)
+        latitudes = query.get("latitude", ["0"])[0].split(",")
+        self.requests += 1
+        self.coordinates += len(latitudes)
+        entries = [
+            {
+                "current": {
+                    "temperature_2m": round(10 + (i * 7 + self.requests) % 200 / 10, 1),
+                    "relative_humidity_2m": 40 + i % 50,
+                    "wind_speed_10m": round(i % 120 / 10, 1),
+                }
+            }
+            for i in range(len(latitudes))
+        ]
+        # Как и Open-Meteo: на одни координаты — объект, на несколько — массив
+        return json.dumps(entries[0] if len(entries) == 1 else entries).encode()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            target = head.split(b" ", 2)[1].decode()
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            body = self._body(target)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+            )
+            await writer.drain()
+
+
+def subject_matches(pattern: str, subject: str) -> bool:
+    pattern_tokens = pattern.split(".")
+    subject_tokens = subject.split(".")
+    for index, token in enumerate(pattern_tokens):
+        if token == ">":
+            return len(subject_tokens) > index
+        if index >= len(subject_tokens) or (token != "*" and token != subject_tokens[index]):
+            return False
+    return len(pattern_tokens) == len(subject_tokens)
+
+
+class NATSStub(StubServer):
+    def __init__(self):
+        super().__init__()
+        # (writer, sid) -> subject
+        self.subscriptions: Dict[Tuple[asyncio.StreamWriter, str], str] = {}
+        self.messages = 0
+
+    @property
+    def url(self) -> str:
+        return f"nats://127.0.0.1:{self.port}"
+
+    def _deliver(self, subject: str, reply: Optional[str], data: bytes, header_size: Optional[int]):
+        self.messages += 1
+        reply_part = f" {reply}" if reply else ""
+        for (writer, sid), pattern in list(self.subscriptions.items()):
+            if not subject_matches(pattern, subject):
+                continue
+            if header_size is None:
+                line = f"MSG {subject} {sid}{reply_part} {len(data)}\r\n"
+            else:
+                line = f"HMSG {subject} {sid}{reply_part} {header_size} {len(data)}\r\n"
+            writer.write(line.encode() + data + b"\r\n")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        info = {
+            "server_id": "bench-stub", "server_name": "bench-stub", "version": "2.10.0",
+            "proto": 1, "headers": True, "max_payload": 8 * 1024 * 1024,
+            "host": "127.0.0.1", "port": self.port,
+        }
+        writer.write(f"INFO {json.dumps(info)}\r\n".encode())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                parts = line.decode().split()
+                if not parts:
+                    continue
+                op = parts[0].upper()
+                if op == "PING":
+                    writer.write(b"PONG\r\n")
+                elif op == "SUB":
+                    self.subscriptions[(writer, parts[-1])] = parts[1]
+                elif op == "UNSUB":
+                    self.subscriptions.pop((writer, parts[1]), None)
+                elif op == "PUB":
+                    data = (await reader.readexactly(int(parts[-1]) + 2))[:-2]
+                    self._deliver(parts[1], parts[2] if len(parts) == 4 else None, data, None)
+                elif op == "HPUB":
+                    data = (await reader.readexactly(int(parts[-1]) + 2))[:-2]
+                    self._deliver(parts[1], parts[2] if len(parts) == 5 else None, data, int(parts[-2]))
+                # CONNECT, PONG — без ответа (verbose выключен)
+                await writer.drain()
+        finally:
+            for key in [key for key in self.subscriptions if key[0] is writer]:
+                del self.subscriptions[key]
+
+
+class RedisStub(StubServer):
+    def __init__(self, password: Optional[str] = None):
+        super().__init__()
+        self.password = password
+        # key -> (value, expires_at или None)
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.commands = 0
+
+    @property
+    def url(self) -> str:
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}127.0.0.1:{self.port}/0"
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def _execute(self, args: List[bytes], authenticated: bool) -> bytes:
+        command = args[0].upper()
+        if command == b"AUTH":
+            if args[-1].decode() != self.password:
+                return b"-WRONGPASS invalid password\r\n"
+            return b"+OK\r\n"
+        if not authenticated:
+            return b"-NOAUTH Authentication required.\r\n"
+        if command == b"PING":
+            return b"+PONG\r\n"
+        if command == b"SELECT":
+            return b"+OK\r\n"
+        if command == b"GET":
+            value = self._get(args[1])
+            return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+        if command == b"SET":
+            expires_at = None
+            options = [arg.upper() for arg in args[3:]]
+            if b"PX" in options:
+                expires_at = time.monotonic() + int(args[3 + options.index(b"PX") + 1]) / 1000
+            elif b"EX" in options:
+                expires_at = time.monotonic() + int(args[3 + options.index(b"EX") + 1])
+            self.data[args[1]] = (args[2], expires_at)
+            return b"+OK\r\n"
+        if command == b"DEL":
+            deleted = sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+            return b":%d\r\n" % deleted
+        if command == b"INCR":
+            current = self._get(args[1])
+            try:
+                value = int(current or 0) + 1
+            except ValueError:
+                return b"-ERR value is not an integer or out of range\r\n"
+            entry = self.data.get(args[1])
+            self.data[args[1]] = (str(value).encode(), entry[1] if entry else None)
+            return b":%d\r\n" % value
+        return b"-ERR unknown command '%s'\r\n" % args[0]
+
+    async def _read_command(self, reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline-команда (redis-cli, telnet)
+            return line.split()
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        authenticated = self.password is None
+        while True:
+            args = await self._read_command(reader)
+            if args is None:
+                break
+            if not args:
+                continue
+            self.commands += 1
+            reply = self._execute(args, authenticated)
+            if args[0].upper() == b"AUTH" and reply.startswith(b"+"):
+                authenticated = True
+            writer.write(reply)
+            await writer.drain()
+
+
+class NATSServerProcess:
+    def __init__(self, binary: str):
+        self.binary = binary
+        self.process: Optional[subprocess.Popen] = None
+        self.port = 0
+
+    @property
+    def url(self) -> str:
+        return f"nats://127.0.0.1:{self.port}"
+
+    async def start(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.process = subprocess.Popen(
+            [self.binary, "-a", "127.0.0.1", "-p", str(self.port)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=0.2).close()
+                return
+            except OSError:
+                await asyncio.sleep(0.05)
+        raise RuntimeError("nats-server did not start")
+
+    async def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+
+def create_nats(kind: str = "auto"):
+    # auto — nats-server, если найден, иначе заглушка в процессе
+    binary = os.environ.get("NATS_SERVER_BIN") or shutil.which("nats-server")
+    if kind == "server" or (kind == "auto" and binary):
+        if not binary:
+            raise RuntimeError("nats-server not found: set NATS_SERVER_BIN or pip install nats-server-bin")
+        return NATSServerProcess(binary)
+    return NATSStub()
+
+
+def nats_kind(nats) -> str:
+    return "nats-server" if isinstance(nats, NATSServerProcess) else "stub"
+
+
+def locations(count: int) -> List[Tuple[float, float]]:
+    # Разные координаты в пределах сетки 0.01°
+    return [(round(40 + i // 300 * 0.01, 2), round(20 + i % 300 * 0.01, 2)) for i in range(count)]
@@ -0,0 +1,475 @@
+"""Нагрузочный набор: приложение целиком против локальных заглушек.
+
+Запуск:
+    python -m bench.suite run [--scenarios items,history,ws,ingest] [--workers 1] [--out FILE]
+    python -m bench.suite compare BASE.json NEW.json
+
+Поднимает заглушку Open-Meteo и NATS (nats-server, если найден, иначе
+заглушку в процессе, --nats), запускает uvicorn app.main:app на временной
+SQLite (или --database-url) и гоняет сценарии:
+    items    — CRUD /items: create/get/patch/list/delete с --concurrency
+    history  — /weather/history по окнам --history-hours на засеянной истории
+               (--history-layout columns — столбцы из памяти или БД)
+    ws       — задержка доставки item_updated --ws-clients клиентам /ws/items
+    ingest   — POST /tasks/run на --ingest-locations отслеживаемых локаций
+Результат — JSON с p50/p95/p99 и пропускной способностью, коммитом и
+параметрами в bench/results/<время>-<коммит>.json; compare печатает
+разницу двух прогонов.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+import websockets
+
+from bench.stubs import OpenMeteoStub, create_nats, locations, nats_kind
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS = ROOT / "bench" / "results"
+SCENARIOS = ("items", "history", "ws", "ingest")
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] if values else 0.0
+
+
+def summary(latencies: List[float], elapsed: Optional[float] = None) -> Dict[str, Any]:
+    # Задержки в миллисекундах, throughput — операций в секунду
+    result = {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 3),
+    }
+    if elapsed is not None:
+        result["throughput"] = round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0
+    return result
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"], cwd=ROOT).returncode != 0
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def seed_history(env: Dict[str, str], workdir: Path, count: int, days: int, step_minutes: int) -> int:
+    # Засеивает weather_history через штатный импорт выгрузки
+    path = workdir / "history.ndjson"
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    rows = 0
+    with open(path, "w") as f:
+        for lat, lon in locations(count):
+            recorded_at = now - timedelta(days=days)
+            while recorded_at < now:
+                f.write(json.dumps({
+                    "location": f"{lat},{lon}",
+                    "temperature": round(random.uniform(-20, 30), 1),
+                    "humidity": round(random.uniform(20, 100), 1),
+                    "wind_speed": round(random.uniform(0, 20), 1),
+                    "recorded_at": recorded_at.isoformat(),
+                }) + "\n")
+                recorded_at += timedelta(minutes=step_minutes)
+                rows += 1
+    subprocess.run(
+        [sys.executable, "-m", "app.services.history", "import", str(path)],
+        cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return rows
+
+
+class App:
+    def __init__(self, env: Dict[str, str], workers: int, log_path: Path):
+        self.env = env
+        self.workers = workers
+        self.log_path = log_path
+        self.port = free_port()
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self):
+        self.process = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "app.main:app",
+                "--port", str(self.port), "--workers", str(self.workers), "--no-access-log",
+            ],
+            cwd=ROOT, env=self.env, stdout=subprocess.DEVNULL, stderr=open(self.log_path, "w"),
+        )
+        deadline = time.monotonic() + 60
+        async with httpx.AsyncClient() as client:
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"app exited, see {self.log_path}")
+                try:
+                    if (await client.get(self.url + "/tasks/metrics")).status_code == 200:
+                        return
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError(f"app did not start, see {self.log_path}")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.process = None
+
+
+async def scenario_items(client: httpx.AsyncClient, args) -> Dict[str, Any]:
+    # Каждый поток проходит цикл create -> get -> patch -> list -> delete
+    ops: Dict[str, List[float]] = {name: [] for name in ("create", "get", "patch", "list", "delete")}
+    errors = 0
+    per_worker = max(args.items_requests // (5 * args.concurrency), 1)
+
+    async def timed(name: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            errors += 1
+            return None
+        ops[name].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            errors += 1
+            return None
+        return response
+
+    async def worker(number: int):
+        for i in range(per_worker):
+            created = await timed("create", "POST", "/items/", json={
+                "location": f"bench-{number}-{i}", "temperature": 20.0, "humidity": 50.0, "wind_speed": 3.0,
+            })
+            if created is None:
+                continue
+            item_id = created.json()["id"]
+            await timed("get", "GET", f"/items/{item_id}")
+            await timed("patch", "PATCH", f"/items/{item_id}", json={"temperature": 21.0 + i})
+            await timed("list", "GET", "/items/", params={"limit": 50})
+            await timed("delete", "DELETE", f"/items/{item_id}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(number) for number in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for values in ops.values() for latency in values]
+    return {
+        "concurrency": args.concurrency,
+        "errors": errors,
+        **summary(latencies, elapsed),
+        "ops": {name: summary(values, elapsed) for name, values in ops.items()},
+    }
+
+
+async def wait_hot_store(client: httpx.AsyncClient, timeout: float = 120.0):
+    # Прогрев у каждого воркера свой: ждём готовности на нескольких
+    # ответах подряд, балансировщик раскидывает их по воркерам
+    deadline = time.monotonic() + timeout
+    ready = 0
+    while ready < 10:
+        if time.monotonic() > deadline:
+            raise RuntimeError("hot store did not warm up")
+        response = await client.get("/tasks/hotstore/metrics")
+        response.raise_for_status()
+        ready = ready + 1 if response.json()["is_ready"] else 0
+        if not ready:
+            await asyncio.sleep(0.2)
+
+
+async def scenario_history(client: httpx.AsyncClient, args) -> Dict[str, Any]:
+    # Один и тот же запрос по кругу: без кэша (CACHE_TTL по --cache-ttl)
+    # меряется выборка и сериализация окна
+    columns = args.history_layout == "columns"
+    if columns:
+        await wait_hot_store(client)
+    windows = {}
+    for hours in args.history_hours:
+        latencies: List[float] = []
+        rows = 0
+        sources = set()
+        queue = list(range(args.history_requests))
+
+        async def worker():
+            nonlocal rows
+            while queue:
+                queue.pop()
+                started = time.perf_counter()
+                response = await client.get(
+                    "/weather/history", params={"hours": hours, "layout": args.history_layout}
+                )
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+                body = response.json()
+                if columns:
+                    sources.add(body["source"])
+                    rows = sum(len(data["recorded_at"]) for data in body["locations"].values())
+                else:
+                    rows = len(body)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(min(args.concurrency, args.history_requests))))
+        windows[f"{hours}h"] = {"rows": rows, **summary(latencies, time.perf_counter() - started)}
+        if columns:
+            windows[f"{hours}h"]["source"] = ",".join(sorted(sources))
+    return {"seeded_rows": args.seeded_rows, "layout": args.history_layout, "windows": windows}
+
+
+async def scenario_ws(client: httpx.AsyncClient, app: App, args) -> Dict[str, Any]:
+    # PATCH одной записи с temperature = номер события; задержка — от
+    # отправки PATCH до получения кадра каждым клиентом
+    created = await client.post("/items/", json={"location": "bench-ws"})
+    created.raise_for_status()
+    item_id = created.json()["id"]
+    topics = f"?topic=item:{item_id}" if args.ws_topic else ""
+    ws_url = app.url.replace("http", "ws", 1) + "/ws/items" + topics
+
+    sent_at: Dict[int, float] = {}
+    latencies: List[float] = []
+    received = [0] * args.ws_clients
+    done = asyncio.Event()
+    expected = args.ws_events * args.ws_clients
+
+    async def listen(number: int, socket_):
+        async for raw in socket_:
+            message = json.loads(raw)
+            if message.get("type") != "item_updated" or message["data"].get("id") != item_id:
+                continue
+            now = time.perf_counter()
+            event = int(message["data"]["temperature"])
+            if event in sent_at:
+                latencies.append(now - sent_at[event])
+                received[number] += 1
+                if len(latencies) >= expected:
+                    done.set()
+
+    sockets = []
+    for number in range(args.ws_clients):
+        sockets.append(await websockets.connect(ws_url, max_queue=None))
+    listeners = [asyncio.create_task(listen(number, socket_)) for number, socket_ in enumerate(sockets)]
+    await asyncio.sleep(0.5)
+
+    started = time.perf_counter()
+    for event in range(args.ws_events):
+        sent_at[event] = time.perf_counter()
+        (await client.patch(f"/items/{item_id}", json={"temperature": event})).raise_for_status()
+        await asyncio.sleep(args.ws_interval)
+    try:
+        await asyncio.wait_for(done.wait(), timeout=args.ws_timeout)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.perf_counter() - started
+
+    for listener in listeners:
+        listener.cancel()
+    await asyncio.gather(*(socket_.close() for socket_ in sockets), return_exceptions=True)
+    return {
+        "clients": args.ws_clients,
+        "events": args.ws_events,
+        "delivered": len(latencies),
+        "missing": expected - len(latencies),
+        "min_received": min(received, default=0),
+        **summary(latencies, elapsed),
+    }
+
+
+async def scenario_ingest(client: httpx.AsyncClient, args, meteo: OpenMeteoStub) -> Dict[str, Any]:
+    # Тик фоновой загрузки на M локаций: Open-Meteo пачками, запись через
+    # write-behind. Время — вызов POST /tasks/run целиком
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def register(lat: float, lon: float):
+        async with semaphore:
+            response = await client.post("/locations/", json={"latitude": lat, "longitude": lon})
+            if response.status_code not in (200, 409):
+                response.raise_for_status()
+
+    await asyncio.gather(*(register(lat, lon) for lat, lon in locations(args.ingest_locations)))
+    requests_before = meteo.requests
+    durations = []
+    for _ in range(args.ingest_runs):
+        started = time.perf_counter()
+        (await client.post("/tasks/run", timeout=300)).raise_for_status()
+        durations.append(time.perf_counter() - started)
+    metrics = (await client.get("/tasks/metrics")).json()
+    total = sum(durations)
+    return {
+        "locations": args.ingest_locations,
+        "runs": args.ingest_runs,
+        "open_meteo_requests": meteo.requests - requests_before,
+        "last_tick_failed": metrics.get("last_tick_failed"),
+        "locations_per_second": round(args.ingest_locations * len(durations) / total, 1) if total else 0.0,
+        **summary(durations),
+    }
+
+
+async def run(args) -> Dict[str, Any]:
+    workdir = Path(tempfile.mkdtemp(prefix="weather-bench-"))
+    meteo = OpenMeteoStub(latency=args.meteo_latency)
+    await meteo.start()
+    nats = create_nats(args.nats)
+    await nats.start()
+
+    env = dict(
+        os.environ,
+        DATABASE_URL=args.database_url or f"sqlite+aiosqlite:///{workdir / 'bench.db'}",
+        OPEN_METEO_URL=meteo.url,
+        NATS_URL=nats.url,
+        NATS_SPILL_PATH=str(workdir / "spill.ndjson"),
+        BACKGROUND_TASK_INTERVAL="86400",
+        INGEST_JITTER="0",
+        CACHE_TTL=str(args.cache_ttl),
+        WS_QUEUE_SIZE=str(max(args.ws_events * 2, 256)),
+        RETENTION_ENABLED="false",
+    )
+    args.seeded_rows = 0
+    if "history" in args.scenarios:
+        args.seeded_rows = seed_history(
+            env, workdir, args.history_locations, max(args.history_hours) // 24 + 1, args.history_step
+        )
+
+    app = App(env, args.workers, workdir / "app.log")
+    results: Dict[str, Any] = {}
+    # Каталог с базой и логом приложения остаётся, если прогон упал
+    try:
+        await app.start()
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=app.url, limits=limits, timeout=60) as client:
+            for name in args.scenarios:
+                print(f"running {name}...", file=sys.stderr)
+                if name == "items":
+                    results[name] = await scenario_items(client, args)
+                elif name == "history":
+                    results[name] = await scenario_history(client, args)
+                elif name == "ws":
+                    results[name] = await scenario_ws(client, app, args)
+                elif name == "ingest":
+                    results[name] = await scenario_ingest(client, args, meteo)
+    finally:
+        app.stop()
+        await nats.stop()
+        await meteo.stop()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    params = {key: value for key, value in vars(args).items() if key not in ("command", "out", "seeded_rows")}
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "nats": nats_kind(nats),
+            "params": params,
+        },
+        "scenarios": results,
+    }
+
+
+def flatten(data: Any, prefix: str = "") -> Dict[str, float]:
+    if isinstance(data, dict):
+        flat = {}
+        for key, value in data.items():
+            flat.update(flatten(value, f"{prefix}.{key}" if prefix else key))
+        return flat
+    if isinstance(data, (int, float)) and not isinstance(data, bool):
+        return {prefix: data}
+    return {}
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any]):
+    # Для *_ms меньше — лучше, для throughput и *_per_second — больше
+    print(f"base {base['meta']['commit']} ({base['meta']['timestamp']}) -> new {new['meta']['commit']} ({new['meta']['timestamp']})")
+    old_values, new_values = flatten(base["scenarios"]), flatten(new["scenarios"])
+    for key in sorted(old_values.keys() & new_values.keys()):
+        if not key.endswith(("_ms", "throughput", "_per_second")):
+            continue
+        old, current = old_values[key], new_values[key]
+        change = (current - old) / old * 100 if old else 0.0
+        better = change < 0 if key.endswith("_ms") else change > 0
+        mark = "" if abs(change) < 5 else (" better" if better else " WORSE")
+        print(f"{key:<40} {old:>12.3f} {current:>12.3f} {change:>+8.1f}%{mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Weather service benchmark suite")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run scenarios and write results JSON")
+    run_parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    run_parser.add_argument("--out", help="results path, default bench/results/<time>-<commit>.json")
+    run_parser.add_argument("--workers", type=int, default=1, help="воркеров uvicorn")
+    run_parser.add_argument("--database-url", help="по умолчанию временная SQLite")
+    run_parser.add_argument("--nats", choices=["auto", "server", "stub"], default="auto")
+    run_parser.add_argument("--concurrency", type=int, default=20)
+    run_parser.add_argument("--cache-ttl", type=float, default=0.001, help="CACHE_TTL приложения, 0.001 — без кэша")
+    run_parser.add_argument("--meteo-latency", type=float, default=0.05, help="seconds на ответ заглушки Open-Meteo")
+    run_parser.add_argument("--items-requests", type=int, default=5000)
+    run_parser.add_argument("--history-hours", default="1,6,24,72,168")
+    run_parser.add_argument("--history-locations", type=int, default=20)
+    run_parser.add_argument("--history-step", type=int, default=5, help="minutes между показаниями")
+    run_parser.add_argument("--history-requests", type=int, default=50)
+    run_parser.add_argument("--history-layout", choices=["rows", "columns"], default="rows")
+    run_parser.add_argument("--ws-clients", type=int, default=200)
+    run_parser.add_argument("--ws-events", type=int, default=50)
+    run_parser.add_argument("--ws-interval", type=float, default=0.02, help="seconds между событиями")
+    run_parser.add_argument("--ws-topic", action="store_true", help="клиенты подписаны на item:<id>, а не на всё")
+    run_parser.add_argument("--ws-timeout", type=float, default=30.0)
+    run_parser.add_argument("--ingest-locations", type=int, default=1000)
+    run_parser.add_argument("--ingest-runs", type=int, default=5)
+
+    compare_parser = subparsers.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        with open(args.base) as base, open(args.new) as new:
+            compare(json.load(base), json.load(new))
+        return
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    args.history_hours = [int(hours) for hours in args.history_hours.split(",")]
+
+    result = asyncio.run(run(args))
+    out = Path(args.out) if args.out else RESULTS / (
+        datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S") + f"-{result['meta']['commit']}.json"
+    )
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2) + "\n")
+    print(json.dumps(result["scenarios"], indent=2))
+    print(f"results written to {out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
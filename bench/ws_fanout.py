@@ -0,0 +1,174 @@
+"""Нагрузочный тест рассылки WebSocket: 10k клиентов, один медленный.
+
+Запуск: python -m bench.ws_fanout [--clients 10000] [--events 50] [--slow-delay 0.5]
+Клиенты — объекты в памяти с интерфейсом WebSocket, сеть не нужна.
+Для каждой политики WS_SLOW_POLICY печатает, сколько занимает broadcast
+для вызывающего кода, задержку доставки быстрым клиентам и что стало
+с медленным. Для сравнения — старая рассылка (await send на каждый сокет
+по очереди) на том же наборе клиентов. Последний прогон — подписки на
+темы: каждый клиент подписан на одну из --locations локаций.
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from app.ws.websocket import COALESCE, DISCONNECT, DROP_OLDEST, ConnectionManager
+
+# Время broadcast по тексту кадра: строка одна на всех клиентов
+sent_at = {}
+
+
+class FakeWebSocket:
+    def __init__(self, delay: float = 0.0):
+        self.scope = {"subprotocols": []}
+        self.delay = delay
+        self.received = 0
+        self.latencies = []
+        self.close_code = None
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, text: str):
+        # Быстрый клиент: запись в буфер сокета без ожидания
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        started = sent_at.get(text)
+        if started is None:
+            # hello при подключении
+            return
+        self.received += 1
+        self.latencies.append(time.perf_counter() - started)
+
+    async def send_bytes(self, data: bytes):
+        await self.send_text(data.decode())
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] * 1000 if values else 0.0
+
+
+async def broadcast_sequential(clients, message):
+    # Старая ConnectionManager.broadcast: ждёт каждый сокет по очереди
+    text = str(message)
+    sent_at[text] = time.perf_counter()
+    for websocket in clients:
+        await websocket.send_text(text)
+
+
+async def run_sequential(clients: int, events: int, slow_delay: float):
+    sockets = [FakeWebSocket() for _ in range(clients - 1)] + [FakeWebSocket(slow_delay)]
+    durations = []
+    for i in range(events):
+        started = time.perf_counter()
+        await broadcast_sequential(sockets, {"type": "item_updated", "data": {"id": i % 10}, "seq": i})
+        durations.append(time.perf_counter() - started)
+    fast = [latency for websocket in sockets[:-1] for latency in websocket.latencies]
+    print(
+        f"{'sequential':<12} broadcast p50={percentile(durations, 0.5):8.2f}ms "
+        f"max={percentile(durations, 1.0):8.2f}ms | fast delivery p50={percentile(fast, 0.5):8.2f}ms "
+        f"p99={percentile(fast, 0.99):8.2f}ms | slow received={sockets[-1].received}"
+    )
+
+
+async def run_policy(policy: str, clients: int, events: int, slow_delay: float, queue_size: int, interval: float):
+    manager = ConnectionManager()
+    manager.slow_policy = policy
+    manager.queue_size = queue_size
+
+    sockets = [FakeWebSocket() for _ in range(clients - 1)] + [FakeWebSocket(slow_delay)]
+    for websocket in sockets:
+        await manager.connect(websocket)
+
+    durations = []
+    for i in range(events):
+        started = time.perf_counter()
+        # 10 записей по кругу: coalesce оставляет последнее событие по каждой
+        await manager.broadcast_item_update("updated", {"id": i % 10, "seq": i})
+        durations.append(time.perf_counter() - started)
+        # Текст кадра кодируется первой задачей отправки, время — сразу
+        frame_text = None
+        for client in manager.clients.values():
+            if client.queue:
+                frame_text = client.queue[-1][1].text(client.codec)
+                break
+        if frame_text is not None:
+            sent_at[frame_text] = started
+        await asyncio.sleep(interval)
+
+    # Ждём, пока быстрые клиенты разберут очереди
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if all(not client.queue for websocket, client in manager.clients.items() if websocket is not sockets[-1]):
+            break
+        await asyncio.sleep(0.01)
+
+    fast = [latency for websocket in sockets[:-1] for latency in websocket.latencies]
+    fast_received = min(websocket.received for websocket in sockets[:-1])
+    metrics = manager.get_metrics()
+    slow = sockets[-1]
+    await manager.stop()
+    print(
+        f"{policy:<12} broadcast p50={percentile(durations, 0.5):8.2f}ms "
+        f"max={percentile(durations, 1.0):8.2f}ms | fast delivery p50={percentile(fast, 0.5):8.2f}ms "
+        f"p99={percentile(fast, 0.99):8.2f}ms, min received={fast_received}/{events} | "
+        f"slow received={slow.received} closed={slow.close_code} "
+        f"dropped={metrics['frames_dropped_total']} coalesced={metrics['frames_coalesced_total']} "
+        f"evicted={metrics['evicted_total']}"
+    )
+
+
+async def run_topics(clients: int, events: int, locations: int):
+    # Стоимость события пропорциональна подписчикам его темы, а не числу соединений
+    manager = ConnectionManager()
+    sockets = [FakeWebSocket() for _ in range(clients)]
+    for i, websocket in enumerate(sockets):
+        client = await manager.connect(websocket)
+        manager.subscribe(client, [f"location:L{i % locations}"])
+
+    durations, recipients = [], 0
+    for i in range(events):
+        started = time.perf_counter()
+        await manager.broadcast_item_update("updated", {"id": i, "location": f"L{i % locations}", "seq": i})
+        durations.append(time.perf_counter() - started)
+        recipients += manager.last_broadcast_recipients
+        for client in manager.clients.values():
+            if client.queue:
+                sent_at[client.queue[-1][1].text(client.codec)] = started
+                break
+        await asyncio.sleep(0)
+
+    await asyncio.sleep(0.1)
+    received = sum(websocket.received for websocket in sockets)
+    await manager.stop()
+    print(
+        f"{'topics':<12} broadcast p50={percentile(durations, 0.5):8.3f}ms "
+        f"max={percentile(durations, 1.0):8.3f}ms | {recipients / events:.0f} recipients per event "
+        f"of {clients}, {received} frames sent for {events} events"
+    )
+
+
+async def main(args):
+    logging.getLogger("app.ws.websocket").setLevel(logging.ERROR)
+    print(f"{args.clients} clients, {args.events} events, one client sleeps {args.slow_delay}s per frame")
+    for policy in (DROP_OLDEST, COALESCE, DISCONNECT):
+        await run_policy(policy, args.clients, args.events, args.slow_delay, args.queue_size, args.interval)
+    # Старый путь медленный по построению: событий меньше
+    await run_sequential(args.clients, min(args.events, 5), args.slow_delay)
+    await run_topics(args.clients, args.events, args.locations)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--events", type=int, default=50)
+    parser.add_argument("--slow-delay", type=float, default=0.5)
+    parser.add_argument("--queue-size", type=int, default=16)
+    parser.add_argument("--locations", type=int, default=1000)
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds между событиями")
+    asyncio.run(main(parser.parse_args()))
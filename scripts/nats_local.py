@@ -0,0 +1,132 @@
+# Проверка очереди публикации NATS на локально запущенном nats-server:
+# JetStream с подтверждениями, переполнение очереди со сбросом на диск
+# и перезапуск сервера посреди отправки.
+#
+#   python scripts/nats_local.py
+#
+# nats-server ищется в $NATS_SERVER_BIN и в PATH
+# (pip install nats-server-bin ставит бинарник без сети к GitHub)
+import asyncio
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def find_server() -> str:
+    server = os.environ.get("NATS_SERVER_BIN") or shutil.which("nats-server")
+    if not server:
+        sys.exit("nats-server not found: set NATS_SERVER_BIN or pip install nats-server-bin")
+    return server
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalServer:
+    def __init__(self, workdir: Path):
+        self.binary = find_server()
+        self.port = free_port()
+        self.store = workdir / "jetstream"
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [self.binary, "-js", "-sd", str(self.store), "-a", "127.0.0.1", "-p", str(self.port)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=0.2).close()
+                return
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError("nats-server did not start")
+
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+
+async def wait_until(condition, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if await condition():
+            return
+        await asyncio.sleep(0.1)
+    raise AssertionError("condition not met in time")
+
+
+async def check(server: LocalServer, workdir: Path):
+    os.environ.update(
+        NATS_URL=f"nats://127.0.0.1:{server.port}",
+        NATS_JETSTREAM="true",
+        NATS_QUEUE_SIZE="50",
+        NATS_OVERFLOW="spill",
+        NATS_SPILL_PATH=str(workdir / "spill.ndjson"),
+        NATS_RECONNECT_INTERVAL="0.5",
+    )
+    sys.path.insert(0, str(ROOT))
+    from app.config import settings
+    from app.nats.client import nats_client
+
+    publisher = nats_client.publisher
+
+    async def stored(count: int):
+        if not nats_client.connected:
+            return False
+        try:
+            info = await nats_client.js.stream_info(settings.NATS_STREAM)
+        except Exception:
+            # JetStream ещё поднимается после рестарта
+            return False
+        return info.state.messages == count
+
+    await nats_client.connect()
+    assert nats_client.connected
+
+    # Очередь на 50 сообщений: остальное уходит на диск и дочитывается
+    for i in range(500):
+        await nats_client.publish(settings.NATS_TOPIC_ITEMS, {"i": i})
+    await wait_until(lambda: stored(500))
+    assert publisher.spilled_total > 0 and publisher.replayed_total == publisher.spilled_total
+    print(f"500 messages stored, {publisher.spilled_total} went through the spill file")
+
+    # Сервер падает посреди потока: сообщения ждут в очереди и на диске
+    server.stop()
+    for i in range(500, 600):
+        await nats_client.publish(settings.NATS_TOPIC_WEATHER, {"i": i})
+    server.start()
+    await wait_until(lambda: stored(600))
+    await wait_until(lambda: asyncio.sleep(0, publisher.depth == 0))
+    print(f"600 messages stored after restart, metrics: {publisher.get_metrics()}")
+
+    await nats_client.disconnect()
+    print("NATS check passed")
+
+
+def main():
+    workdir = Path(tempfile.mkdtemp(prefix="weather-nats-"))
+    server = LocalServer(workdir)
+    server.start()
+    try:
+        asyncio.run(check(server, workdir))
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# Одноразовый локальный PostgreSQL для проверки PG-бэкенда без docker и сети.
+#
+#   python scripts/pg_local.py                          — поднять кластер, прогнать проверку, удалить
+#   python scripts/pg_local.py -- uvicorn app.main:app  — запустить команду с DATABASE_URL на кластер
+#
+# Бинарники ищутся в $PG_BIN, через pg_config --bindir, в пакете pgserver
+# (pip install pgserver — встроенная сборка PostgreSQL) и в PATH.
+# initdb не запускается от root
+import argparse
+import asyncio
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def find_bindir() -> Path:
+    if os.environ.get("PG_BIN"):
+        return Path(os.environ["PG_BIN"])
+    pg_config = shutil.which("pg_config")
+    if pg_config:
+        return Path(subprocess.check_output([pg_config, "--bindir"], text=True).strip())
+    try:
+        import pgserver
+        return Path(pgserver.__file__).parent / "pginstall" / "bin"
+    except ImportError:
+        pass
+    initdb = shutil.which("initdb")
+    if initdb:
+        return Path(initdb).parent
+    sys.exit("PostgreSQL binaries not found: set PG_BIN or pip install pgserver")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_cluster(command) -> int:
+    bindir = find_bindir()
+    workdir = Path(tempfile.mkdtemp(prefix="weather-pg-"))
+    data = workdir / "data"
+    port = free_port()
+    try:
+        subprocess.run(
+            [bindir / "initdb", "-D", data, "-U", "weather", "-A", "trust", "-E", "UTF8", "--no-sync"],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        subprocess.run(
+            [
+                bindir / "pg_ctl", "-D", data, "-l", workdir / "postgres.log", "-w",
+                "-o", f"-p {port} -k {workdir} -c listen_addresses=127.0.0.1 -c fsync=off",
+                "start",
+            ],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        try:
+            subprocess.run(
+                [bindir / "createdb", "-h", "127.0.0.1", "-p", str(port), "-U", "weather", "weather"],
+                check=True,
+            )
+            env = dict(os.environ, DATABASE_URL=f"postgresql+asyncpg://weather@127.0.0.1:{port}/weather")
+            return subprocess.run(command, env=env, cwd=ROOT).returncode
+        finally:
+            subprocess.run([bindir / "pg_ctl", "-D", data, "-m", "fast", "stop"], stdout=subprocess.DEVNULL)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def check():
+    # Прогон основных путей записи и чтения на PostgreSQL
+    sys.path.insert(0, str(ROOT))
+    from sqlalchemy import func, select
+
+    from app.db.db import async_session_maker, close_db, init_db, read_session_maker
+    from app.models.models import WeatherHistory, WeatherItem, WeatherRollupHourly
+    from app.services.history import aggregate_history, insert_history
+    from app.services.rollups import apply_readings
+    from app.tasks.retention import retention_task
+    from app.tasks.writer import weather_writer
+
+    await init_db()
+    try:
+        reading = {"location": "55.7558,37.6173", "temperature": 1.0, "humidity": 50.0, "wind_speed": 3.0}
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        assert await weather_writer.submit([
+            {**reading, "recorded_at": now},
+            {**reading, "temperature": 2.0, "recorded_at": now},
+        ])
+
+        # 10 дней истории по 5 минут — COPY и секции на каждый день
+        rows = [
+            {**reading, "location": "0.0,0.0", "recorded_at": now - timedelta(minutes=5 * i)}
+            for i in range(10 * 288)
+        ]
+        async with async_session_maker() as session:
+            await insert_history(session, rows)
+            await apply_readings(session, rows)
+            await session.commit()
+
+        async with async_session_maker() as session:
+            items = (await session.execute(select(WeatherItem))).scalars().all()
+            assert len(items) == 1 and items[0].temperature == 2.0, items
+            total = (await session.execute(select(func.count()).select_from(WeatherHistory))).scalar()
+            assert total == len(rows) + 2, total
+            hourly = (await session.execute(select(func.sum(WeatherRollupHourly.count)))).scalar()
+            assert hourly == 3 * total, hourly
+
+        await retention_task.run_once()
+        assert retention_task.last_rows_deleted["weather_history"] > 0
+
+        async with read_session_maker() as session:
+            oldest = (await session.execute(select(func.min(WeatherHistory.recorded_at)))).scalar()
+            assert oldest >= now - timedelta(days=8), oldest
+            data = await aggregate_history(
+                session, now - timedelta(days=1), "1h", ["avg", "p95"], ["temperature"]
+            )
+            assert data["timestamps"], data
+    finally:
+        await close_db()
+    print("PostgreSQL check passed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Disposable local PostgreSQL for the weather API")
+    parser.add_argument("--check", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("command", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    if args.check:
+        asyncio.run(check())
+        return
+    if os.geteuid() == 0:
+        sys.exit("initdb refuses to run as root: run this script as a regular user")
+
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    command = command or [sys.executable, __file__, "--check"]
+    sys.exit(run_cluster(command))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# Проверка RedisCache на заглушке RESP-сервера из bench/stubs.py (или на
+# настоящем Redis через --url): get/set, TTL, удаление ключей, версия
+# пространства имён и переподключение после обрыва.
+#
+#   python scripts/redis_local.py [--url redis://localhost:6379/0]
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+async def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if await condition():
+            return
+        await asyncio.sleep(0.05)
+    raise AssertionError("condition not met in time")
+
+
+async def check(url: str, stub):
+    # NATS не нужен: инвалидация уходит в очередь публикации и там остаётся
+    os.environ.update(CACHE_BACKEND="redis", CACHE_REDIS_URL=url, NATS_URL="nats://127.0.0.1:1")
+    sys.path.insert(0, str(ROOT))
+    from app.cache.cache import Cache, create_backend
+    from app.cache.redis import RedisCache
+
+    backend = create_backend()
+    assert isinstance(backend, RedisCache) and backend.shared
+    cache = Cache(backend)
+    prefix = f"check:{os.getpid()}"
+
+    # get/set: значения — JSON
+    value = {"location": "55.75,37.61", "temperature": 12.5, "tags": ["a", None]}
+    await backend.set(f"{prefix}:value", value, 60)
+    assert await backend.get(f"{prefix}:value") == value
+    assert await backend.get(f"{prefix}:missing") is None
+    print("get/set ok")
+
+    # TTL в миллисекундах (PX)
+    await backend.set(f"{prefix}:short", 1, 0.2)
+    assert await backend.get(f"{prefix}:short") == 1
+    await wait_until(lambda: _is_none(backend.get(f"{prefix}:short")))
+    print("ttl ok")
+
+    await backend.delete(f"{prefix}:value", f"{prefix}:missing")
+    assert await backend.get(f"{prefix}:value") is None
+    print("delete ok")
+
+    # Инвалидация пространства имён — инкремент версии: старые ключи
+    # get_or_load больше не читаются
+    namespace = f"{prefix}:ns"
+    loads = 0
+
+    async def loader():
+        nonlocal loads
+        loads += 1
+        return {"load": loads}
+
+    first = await cache.get_or_load(namespace, {"page": 1}, loader)
+    assert await cache.get_or_load(namespace, {"page": 1}, loader) == first and loads == 1
+    before = await backend.get_counter(f"{namespace}:version")
+    await cache.invalidate(namespaces=[namespace])
+    assert await backend.get_counter(f"{namespace}:version") == before + 1
+    assert await cache.get_or_load(namespace, {"page": 1}, loader) == {"load": 2}
+    print("namespace version bump ok")
+
+    # Обрыв соединений: пул выбрасывает сломанное соединение и открывает новое
+    if stub is not None:
+        for writer in list(stub.connections):
+            writer.close()
+        await asyncio.sleep(0.05)
+        try:
+            await backend.get(f"{prefix}:value")
+        except ConnectionError:
+            pass
+        await backend.set(f"{prefix}:value", value, 60)
+        assert await backend.get(f"{prefix}:value") == value
+        print("reconnect ok")
+
+    await backend.close()
+    print("Redis cache check passed")
+
+
+async def _is_none(awaitable) -> bool:
+    return await awaitable is None
+
+
+async def main(url: str):
+    stub = None
+    if url is None:
+        sys.path.insert(0, str(ROOT))
+        from bench.stubs import RedisStub
+
+        stub = RedisStub(password="secret")
+        await stub.start()
+        url = stub.url
+    try:
+        await check(url, stub)
+    finally:
+        if stub is not None:
+            await stub.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RedisCache check")
+    parser.add_argument("--url", help="настоящий Redis, по умолчанию заглушка в процессе")
+    asyncio.run(main(parser.parse_args().url))